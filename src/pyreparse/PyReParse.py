@@ -4,10 +4,36 @@ import sys
 import re
 import ast
 import io
-from decimal import Decimal
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
-from typing import Iterator, List, Optional, Tuple, Dict, Any, Union
+from decimal import Decimal, InvalidOperation
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple, Dict, Any, Union
+
+from multiprocessing import resource_tracker
+
+from .aio import DEFAULT_MAX_PENDING, AsyncDispatcher, aiter_lines
+from .cache import SectionCache, seed_fingerprint, spec_fingerprint
+from .checkpoint import Checkpointer, find_sink
+from .columnar import ColumnarSections, ColumnarWriter, SharedSections
+from .follow import DEFAULT_POLL_INTERVAL, follow_lines
+from .guard import SLOW_LINE_LOG_SIZE, LineGuard
+from .ignore import ignore_test
+from .inputs import iter_lines_at, open_lines, open_text, source_name
+from .metrics import DEFAULT_HTTP_HOST, DEFAULT_INTERVAL, ParseMetrics, input_size
+from .re_risk import DEFAULT_TIME_LIMIT, RISK_WARN_TIME, analyze_patterns
+from .records import Section, make_record
+from .trace import (CODE_END_SECTION, CODE_EVAL_MATCH, CODE_EVAL_MISS, CODE_EVAL_OFF, CODE_EVAL_WINDOW,
+                    CODE_IGNORE, CODE_REJECT, CODE_REPORT, CODE_SECTION, CODE_SUBSECTION, CODE_TRUNCATE,
+                    DEFAULT_RING_EVENTS, LINE_SHIFT, PATTERN_SHIFT, TRACE_BLOCK, Tracer)
+from .schedule import WINDOW_COUNTERS, pattern_window, window_checks
+from .spill import SpillingSections
+
+# Trigger tokens: <SYMBOL> counters and {pattern_name} references. Symbols are identifiers, so comparisons such as
+# '<REPORT_LINE> <= 3' or '<A> < 3 or <B>' tokenize correctly.
+_TRIGGER_TOKEN_RE = re.compile(r'<([A-Za-z_]\w*)>|\{([^{}]+)\}')
+_NON_WORD_RE = re.compile(r'[^\w\_]')
 
 class TriggerDefException(Exception):
     pass
@@ -21,11 +47,13 @@ class PyReParse:
     FLAG_ONCE_PER_REPORT = 8
     FLAG_END_OF_SECTION = 16    # Counters are set to 0
     FLAG_NEW_SUBSECTION = 32    # Start a subsection (nested under current section/parent)
+    FLAG_NEW_REPORT = 64        # First line of a report: report_reset() is called before the line is matched
+    FLAG_IGNORE = 128           # Lines matching are skipped before anything else (see ignore.py)
 
     special_escape_followers = set('aAbBdDFfNnPpRrSsTtVvWwXxZz0123456789')
 
     KNOWN_FLAGS_MASK = (FLAG_RETURN_ON_MATCH | FLAG_NEW_SECTION | FLAG_ONCE_PER_SECTION | FLAG_ONCE_PER_REPORT |
-                        FLAG_END_OF_SECTION | FLAG_NEW_SUBSECTION)
+                        FLAG_END_OF_SECTION | FLAG_NEW_SUBSECTION | FLAG_NEW_REPORT | FLAG_IGNORE)
 
     INDEX_RE_STRING = 're_string'
     INDEX_RE_FLAGS = 'flags'
@@ -39,6 +67,34 @@ class PyReParse:
     INDEX_RE_TRIGGER_OFF_TEXT = 'trigger_off_text'   # Entry - Trigger_OFF Text Created by PyReParse
 
     INDEX_RE_CALLBACK = 'callback'  # Entry containing a patterns assigned callback.
+    INDEX_RE_SUM_CHECK = 'sum_check'  # Entry - {captured_fld: (src_pattern, src_fld)} sum validations.
+    INDEX_RE_INTERN = 'intern'  # Entry - Captured fields (or True for all) whose repeated values are shared.
+    INDEX_RE_INTERN_LIMIT = 'intern_limit'  # Entry - Max distinct values interned per field.
+    INDEX_RE_IGNORE_COUNTERS = 'ignore_counters'  # Entry - Counters a FLAG_IGNORE line still increments.
+    INDEX_RE_BATCH_CALLBACK = 'batch_callback'  # Entry - Callback receiving batches of matches' fields.
+    INDEX_RE_BATCH_SIZE = 'batch_size'  # Entry - Max matches per batch (batches also end at section boundaries).
+    INDEX_RE_BATCH_COLUMNAR = 'batch_columnar'  # Entry - True for {field: [values]} batches instead of a list.
+
+    DEFAULT_INTERN_LIMIT = 1024
+    DEFAULT_BATCH_SIZE = 512
+
+    # Counters incremented by lines of FLAG_IGNORE patterns (INDEX_RE_IGNORE_COUNTERS)...
+    IGNORE_COUNT_ALL = 'all'        # Default: <REPORT_LINE>, <SECTION_LINE> and <SUBSECTION_LINE>, as if matched.
+    IGNORE_COUNT_REPORT = 'report'  # Only <REPORT_LINE>.
+    IGNORE_COUNT_NONE = 'none'      # None: the line is invisible to triggers.
+
+    # Result formats of parse_file*() and parse_file_stream()...
+    RESULT_DICTS = 'dicts'      # {'section_start', 'fields_list': [{'match_def', 'fields'}], 'totals', 'valid'}
+    RESULT_RECORDS = 'records'  # records.Section objects holding per-pattern __slots__ records.
+
+    # Chunking of parse_file() and parse_file_parallel()...
+    SPLIT_SECTIONS = 'sections'  # One chunk per top-level section (FLAG_NEW_SECTION).
+    SPLIT_REPORTS = 'reports'    # One chunk per report (FLAG_NEW_REPORT), parsed with report-level counters.
+
+    # Workers of parse_file_parallel()...
+    BACKEND_THREADS = 'threads'      # clone()s on a ThreadPoolExecutor.
+    BACKEND_PROCESSES = 'processes'  # A ProcessPoolExecutor, results returned through shared memory columns.
+    PROCESS_BATCH_LINES = 20000      # Lines of chunks sent to a worker process per task.
 
     INDEX_STATES = 'states'  # Dict of a patterns states.
     INDEX_ST_REPORT_LINES_MATCHED = 'report_lines_matched'
@@ -64,12 +120,23 @@ class PyReParse:
     TRIG_SYM_SUBSECTION_DEPTH = '<SUBSECTION_DEPTH>'
     TRIG_SYM_SUBSECTION_LINE = '<SUBSECTION_LINE>'
 
+    # Trigger symbols, and what they compile to.
+    TRIG_SYM_ATTRS = {
+        TRIG_SYM_REPORT_LINE: 'prp_inst.report_line_count',
+        TRIG_SYM_SECTION_COUNT: 'prp_inst.section_count',
+        TRIG_SYM_SECTION_LINE: 'prp_inst.section_line_count',
+        TRIG_SYM_SUBSECTION_DEPTH: 'prp_inst.subsection_depth',
+        TRIG_SYM_SUBSECTION_LINE: 'prp_inst.subsection_line_count',
+    }
+
     def __init__(self, regexp_pats=None):
         self.re_defs = {}
         self.all_named_fields = {}
         self.last_captured_fields = {}
         self.re_named_group = re.compile(r'.*\(\?P\<([^\>]+)\>.*', re.X | re.MULTILINE | re.DOTALL)
         self.report_line_count = 0
+        self.report_count = 0
+        self.input_line_count = 0  # Lines matched since the start of the input (not reset by reports).
         self.section_count = 0
         self.section_line_count = 0
         self.file_name = ''
@@ -78,17 +145,46 @@ class PyReParse:
         self.subsection_line_count = 0
         self.max_subsection_depth = 0
         self.subsection_depth_counts = defaultdict(int)
+        self.sum_fields = {}
+        self.sum_checks = {}
+        self.intern_tables = {}
+        self.intern_limits = {}
+        self.trigger_windows = {}
+        self.use_counter_windows = True
+        self.report_boundaries = []
+        self.ignore_checks = []
+        self.ignored_line_count = 0
+        self.match_counts = {}  # Lines matched per pattern since the instance was created (not reset by reports).
+        self.quick_check_miss_counts = {}  # Lines a pattern's quick check caught but its regexp missed, per pattern.
+        self.sum_check_fail_counts = {}  # Failed sum checks (and amounts that did not convert), per pattern.
+        self.batch_callbacks = {}
+        self.pending_batches = {}
+        self.callback_lock = None
+        self.line_guard = None
+        self.tracer = None
+        self.metrics = None
+        self.section_totals = {}
+        self.section_valid = True
         if regexp_pats is not None:
             self.load_re_lines(regexp_pats)
 
-    def validate_re_defs(self, patterns) -> None:
+    def validate_re_defs(self, patterns, check_risk: bool = False, risk_time_limit: Optional[float] = None):
         """
         Validate the patterns data structure before loading.
 
         Raises ValueError or TriggerDefException for invalid configurations.
+
+        :param check_risk: Also check the regexps for catastrophic backtracking (see re_risk.py): static checks of
+                           each regexp, then fuzzing with adversarial lines. Findings and slow matches are printed as
+                           warnings, and the {pattern_name: RiskReport} dict is returned.
+        :param risk_time_limit: With check_risk, raise ValueError if a fuzzed match() took longer (seconds).
         """
         prp = PyReParse
         known_mask = prp.KNOWN_FLAGS_MASK
+        # Dependency graph of the trigger_on {pattern_name} references, for cycle detection.
+        graph = {}
+        # Section totals are keyed by field name: {field: ('summed from' | 'checked by', pattern_name)}.
+        total_owners = {}
 
         # Validate basic structure
         for pat_name, pat_def in patterns.items():
@@ -113,34 +209,9 @@ class PyReParse:
                     if not isinstance(trigger_text, str):
                         raise ValueError(f"Pattern '{pat_name}' '{trigger_key}' must be a string.")
 
-                    # Simulate replacement for AST parsing
-                    func_body = trigger_text
-                    while True:
-                        m = re.match(r'.*((\<([^\>]+)\>)|(\{([^\}]+)\})).*', func_body, re.MULTILINE | re.DOTALL)
-                        if m is None:
-                            break
-                        elif m.group(2) is not None:
-                            # Variable
-                            var_name = m.group(2)
-                            if var_name == prp.TRIG_SYM_REPORT_LINE:
-                                func_body = func_body.replace(var_name, 'prp_inst.report_line_count')
-                            elif var_name == prp.TRIG_SYM_SECTION_COUNT:
-                                func_body = func_body.replace(var_name, 'prp_inst.section_count')
-                            elif var_name == prp.TRIG_SYM_SECTION_LINE:
-                                func_body = func_body.replace(var_name, 'prp_inst.section_line_count')
-                            elif var_name == prp.TRIG_SYM_SUBSECTION_DEPTH:
-                                func_body = func_body.replace(var_name, 'prp_inst.subsection_depth')
-                            elif var_name == prp.TRIG_SYM_SUBSECTION_LINE:
-                                func_body = func_body.replace(var_name, 'prp_inst.subsection_line_count')
-                            else:
-                                raise TriggerDefException(f"Unknown variable in '{pat_name}' '{trigger_key}': {m.group(0)}")
-                        elif m.group(5) is not None:
-                            # Pattern name
-                            pn = m.group(5)
-                            if pn not in patterns:
-                                raise TriggerDefException(f"Unknown pattern reference in '{pat_name}' '{trigger_key}': {pn}")
-                            func_body = func_body.replace(m.group(4),
-                                                          f"(prp_inst.re_defs['{pn}'][prp.INDEX_STATES][prp.INDEX_ST_SECTION_LINES_MATCHED] > 0)")
+                    func_body, refs = prp._compile_trigger_expr(trigger_text, patterns, pat_name, trigger_key)
+                    if trigger_key == prp.INDEX_RE_TRIGGER_ON:
+                        graph[pat_name] = [ref for ref in refs if ref != pat_name]
 
                     # AST parse the body
                     func_text = f"def dummy(prp_inst, pat_name): return {func_body}"
@@ -149,6 +220,37 @@ class PyReParse:
                     except SyntaxError as e:
                         raise TriggerDefException(f"Syntax error in '{pat_name}' '{trigger_key}': {e}")
 
+            # Validate sum checks
+            if prp.INDEX_RE_SUM_CHECK in pat_def:
+                sum_check = pat_def[prp.INDEX_RE_SUM_CHECK]
+                if not isinstance(sum_check, dict):
+                    raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_SUM_CHECK}' must be a dict.")
+                for chk_fld, src in sum_check.items():
+                    if not isinstance(src, (tuple, list)) or len(src) != 2:
+                        raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_SUM_CHECK}' entry '{chk_fld}' "
+                                         f"must be a (pattern_name, field_name) pair.")
+                    if src[0] not in patterns:
+                        raise ValueError(f"Unknown pattern reference in '{pat_name}' "
+                                         f"'{prp.INDEX_RE_SUM_CHECK}': {src[0]}")
+                    for total_fld, owner in ((src[1], ('summed from', src[0])), (chk_fld, ('checked by', pat_name))):
+                        other = total_owners.setdefault(total_fld, owner)
+                        if other != owner:
+                            raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_SUM_CHECK}': section total "
+                                             f"'{total_fld}' is both {owner[0]} '{owner[1]}' and {other[0]} "
+                                             f"'{other[1]}'. Rename one of the fields.")
+
+            # Validate interned fields
+            if prp.INDEX_RE_INTERN in pat_def:
+                intern = pat_def[prp.INDEX_RE_INTERN]
+                if intern is not True and (not isinstance(intern, (tuple, list)) or
+                                           not all(isinstance(fn, str) for fn in intern)):
+                    raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_INTERN}' must be True or a list of "
+                                     f"field names.")
+            if prp.INDEX_RE_INTERN_LIMIT in pat_def:
+                limit = pat_def[prp.INDEX_RE_INTERN_LIMIT]
+                if not isinstance(limit, int) or limit < 1:
+                    raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_INTERN_LIMIT}' must be a positive integer.")
+
             # Validate NEW_SUBSECTION has parent trigger
             if prp.INDEX_RE_FLAGS in pat_def:
                 flags = pat_def[prp.INDEX_RE_FLAGS]
@@ -156,51 +258,77 @@ class PyReParse:
                     trigger_on = pat_def.get(prp.INDEX_RE_TRIGGER_ON, '')
                     if '{' not in trigger_on:
                         print(f"Warning: [{pat_name}] has FLAG_NEW_SUBSECTION but TRIGGER_ON \"{trigger_on}\" lacks {{parent_pattern}} reference.")
+                if flags & prp.FLAG_NEW_REPORT and (prp.INDEX_RE_TRIGGER_ON in pat_def or
+                                                    prp.INDEX_RE_TRIGGER_OFF in pat_def):
+                    print(f"Warning: [{pat_name}] has FLAG_NEW_REPORT, its triggers are ignored.")
+                if flags & prp.FLAG_IGNORE:
+                    if flags != prp.FLAG_IGNORE:
+                        raise ValueError(f"Pattern '{pat_name}' FLAG_IGNORE can not be combined with other flags.")
+                    unused = [key for key in (prp.INDEX_RE_TRIGGER_ON, prp.INDEX_RE_TRIGGER_OFF, prp.INDEX_RE_CALLBACK,
+                                              prp.INDEX_RE_BATCH_CALLBACK, prp.INDEX_RE_SUM_CHECK,
+                                              prp.INDEX_RE_QUICK_CHECK) if key in pat_def]
+                    if unused:
+                        print(f"Warning: [{pat_name}] has FLAG_IGNORE, its {', '.join(unused)} entries are ignored.")
+            if prp.INDEX_RE_IGNORE_COUNTERS in pat_def and pat_def[prp.INDEX_RE_IGNORE_COUNTERS] not in (
+                    prp.IGNORE_COUNT_ALL, prp.IGNORE_COUNT_REPORT, prp.IGNORE_COUNT_NONE):
+                raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_IGNORE_COUNTERS}' must be "
+                                 f"PyReParse.IGNORE_COUNT_ALL, IGNORE_COUNT_REPORT or IGNORE_COUNT_NONE.")
+
+            # Validate batched callbacks
+            if prp.INDEX_RE_BATCH_CALLBACK in pat_def:
+                if not callable(pat_def[prp.INDEX_RE_BATCH_CALLBACK]):
+                    raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_BATCH_CALLBACK}' must be callable.")
+                batch_size = pat_def.get(prp.INDEX_RE_BATCH_SIZE, prp.DEFAULT_BATCH_SIZE)
+                if not isinstance(batch_size, int) or batch_size < 1:
+                    raise ValueError(f"Pattern '{pat_name}' '{prp.INDEX_RE_BATCH_SIZE}' must be a positive integer.")
+            else:
+                unused = [key for key in (prp.INDEX_RE_BATCH_SIZE, prp.INDEX_RE_BATCH_COLUMNAR) if key in pat_def]
+                if unused:
+                    print(f"Warning: [{pat_name}] has no {prp.INDEX_RE_BATCH_CALLBACK}, its {', '.join(unused)} "
+                          f"entries are ignored.")
 
-        # Build dependency graph for cycle detection
-        graph = {pat_name: [] for pat_name in patterns}
-        for pat_name, pat_def in patterns.items():
-            trigger_key = prp.INDEX_RE_TRIGGER_ON
-            if trigger_key in pat_def:
-                trigger_text = pat_def[trigger_key]
-                refs = re.findall(r'\{([^\}]+)\}', trigger_text)
-                for ref in refs:
-                    if ref in patterns and ref != pat_name:
-                        graph[pat_name].append(ref)
-
-        # DFS for cycle detection
+        # Iterative DFS for cycle detection, linear in patterns + references.
         visited = set()
-        rec_stack = set()
-
-        def has_cycle(node):
-            visited.add(node)
-            rec_stack.add(node)
-            for neighbor in graph[node]:
-                if neighbor not in visited:
-                    if has_cycle(neighbor):
-                        return True
-                elif neighbor in rec_stack:
-                    return True
-            rec_stack.remove(node)
-            return False
-
-        for node in graph:
-            if node not in visited:
-                if has_cycle(node):
-                    raise ValueError(f"Cycle detected in trigger dependencies involving '{node}'")
+        for root in graph:
+            if root in visited:
+                continue
+            visited.add(root)
+            path = {root}
+            stack = [(root, iter(graph[root]))]
+            while stack:
+                node, neighbors = stack[-1]
+                for neighbor in neighbors:
+                    if neighbor in path:
+                        raise ValueError(f"Cycle detected in trigger dependencies involving '{root}'")
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        path.add(neighbor)
+                        stack.append((neighbor, iter(graph.get(neighbor, ()))))
+                        break
+                else:
+                    stack.pop()
+                    path.discard(node)
 
-    def set_file_name(self, file_name):
-        self.file_name = file_name
+        if check_risk:
+            return self.__check_re_risk(patterns, risk_time_limit)
+        return None
 
     @staticmethod
-    def __gen_fld_name_re(fld_name):
-        '''
-        A static function to get te generate a regexp string for pulling the
-        field/group name from an existing regexp.
-        :param fld_name:
-        :return:
-        '''
-        return r'\(\?P\<' + fld_name + r'\>'
+    def __check_re_risk(patterns, risk_time_limit: Optional[float]):
+        reports = analyze_patterns(patterns, time_limit=max(risk_time_limit or 0, DEFAULT_TIME_LIMIT))
+        for pat_name, report in reports.items():
+            for finding in report.findings:
+                print(f"Warning: [{pat_name}] regex risk: {finding.message}")
+            if report.worst_time > RISK_WARN_TIME:
+                print(f"Warning: [{pat_name}] regex risk: match() took {report.worst_time * 1e3:.1f} ms on "
+                      f"{report.worst_line!r}")
+            if risk_time_limit is not None and report.worst_time > risk_time_limit:
+                raise ValueError(f"Pattern '{pat_name}' regexp took {report.worst_time:.3f}s to match a fuzzed line, "
+                                 f"over risk_time_limit={risk_time_limit}s: {report.worst_line!r}")
+        return reports
+
+    def set_file_name(self, file_name):
+        self.file_name = file_name
 
     @staticmethod
     def dict_merge(D1, D2):
@@ -239,6 +367,15 @@ class PyReParse:
         self.raw_patterns = in_hash.copy()
         self.re_defs = {}
         self.all_named_fields = {}
+        self.sum_fields = {}
+        self.sum_checks = {}
+        self.intern_tables = {}
+        self.intern_limits = {}
+        self.trigger_windows = {}
+        self.report_boundaries = []
+        self.ignore_checks = []
+        self.batch_callbacks = {}
+        self.pending_batches = {}
         return self.__append_re_defs(in_hash)
 
     def __create_trigger(self, pat_name, trigger_name):
@@ -300,61 +437,58 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
 
         # Create a unique name for the function.
         func_name = trigger_name + '_' + pat_name
-        func_name = re.sub(r'[^\w\_]', r'_', func_name)
+        func_name = _NON_WORD_RE.sub('_', func_name)
         func_def = def_str.replace('<trig_func_name>', func_name)
-        func_body = self.re_defs[pat_name][trigger_name]
-        while True:
-            '''
-            Convert <Variables> into compilable variables.
-            Convert [PatternNames] into tests to see if patter names have been hit.
-            '''
-            m = re.match(r'.*((\<([^\>]+)\>)|(\{([^\}]+)\})).*', func_body, re.MULTILINE | re.DOTALL)
-            if m is None:
-                break
-            elif m and (m.group(2) is not None):
-                # We have a variable...
-                var_name = m.group(2)
-                if var_name == prp.TRIG_SYM_REPORT_LINE:
-                    func_body = func_body.replace(var_name, 'prp_inst.report_line_count')
-                elif var_name == prp.TRIG_SYM_SECTION_COUNT:
-                    func_body = func_body.replace(var_name, 'prp_inst.section_count')
-                elif var_name == prp.TRIG_SYM_SECTION_LINE:
-                    func_body = func_body.replace(var_name, 'prp_inst.section_line_count')
-                elif var_name == prp.TRIG_SYM_SUBSECTION_DEPTH:
-                    func_body = func_body.replace(var_name, 'prp_inst.subsection_depth')
-                elif var_name == prp.TRIG_SYM_SUBSECTION_LINE:
-                    func_body = func_body.replace(var_name, 'prp_inst.subsection_line_count')
-                else:
-                    raise TriggerDefException(f'Unknown variable: {m.group(0)}')
-
-            elif m and (m.group(5) is not None):
-                # We have a pattern-name...
-                pn = m.group(5)
-                if pn in self.re_defs:
-                    func_body = func_body.replace(m.group(4),
-                                                  '(prp_inst.re_defs[' + "'" + pn + "'" +
-                                                  '][PRP.INDEX_STATES][PRP.INDEX_ST_SECTION_LINES_MATCHED] > 0)')
-                else:
-                    raise TriggerDefException(f'Unknown pattern-name: {pn}')
+        # Convert <Variables> into compilable variables, and {PatternNames} into tests to see if pattern names
+        # have been hit.
+        func_body, _ = prp._compile_trigger_expr(self.re_defs[pat_name][trigger_name], self.re_defs, pat_name,
+                                                 trigger_name)
 
         # Create a python function expression...
-        func_text = re.sub(r'<func_body>', func_body, func_def)
-        # Run the function expression through an AST to validate it.
+        func_text = func_def.replace('<func_body>', func_body)
+        # Compile the function expression, which validates it (a single parse).
         # Bad expressions will throw an exception.
         try:
-            ast_tree = ast.parse(func_text)
+            code = compile(func_text, f'<{func_name}>', 'exec')
         except SyntaxError as e:
             raise SyntaxError(f"Syntax error in trigger '{trigger_name}' for pattern '{pat_name}': {e}")
         # Yea... Don't execute PyReparse scripts from just anyone.
         # Consider that the PyReparse
         # Execute the function
-        exec(func_text)
+        namespace = {}
+        exec(code, globals(), namespace)
 
         # Get a reference to the function that we just created.
-        compiled_func = locals()[func_name]
+        compiled_func = namespace[func_name]
 
         return compiled_func, func_text
 
+    @staticmethod
+    def _compile_trigger_expr(trigger_text: str, pattern_names, pat_name: str,
+                              trigger_key: str) -> Tuple[str, List[str]]:
+        '''
+        Translate the <SYMBOLS> and {pattern_name} references of a trigger into a Python expression, in one pass.
+        Used by validate_re_defs() and __create_trigger().
+
+        :param pattern_names: The known pattern names (a dict or set).
+        :return: (expression, referenced pattern names)
+        '''
+        refs = []
+
+        def replace(m):
+            if m.group(1) is not None:
+                attr = PyReParse.TRIG_SYM_ATTRS.get(m.group(0))
+                if attr is None:
+                    raise TriggerDefException(f"Unknown variable in '{pat_name}' '{trigger_key}': {m.group(0)}")
+                return attr
+            pn = m.group(2)
+            if pn not in pattern_names:
+                raise TriggerDefException(f"Unknown pattern reference in '{pat_name}' '{trigger_key}': {pn}")
+            refs.append(pn)
+            return f"(prp_inst.re_defs[{pn!r}][PRP.INDEX_STATES][PRP.INDEX_ST_SECTION_LINES_MATCHED] > 0)"
+
+        return _TRIGGER_TOKEN_RE.sub(replace, trigger_text), refs
+
     def __append_re_defs(self, in_hash):
         '''
         Load RegularExpressions Hash Structure...
@@ -443,19 +577,294 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
                 except TriggerDefException as e:
                     raise
 
+        self.__compile_sum_checks()
+        self.__compile_interns()
+        self.__compile_trigger_windows()
+        self.__compile_report_boundaries()
+        self.__compile_ignores()
+        self.__compile_batch_callbacks()
+        self.match_counts = {pat_name: self.match_counts.get(pat_name, 0) for pat_name in self.re_defs}
+        self.quick_check_miss_counts = {pat_name: self.quick_check_miss_counts.get(pat_name, 0)
+                                        for pat_name in self.re_defs}
+        self.sum_check_fail_counts = {pat_name: self.sum_check_fail_counts.get(pat_name, 0) for pat_name in self.re_defs}
 
         return self.get_all_fld_names()
 
+    def __compile_sum_checks(self):
+        '''
+        Build the lookup tables used by match() to maintain section totals.
+
+        A pattern's INDEX_RE_SUM_CHECK entry declares that one of its captured fields must equal the running
+        section sum of a field captured by another pattern...
+
+            'total_nsf': {
+                ...
+                PRP.INDEX_RE_SUM_CHECK: {'total_nsf': ('tx_line', 'nsf_fee')},
+            }
+
+        From these declarations we derive...
+          - self.sum_fields: {'tx_line': ['nsf_fee']}  Fields to accumulate when the source pattern matches.
+          - self.sum_checks: {'total_nsf': [('total_nsf', 'tx_line', 'nsf_fee')]}  Checks to run on match.
+        '''
+        rtrpc = PyReParse
+        for pat_name in self.re_defs:
+            sum_check = self.re_defs[pat_name].get(rtrpc.INDEX_RE_SUM_CHECK)
+            if not sum_check:
+                continue
+            for chk_fld, (src_pat, src_fld) in sum_check.items():
+                if chk_fld not in self.re_defs[pat_name][rtrpc.INDEX_RE_REGEXP].groupindex:
+                    raise ValueError(f"Pattern '{pat_name}' '{rtrpc.INDEX_RE_SUM_CHECK}' field '{chk_fld}' "
+                                     f"is not a named group of '{pat_name}'.")
+                if src_fld not in self.re_defs[src_pat][rtrpc.INDEX_RE_REGEXP].groupindex:
+                    raise ValueError(f"Pattern '{pat_name}' '{rtrpc.INDEX_RE_SUM_CHECK}' field '{src_fld}' "
+                                     f"is not a named group of '{src_pat}'.")
+                src_flds = self.sum_fields.setdefault(src_pat, [])
+                if src_fld not in src_flds:
+                    src_flds.append(src_fld)
+                self.sum_checks.setdefault(pat_name, []).append((chk_fld, src_pat, src_fld))
+
+    def __compile_trigger_windows(self):
+        '''
+        Derive the counter windows of the patterns' triggers (see schedule.py): self.trigger_windows[pat_name] holds
+        (counter_attr, low, high) checks that must all pass for the pattern's triggers to possibly be True.
+        Patterns without (analyzable) counter conditions, and FLAG_NEW_SECTION / FLAG_NEW_REPORT patterns (which
+        bypass triggers), get no entry.
+        '''
+        rtrpc = PyReParse
+        for pat_name, pat_def in self.re_defs.items():
+            if pat_def.get(rtrpc.INDEX_RE_FLAGS, 0) & (rtrpc.FLAG_NEW_SECTION | rtrpc.FLAG_NEW_REPORT):
+                continue
+            window = pattern_window(pat_def.get(rtrpc.INDEX_RE_TRIGGER_ON_TEXT),
+                                    pat_def.get(rtrpc.INDEX_RE_TRIGGER_OFF_TEXT))
+            checks = window_checks(window) if window else ()
+            if checks:
+                self.trigger_windows[pat_name] = checks
+
+    def __compile_report_boundaries(self):
+        '''
+        List the (pat_name, regexp) of FLAG_NEW_REPORT patterns, which match() checks before any other pattern.
+        '''
+        rtrpc = PyReParse
+        self.report_boundaries = [(pat_name, pat_def[rtrpc.INDEX_RE_REGEXP])
+                                  for pat_name, pat_def in self.re_defs.items()
+                                  if pat_def.get(rtrpc.INDEX_RE_FLAGS, 0) & rtrpc.FLAG_NEW_REPORT]
+
+    def __compile_ignores(self):
+        '''
+        List the (pat_name, test, counters) of FLAG_IGNORE patterns, which match() checks first. test is a string
+        operation where the regexp allows it (see ignore.py).
+        '''
+        rtrpc = PyReParse
+        self.ignore_checks = []
+        for pat_name, pat_def in self.re_defs.items():
+            if pat_def.get(rtrpc.INDEX_RE_FLAGS, 0) & rtrpc.FLAG_IGNORE:
+                _, test = ignore_test(pat_def[rtrpc.INDEX_RE_REGEXP])
+                self.ignore_checks.append((pat_name, test,
+                                           pat_def.get(rtrpc.INDEX_RE_IGNORE_COUNTERS, rtrpc.IGNORE_COUNT_ALL)))
+
+    def __compile_batch_callbacks(self):
+        '''
+        Map the patterns with a batched callback to (callback, batch_size, columns), columns being the field
+        names of a columnar batch, else None.
+        '''
+        rtrpc = PyReParse
+        self.batch_callbacks = {}
+        for pat_name, pat_def in self.re_defs.items():
+            if rtrpc.INDEX_RE_BATCH_CALLBACK in pat_def:
+                columns = None
+                if pat_def.get(rtrpc.INDEX_RE_BATCH_COLUMNAR):
+                    columns = tuple(pat_def[rtrpc.INDEX_RE_REGEXP].groupindex)
+                self.batch_callbacks[pat_name] = (pat_def[rtrpc.INDEX_RE_BATCH_CALLBACK],
+                                                  pat_def.get(rtrpc.INDEX_RE_BATCH_SIZE, rtrpc.DEFAULT_BATCH_SIZE),
+                                                  columns)
+
+    def __batch_match(self, pat_name, groups):
+        batch = self.pending_batches.get(pat_name)
+        if batch is None:
+            batch = self.pending_batches[pat_name] = []
+        batch.append(groups)
+        if len(batch) >= self.batch_callbacks[pat_name][1]:
+            self.__deliver_batch(pat_name)
+
+    def __deliver_batch(self, pat_name):
+        batch = self.pending_batches.pop(pat_name)
+        callback, _, columns = self.batch_callbacks[pat_name]
+        if columns is not None:
+            batch = {name: [fields[name] for fields in batch] for name in columns}
+        if self.callback_lock is not None:
+            with self.callback_lock:
+                callback(self, pat_name, batch)
+        else:
+            callback(self, pat_name, batch)
+
+    def flush_batches(self) -> None:
+        '''
+        Deliver the pending batches of INDEX_RE_BATCH_CALLBACK patterns, in pattern definition order.
+
+        match() flushes them at section and report boundaries, and the parse_file*() / stream*() / follow*()
+        methods at the end of the input. Call it after a loop of match() calls of your own.
+        '''
+        if self.pending_batches:
+            for pat_name in self.batch_callbacks:
+                if pat_name in self.pending_batches:
+                    self.__deliver_batch(pat_name)
+
+    def get_trigger_windows(self) -> Dict[str, Dict[str, Tuple[float, float]]]:
+        '''
+        Get the counter windows derived from the triggers: {pattern: {'<REPORT_LINE>': (low, high), ...}}
+        Unbounded sides are -inf / inf.
+        '''
+        rtrpc = PyReParse
+        symbols = dict(zip(WINDOW_COUNTERS, (rtrpc.TRIG_SYM_REPORT_LINE, rtrpc.TRIG_SYM_SECTION_LINE,
+                                             rtrpc.TRIG_SYM_SUBSECTION_LINE, rtrpc.TRIG_SYM_SECTION_COUNT)))
+        return {pat: {symbols[attr]: (lo, hi) for attr, lo, hi in checks}
+                for pat, checks in self.trigger_windows.items()}
+
+    def __window_open(self, checks):
+        for attr, low, high in checks:
+            if not low <= getattr(self, attr) <= high:
+                return False
+        return True
+
+    def __compile_interns(self):
+        '''
+        Build the per-field intern tables used by match().
+
+        A pattern's INDEX_RE_INTERN entry lists captured fields whose values repeat a lot (codes, types, dates)...
+
+            'tx_line': {
+                ...
+                PRP.INDEX_RE_INTERN: ('ac_type', 'fee_code', 'fee_type'),
+                PRP.INDEX_RE_INTERN_LIMIT: 256,   # Optional, default DEFAULT_INTERN_LIMIT
+            }
+
+        Each listed field gets a table of the distinct values seen: self.intern_tables['tx_line']['fee_type'].
+        A captured value found in the table is replaced by the table's (shared) str, so retained results hold one
+        copy per distinct value. Once a table holds intern_limit values, new values are kept as captured.
+        '''
+        rtrpc = PyReParse
+        for pat_name in self.re_defs:
+            intern = self.re_defs[pat_name].get(rtrpc.INDEX_RE_INTERN)
+            if not intern or pat_name in self.intern_tables:
+                continue
+            groupindex = self.re_defs[pat_name][rtrpc.INDEX_RE_REGEXP].groupindex
+            if intern is True:
+                intern = list(groupindex)
+            for fn in intern:
+                if fn not in groupindex:
+                    raise ValueError(f"Pattern '{pat_name}' '{rtrpc.INDEX_RE_INTERN}' field '{fn}' "
+                                     f"is not a named group of '{pat_name}'.")
+            self.intern_tables[pat_name] = {fn: {} for fn in intern}
+            self.intern_limits[pat_name] = self.re_defs[pat_name].get(rtrpc.INDEX_RE_INTERN_LIMIT,
+                                                                       rtrpc.DEFAULT_INTERN_LIMIT)
+
+    def __intern_fields(self, pat_name, groups):
+        '''
+        Replace captured values in groups by their shared copies from the pattern's intern tables.
+        '''
+        limit = self.intern_limits[pat_name]
+        for fn, table in self.intern_tables[pat_name].items():
+            val = groups[fn]
+            if val is None:
+                continue
+            shared = table.get(val)
+            if shared is not None:
+                groups[fn] = shared
+            elif len(table) < limit:
+                # setdefault() is atomic, so workers sharing the table (see clone()) agree on the shared copy.
+                groups[fn] = table.setdefault(val, val)
+                if len(table) == limit:
+                    print(f'*** Intern table [{pat_name}.{fn}] is full ({limit} values), '
+                          f'further new values are not interned.')
+
+    def get_intern_stats(self) -> Dict[str, Dict[str, int]]:
+        '''
+        Get the number of distinct values held by each intern table: {pattern: {field: count}}
+        '''
+        return {pat: {fn: len(table) for fn, table in tables.items()} for pat, tables in self.intern_tables.items()}
+
+    @staticmethod
+    def _sum_amount(in_str: str) -> Optional[Decimal]:
+        '''
+        Convert a sum check amount like money2decimal() does, also reading trailing minus (1.00-) and parenthesized
+        ((1.00)) negatives. Returns None, rather than 0, when the amount does not convert (e.g. 1.00 CR).
+        '''
+        amt = re.sub(r'[\,\s\$]', r'', in_str)
+        negative = False
+        if amt.endswith('-'):
+            amt, negative = amt[:-1], True
+        elif amt.startswith('(') and amt.endswith(')'):
+            amt, negative = amt[1:-1], True
+        if negative and amt[:1] in ('-', '+'):
+            return None
+        try:
+            ret_val = Decimal(amt)
+        except InvalidOperation:
+            return None
+        if not ret_val.is_finite():
+            return None
+        return -ret_val if negative else ret_val
+
+    def __sum_check_failed(self, pat_name, m, detail):
+        self.section_valid = False
+        self.sum_check_fail_counts[pat_name] += 1
+        print(f'\n*** Sum check [{pat_name}] failed in File[{self.file_name}] at...')
+        print(f'   {detail}')
+        print(f'   Line [{m.string.rstrip()}]')
+        print(f'   Report Line [{self.report_line_count}]')
+        print(f'   Section Number [{self.section_count}]')
+        print(f'   Section Line [{self.section_line_count}]')
+
+    def __update_section_totals(self, pat_name, m):
+        '''
+        Accumulate money fields into self.section_totals and run the sum checks declared for pat_name.
+        Amounts are converted with _sum_amount() so the arithmetic is exact; an amount that does not convert fails
+        the check (it is not summed as 0).
+        Optional groups that did not participate in the match (None) add nothing, and skip their check.
+        '''
+        if pat_name in self.sum_fields:
+            for src_fld in self.sum_fields[pat_name]:
+                value = m.group(src_fld)
+                if value is None:
+                    continue
+                amount = self._sum_amount(value)
+                if amount is None:
+                    self.__sum_check_failed(pat_name, m, f'{src_fld} [{value}] is not an amount')
+                    continue
+                self.section_totals[src_fld] = self.section_totals.get(src_fld, Decimal('0')) + amount
+        if pat_name in self.sum_checks:
+            for chk_fld, src_pat, src_fld in self.sum_checks[pat_name]:
+                value = m.group(chk_fld)
+                if value is None:
+                    continue
+                chk_val = self._sum_amount(value)
+                if chk_val is None:
+                    self.__sum_check_failed(pat_name, m, f'{chk_fld} [{value}] is not an amount')
+                    continue
+                sum_val = self.section_totals.get(src_fld, Decimal('0'))
+                self.section_totals[chk_fld] = chk_val
+                if chk_val != sum_val:
+                    self.__sum_check_failed(pat_name, m,
+                                            f'{chk_fld} [{chk_val}] != sum({src_pat}.{src_fld}) [{sum_val}]')
+
+    def section_totals_reset(self):
+        '''
+        Start a new set of section totals.
+        A new dict is created (rather than clearing the old one) so that section results that still
+        reference the previous section's totals are left intact.
+        '''
+        self.section_totals = {}
+        self.section_valid = True
+
     def get_all_fld_names(self):
         '''
         Returns a list of all field names found within all regexp patterns.
         :return:
         '''
-        rtrpc = PyReParse
         # Get all field_names from all regexps
         nflds = {}
         for pat_name in self.re_defs:
-            nflds = self.dict_merge(nflds, self.get_fld_names(pat_name))
+            nflds.update(self.get_fld_names(pat_name))
 
         self.all_named_fields = nflds
 
@@ -467,27 +876,14 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
         :return:
         '''
         rtrpc = PyReParse
-        # Get all field_names from all regexps
-        nflds = {}
-        if repat_name in self.re_defs:
-            restr = self.re_defs[repat_name][rtrpc.INDEX_RE_STRING]
-
-            if restr:
-                # Process a regexp...
-                while True:
-                    ng = self.re_named_group.match(restr)
-                    if ng is not None:
-                        fld_name = ng.group(1)
-                        fld_name_expr = self.__gen_fld_name_re(fld_name)
-                        nflds[fld_name] = ''
-                        restr = re.sub(fld_name_expr, r'(', restr)
-                    else:
-                        break
-
-        else:
+        if repat_name not in self.re_defs:
             print(f"*** Error: [{repat_name}] does not exist in self.re_defs!")
-
-        return nflds
+            return {}
+        # The compiled regexp knows its named groups, in group order.
+        regexp = self.re_defs[repat_name].get(rtrpc.INDEX_RE_REGEXP)
+        if regexp is None:
+            regexp = re.compile(self.re_defs[repat_name][rtrpc.INDEX_RE_STRING], re.X)
+        return dict.fromkeys(regexp.groupindex, '')
 
     def __eval_triggers(self, pat_name):
         '''
@@ -537,6 +933,48 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
         :return:
         '''
         rtrpc = PyReParse
+        self.input_line_count += 1
+        trace = self.tracer
+        if trace is not None:
+            if len(trace.events) >= TRACE_BLOCK:
+                trace.flush()
+            emit = trace.events.append
+            trace_ids = trace.pattern_ids
+            trace_line = self.input_line_count << LINE_SHIFT
+        for pat_name, test, counters in self.ignore_checks:
+            if test(in_line):
+                if trace is not None:
+                    emit(trace_line | trace_ids[pat_name] << PATTERN_SHIFT | CODE_IGNORE)
+                return self.__ignore_line(counters)
+        guard = self.line_guard
+        timing = False
+        if guard is not None:
+            if guard.max_line_length is not None and len(in_line) > guard.max_line_length:
+                if guard.reject_sink is not None:
+                    if trace is not None:
+                        emit(trace_line | CODE_REJECT)
+                    return self.__reject_line(in_line)
+                guard.truncated()
+                if trace is not None:
+                    emit(trace_line | CODE_TRUNCATE)
+                in_line = in_line[:guard.max_line_length]
+            timing = guard.slow_line_threshold is not None
+            line_time = slowest_time = 0.0
+            slowest_pat = None
+        # A report boundary resets the report state before anything else sees the line, so its triggers and
+        # counters already belong to the new report.
+        report_pat = report_m = None
+        for pat_name, regexp in self.report_boundaries:
+            report_m = regexp.match(in_line)
+            if report_m:
+                report_pat = pat_name
+                if trace is not None:
+                    emit(trace_line | trace_ids[pat_name] << PATTERN_SHIFT | CODE_REPORT)
+                if self.pending_batches:
+                    self.flush_batches()  # Batches end with their report, before its state is reset.
+                self.report_count += 1
+                self.report_reset()
+                break
         # Increment total report and page line counters
         self.report_line_count += 1
         if limit_matches:
@@ -562,10 +1000,20 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
             # Triggers returning true means skip match evaluation,
             # if True:
             flags = self.re_defs[fld].get(rtrpc.INDEX_RE_FLAGS, 0)
-            if flags & rtrpc.FLAG_NEW_SECTION:
+            if flags & rtrpc.FLAG_IGNORE:
+                continue
+            if flags & (rtrpc.FLAG_NEW_SECTION | rtrpc.FLAG_NEW_REPORT):
                 do_match = True
+            elif fld in self.trigger_windows and self.use_counter_windows and \
+                    not self.__window_open(self.trigger_windows[fld]):
+                # The pattern sleeps: its triggers can not be True outside of their counter window.
+                do_match = False
+                if trace is not None and trace.triggers:
+                    emit(trace_line | trace_ids[fld] << PATTERN_SHIFT | CODE_EVAL_WINDOW)
             else:
                 do_match = self.__eval_triggers(fld)
+                if not do_match and trace is not None and trace.triggers:
+                    emit(trace_line | trace_ids[fld] << PATTERN_SHIFT | CODE_EVAL_OFF)
             if do_match:
                 if debug:
                     print(f'regexp: [{fld}]')
@@ -573,33 +1021,53 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
                     print(f'--- Triggered[{fld}]...')
                 if self.re_defs[fld][rtrpc.INDEX_RE_REGEXP] is None:
                     continue
-                m = self.re_defs[fld][rtrpc.INDEX_RE_REGEXP].match(in_line)
+                if flags & rtrpc.FLAG_NEW_REPORT:
+                    # Already matched by the report boundary check above.
+                    m = report_m if fld == report_pat else None
+                elif timing:
+                    start = perf_counter()
+                    m = self.re_defs[fld][rtrpc.INDEX_RE_REGEXP].match(in_line)
+                    elapsed = perf_counter() - start
+                    line_time += elapsed
+                    if elapsed > slowest_time:
+                        slowest_time, slowest_pat = elapsed, fld
+                else:
+                    m = self.re_defs[fld][rtrpc.INDEX_RE_REGEXP].match(in_line)
                 self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_REPORT_MATCH_ATTEMPTS] += 1
                 self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_SECTION_MATCH_ATTEMPTS] += 1
+                if trace is not None:
+                    emit(trace_line | trace_ids[fld] << PATTERN_SHIFT | (CODE_EVAL_MATCH if m else CODE_EVAL_MISS))
                 if m:
                     if debug:
                         print(f'--- *** Matched[{fld}] ***')
                     # If we get a match, place values from captured groups (by name) into
                     # the self.named_field dictionary (by field name).
-                    for fn in m.re.groupindex:
-                        self.all_named_fields[fn] = m.group(fn)
-                    for fn in m.re.groupindex:
+                    groups = m.groupdict()
+                    if fld in self.intern_tables:
+                        self.__intern_fields(fld, groups)
+                    self.all_named_fields.update(groups)
+                    for fn, val in groups.items():
                         if fn in self.last_captured_fields:
                             if fn in fn_inc:
                                 fn_inc[fn] += 1
                             else:
                                 fn_inc[fn] = 1
                             # We've added a increment value to the fld name, if it already exists in the dict.
-                            self.last_captured_fields[f'{fn}-<{fn_inc[fn]}>'] = m.group(fn)
+                            self.last_captured_fields[f'{fn}-<{fn_inc[fn]}>'] = val
                         else:
-                            self.last_captured_fields[fn] = m.group(fn)
+                            self.last_captured_fields[fn] = val
 
                     # Perform Callback if defined...
                     if rtrpc.INDEX_RE_CALLBACK in self.re_defs[fld]:
                         # Execute the callback function.
-                        self.re_defs[fld][rtrpc.INDEX_RE_CALLBACK](self, fld)
+                        if self.callback_lock is not None:
+                            with self.callback_lock:
+                                self.re_defs[fld][rtrpc.INDEX_RE_CALLBACK](self, fld)
+                        else:
+                            self.re_defs[fld][rtrpc.INDEX_RE_CALLBACK](self, fld)
 
                     # Update status values of our regexps lines in the re_defs dict...
+                    self.match_counts[fld] += 1
                     self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_REPORT_LINES_MATCHED] += 1
                     self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_SECTION_LINES_MATCHED] += 1
                     self.re_defs[fld][rtrpc.INDEX_STATES][
@@ -613,22 +1081,31 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
                     # Perform FLAG based operations...
                     flags = self.re_defs[fld].get(rtrpc.INDEX_RE_FLAGS, 0)
                     if flags & rtrpc.FLAG_NEW_SECTION:
+                        if trace is not None:
+                            emit(trace_line | trace_ids[fld] << PATTERN_SHIFT | CODE_SECTION)
+                        if self.pending_batches:
+                            self.flush_batches()  # Batches end with their section, before its state is reset.
                         # Increment the section counter...
                         self.section_count += 1
                         # Reset sectional flags and counters...
                         self.section_reset()
+                        self.section_totals_reset()
                         # Fields that reset sections also match atleast once within those sections...
                         self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_SECTION_MATCH_ATTEMPTS] = 1
                         self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_SECTION_LINES_MATCHED] = 1
                         self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_LAST_SECTION_LINE_MATCHED] = 1
                         self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_LAST_REPORT_LINE_MATCHED] = 1
                     if flags & rtrpc.FLAG_END_OF_SECTION:
+                        if trace is not None:
+                            emit(trace_line | trace_ids[fld] << PATTERN_SHIFT | CODE_END_SECTION)
                         if self.subsection_depth > 0:
                             self.subsection_depth -= 1
                             self.current_subsection_parents.pop()
                             self.subsection_line_count = 0
                         self.section_reset()  # Existing call after
                     if flags & rtrpc.FLAG_NEW_SUBSECTION:
+                        if trace is not None:
+                            emit(trace_line | trace_ids[fld] << PATTERN_SHIFT | CODE_SUBSECTION)
                         self.subsection_depth += 1
                         self.current_subsection_parents.append(fld)
                         self.subsection_depth_counts[self.subsection_depth] += 1
@@ -640,7 +1117,18 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
                     self.last_captured_fields['current_subsection_parents'] = list(self.current_subsection_parents)
                     self.last_captured_fields['subsection_line_count'] = self.subsection_line_count
 
+                    # Maintain declared section totals and sum checks...
+                    if fld in self.sum_fields or fld in self.sum_checks:
+                        self.__update_section_totals(fld, m)
+
+                    # After the flags, so a new section's first match is batched with its section.
+                    if fld in self.batch_callbacks:
+                        self.__batch_match(fld, groups)
+
                     if flags & rtrpc.FLAG_RETURN_ON_MATCH:
+                        if timing and line_time > guard.slow_line_threshold:
+                            guard.log_slow_line(self.input_line_count, self.section_count, slowest_pat, line_time,
+                                                in_line)
                         return matched_defs, self.last_captured_fields
 
                 else:
@@ -650,6 +1138,7 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
                         # Do we have a QuickCheck Entry? Yes, Do a quick check...
                         line_no_lf = re.sub(r"\n", r"", in_line)
                         if re.match(self.re_defs[fld][rtrpc.INDEX_RE_QUICK_CHECK], in_line, re.X):
+                            self.quick_check_miss_counts[fld] += 1
                             print(f'\n*** A RegExp [{fld}] may have missed a line in File[{self.file_name}] at...')
                             print(f'   Line [{line_no_lf}]')
                             print(f'   Report Line [{self.report_line_count}]')
@@ -658,9 +1147,132 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
 
         # TODO: Add code to check for duplicate fields found (throw error or warning)
 
+        if timing and line_time > guard.slow_line_threshold:
+            guard.log_slow_line(self.input_line_count, self.section_count, slowest_pat, line_time, in_line)
+
         # Return the list of entries in the re_defs dict that match this line.
         return matched_defs, self.last_captured_fields
 
+    def __ignore_line(self, counters):
+        # A FLAG_IGNORE line: only the configured counters see it.
+        self.ignored_line_count += 1
+        if counters != PyReParse.IGNORE_COUNT_NONE:
+            self.report_line_count += 1
+            if counters == PyReParse.IGNORE_COUNT_ALL:
+                self.section_line_count += 1
+                self.subsection_line_count += 1
+        self.last_captured_fields = {}
+        return None, self.last_captured_fields
+
+    def __reject_line(self, in_line):
+        # The line is counted, but not matched: it goes to the line guard's reject sink.
+        self.report_line_count += 1
+        self.section_line_count += 1
+        self.subsection_line_count += 1
+        self.last_captured_fields = {}
+        self.line_guard.reject(self.input_line_count, self.section_count, in_line)
+        return None, self.last_captured_fields
+
+    def set_line_guard(self, max_line_length: Optional[int] = None, slow_line_threshold: Optional[float] = None,
+                       reject_sink=None, log_size: int = SLOW_LINE_LOG_SIZE) -> Optional[LineGuard]:
+        """
+        Guard match() against corrupt (e.g. joined, very long) lines. See guard.py.
+
+        :param max_line_length: Lines longer than this are truncated to it before being matched, or, with a
+                                reject_sink, not matched at all.
+        :param slow_line_threshold: Log lines whose regexp match time exceeds this many seconds, with their line
+                                    number, section number and slowest pattern (see LineGuard.get_slow_lines()).
+        :param reject_sink: Callable receiving (line_number, section_number, line) for lines over max_line_length.
+        :param log_size: Number of (most recent) slow lines kept.
+        :return: The LineGuard (shared by clones), or None when called without limits, which removes the guard.
+        """
+        if max_line_length is None and slow_line_threshold is None and reject_sink is None:
+            self.line_guard = None
+        else:
+            self.line_guard = LineGuard(max_line_length, slow_line_threshold, reject_sink, log_size)
+        return self.line_guard
+
+    def start_trace(self, path: Optional[str] = None, capacity: int = DEFAULT_RING_EVENTS,
+                    triggers: bool = True) -> Tracer:
+        """
+        Record compact binary events of what match() does on each line (see trace.py), instead of the
+        match(debug=True) prints. Clones trace into the same file or ring buffer.
+
+        :param path: Write the events to this trace file. Without a path, the most recent capacity events are
+                     kept in a ring buffer (Tracer.get_events(), Tracer.save()).
+        :param capacity: Ring buffer size (events, 8 bytes each).
+        :param triggers: Also record patterns whose trigger was False. False keeps only regexp attempts and
+                         section, report, ignore and guard events, a much smaller trace.
+        :return: The Tracer. Call stop_trace() to flush and close it.
+        """
+        if not hasattr(self, 'raw_patterns'):
+            raise ValueError("Patterns must be loaded first using load_re_lines()")
+        self.stop_trace()
+        self.tracer = Tracer(list(self.re_defs), path=path, capacity=capacity, triggers=triggers,
+                             meta={'file_name': self.file_name})
+        return self.tracer
+
+    def stop_trace(self) -> Optional[Tracer]:
+        """
+        Stop tracing: flush and close the trace file (a ring buffer stays readable).
+        :return: The stopped Tracer, or None when not tracing.
+        """
+        tracer, self.tracer = self.tracer, None
+        if tracer is not None:
+            tracer.close()
+        return tracer
+
+    def start_metrics(self, http_port: Optional[int] = None, http_host: str = DEFAULT_HTTP_HOST,
+                      textfile: Optional[str] = None, interval: float = DEFAULT_INTERVAL) -> ParseMetrics:
+        """
+        Export operational metrics of this instance's (and its clones') parses in the Prometheus text format:
+        lines, bytes, sections, matches per pattern, quick check misses, throughput and ETA. See metrics.py.
+
+        :param http_port: Serve the metrics at http://http_host:http_port/metrics (0 picks a free port, see
+                          ParseMetrics.http_port).
+        :param http_host: Address the endpoint listens on, the loopback interface by default.
+        :param textfile: Rewrite this file with the metrics every interval seconds.
+        :param interval: Seconds between rewrites of textfile.
+        :return: The ParseMetrics registry (also readable directly: sample(), to_prometheus()). Call
+                 stop_metrics() to stop exporting.
+        """
+        self.stop_metrics()
+        metrics = ParseMetrics()
+        try:
+            if http_port is not None:
+                metrics.serve(http_port, http_host)
+            if textfile is not None:
+                metrics.start_textfile(textfile, interval)
+        except BaseException:
+            metrics.close()
+            raise
+        self.metrics = metrics
+        return metrics
+
+    def stop_metrics(self) -> Optional[ParseMetrics]:
+        """
+        Stop collecting metrics, stop the HTTP endpoint and write the metrics file a last time.
+        :return: The stopped ParseMetrics (still readable), or None when not collecting.
+        """
+        metrics, self.metrics = self.metrics, None
+        if metrics is not None:
+            metrics.close()
+        return metrics
+
+    def _metered(self, lines, source=None, offset: int = 0):
+        '''
+        Lines counted into the metrics registry while they are iterated (read from source, from offset, when
+        given), or lines unchanged without metrics.
+        '''
+        if self.metrics is None:
+            return lines
+        return self.metrics.metered(self, lines, input_size(source, offset) if source is not None else None)
+
+    def _metered_at(self, lines, source=None, offset: int = 0):
+        if self.metrics is None:
+            return lines
+        return self.metrics.metered_at(self, lines, input_size(source, offset) if source is not None else None)
+
     def section_reset(self):
         rtrpc = PyReParse
         for fld in self.re_defs:
@@ -681,9 +1293,103 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
             self.re_defs[fld][rtrpc.INDEX_STATES][rtrpc.INDEX_ST_LAST_REPORT_LINE_MATCHED] = 0
 
         self.section_reset()
+        self.section_totals_reset()
         self.max_subsection_depth = 0
         self.subsection_depth_counts.clear()
 
+    def clone(self) -> 'PyReParse':
+        """
+        Get a new instance for the same patterns, in the initial (report_reset()) state.
+
+        The loaded patterns are split into an immutable spec, which the clone shares, and per-instance parse
+        state, which the clone gets fresh copies of...
+          - Shared, read-only once loaded: the compiled regexps, trigger functions, callbacks, sum check and
+            trigger window tables, report boundaries, and the raw patterns.
+          - Per instance: the counters, each pattern's INDEX_STATES dict, captured fields, subsection stack and
+            section totals.
+          - Shared on purpose: the intern tables (updated with atomic dict operations) and callback_lock.
+
+        Cloning skips validation and compilation, so it is much cheaper than PyReParse(patterns). A clone can
+        match() on another thread while this instance (or other clones) match, including on free-threaded
+        (no-GIL) Python builds: triggers only read their own prp_inst.
+
+        Callbacks are the exception: they run on whichever thread matched, concurrently with the callbacks of
+        other clones, so a callback updating globals or other shared objects must be reentrant. Set
+        callback_lock (e.g. to a threading.Lock()) before cloning to serialize the callbacks of all clones.
+        """
+        rtrpc = PyReParse
+        if not hasattr(self, 'raw_patterns'):
+            raise ValueError("Patterns must be loaded first using load_re_lines()")
+        prp = PyReParse()
+        prp.raw_patterns = self.raw_patterns
+        prp.re_defs = {pat: dict(defn, **{rtrpc.INDEX_STATES: dict.fromkeys(defn[rtrpc.INDEX_STATES], 0)})
+                       for pat, defn in self.re_defs.items()}
+        prp.all_named_fields = dict.fromkeys(self.all_named_fields, '')
+        prp.sum_fields = self.sum_fields
+        prp.sum_checks = self.sum_checks
+        prp.intern_tables = self.intern_tables
+        prp.intern_limits = self.intern_limits
+        prp.trigger_windows = self.trigger_windows
+        prp.use_counter_windows = self.use_counter_windows
+        prp.report_boundaries = self.report_boundaries
+        prp.ignore_checks = self.ignore_checks
+        prp.batch_callbacks = self.batch_callbacks
+        prp.callback_lock = self.callback_lock
+        prp.line_guard = self.line_guard
+        prp.tracer = self.tracer.fork() if self.tracer is not None else None
+        prp.metrics = self.metrics
+        prp.match_counts = dict.fromkeys(self.match_counts, 0)
+        prp.quick_check_miss_counts = dict.fromkeys(self.quick_check_miss_counts, 0)
+        prp.sum_check_fail_counts = dict.fromkeys(self.sum_check_fail_counts, 0)
+        prp.file_name = self.file_name
+        return prp
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        Get the parser state (counters, subsection stack, section totals and per-pattern states)
+        as a JSON friendly dict (apart from Decimal totals). Used for checkpoints, see set_state().
+        """
+        rtrpc = PyReParse
+        return {
+            'report_line_count': self.report_line_count,
+            'report_count': self.report_count,
+            'input_line_count': self.input_line_count,
+            'section_count': self.section_count,
+            'section_line_count': self.section_line_count,
+            'subsection_depth': self.subsection_depth,
+            'current_subsection_parents': list(self.current_subsection_parents),
+            'subsection_line_count': self.subsection_line_count,
+            'max_subsection_depth': self.max_subsection_depth,
+            'subsection_depth_counts': sorted(self.subsection_depth_counts.items()),
+            'section_totals': dict(self.section_totals),
+            'section_valid': self.section_valid,
+            'all_named_fields': dict(self.all_named_fields),
+            'pattern_states': {fld: dict(self.re_defs[fld][rtrpc.INDEX_STATES]) for fld in self.re_defs},
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """
+        Restore a parser state saved with get_state(). The same patterns must be loaded.
+        """
+        rtrpc = PyReParse
+        if set(state['pattern_states']) != set(self.re_defs):
+            raise ValueError('Saved parser state does not match the loaded patterns.')
+        self.report_line_count = state['report_line_count']
+        self.report_count = state.get('report_count', 0)
+        self.input_line_count = state.get('input_line_count', 0)
+        self.section_count = state['section_count']
+        self.section_line_count = state['section_line_count']
+        self.subsection_depth = state['subsection_depth']
+        self.current_subsection_parents = list(state['current_subsection_parents'])
+        self.subsection_line_count = state['subsection_line_count']
+        self.max_subsection_depth = state['max_subsection_depth']
+        self.subsection_depth_counts = defaultdict(int, {int(k): v for k, v in state['subsection_depth_counts']})
+        self.section_totals = dict(state['section_totals'])
+        self.section_valid = state['section_valid']
+        self.all_named_fields = dict(state['all_named_fields'])
+        for fld, states in state['pattern_states'].items():
+            self.re_defs[fld][rtrpc.INDEX_STATES].update(states)
+
     def money2float(self, fld, in_str):
         re_str = re.sub(r'[\,\s\$]', r'', in_str)
         try:
@@ -744,165 +1450,784 @@ def <trig_func_name>(prp_inst, pat_name, trigger_name):
             ret_val = Decimal('0')
         return ret_val
 
-    def _find_section_boundaries(self, file_path: str) -> List[Tuple[int, int]]:
+    def _iter_section_chunks(self, file_path: str, encoding: Optional[str] = None) -> Iterator[Tuple[int, List[str]]]:
         """
-        Find boundaries of top-level sections in the file for parallel processing.
-        This identifies start and end lines of sections based on boundary patterns.
-        Handles basic nesting but returns top-level boundaries for parallel_depth=1.
+        Read the file once, splitting it into top-level section chunks, each starting at a line matched by a
+        FLAG_NEW_SECTION pattern (a report boundary ends it). Needs no second pass or seeking, so it also works for
+        compressed input.
 
-        :param file_path: Path to the file to analyze.
-        :return: List of tuples (start_line, end_line) where lines are 1-based.
+        :param file_path: Path to the file to split.
+        :param encoding: The file's encoding (default: the locale's).
+        :return: Iterator of tuples (start_line, lines) where start_line is 1-based.
         """
-        start_lines = []
-        with open(file_path, 'r') as f:
+        section_res = [defn[self.INDEX_RE_REGEXP] for defn in self.re_defs.values()
+                       if defn.get(self.INDEX_RE_FLAGS, 0) & self.FLAG_NEW_SECTION and defn.get(self.INDEX_RE_REGEXP)]
+        report_res = [regexp for _, regexp in self.report_boundaries]
+        start_line = None
+        lines = []
+        with open_text(file_path, encoding=encoding) as f:
             for i, line in enumerate(f, 1):
                 line_stripped = line.rstrip('\n')
-                matched = False
-                for name, defn in self.re_defs.items():
-                    flags = defn.get(self.INDEX_RE_FLAGS, 0)
-                    if flags & self.FLAG_NEW_SECTION:
-                        regexp = defn.get(self.INDEX_RE_REGEXP)
-                        if regexp and regexp.match(line_stripped):
-                            start_lines.append(i)
-                            matched = True
-                            break
-                if matched:
-                    continue
+                for regexp in report_res:
+                    # A new report ends the current section (see _section_step()).
+                    if regexp.match(line_stripped):
+                        if start_line is not None:
+                            yield start_line, lines
+                        start_line = None
+                        lines = []
+                        break
+                for regexp in section_res:
+                    if regexp.match(line_stripped):
+                        if start_line is not None:
+                            yield start_line, lines
+                        start_line = i
+                        lines = []
+                        break
+                if start_line is not None:
+                    lines.append(line)
+        if start_line is not None:
+            yield start_line, lines
 
-        # Get total lines
-        total_lines = 0
-        with open(file_path, 'r') as f:
-            total_lines = sum(1 for _ in f)
+    def _iter_report_chunks(self, file_path: str, encoding: Optional[str] = None) -> Iterator[Tuple[int, List[str]]]:
+        """
+        Read the file once, splitting it into report chunks at FLAG_NEW_REPORT lines.
+        Lines before the first report boundary (if any) form a first chunk.
 
-        boundaries = []
-        for j in range(len(start_lines)):
-            start = start_lines[j]
-            end = start_lines[j + 1] - 1 if j + 1 < len(start_lines) else total_lines
-            boundaries.append((start, end))
+        :param file_path: Path to the file to split.
+        :param encoding: The file's encoding (default: the locale's).
+        :return: Iterator of tuples (start_line, lines) where start_line is 1-based.
+        """
+        report_res = [regexp for _, regexp in self.report_boundaries]
+        start_line = 1
+        lines = []
+        with open_text(file_path, encoding=encoding) as f:
+            for i, line in enumerate(f, 1):
+                line_stripped = line.rstrip('\n')
+                for regexp in report_res:
+                    if regexp.match(line_stripped):
+                        if lines:
+                            yield start_line, lines
+                        start_line = i
+                        lines = []
+                        break
+                lines.append(line)
+        if lines:
+            yield start_line, lines
+
+    def _check_split_at(self, split_at: str) -> None:
+        if split_at not in (PyReParse.SPLIT_SECTIONS, PyReParse.SPLIT_REPORTS):
+            raise ValueError(f"Unknown split_at '{split_at}', use PyReParse.SPLIT_SECTIONS or "
+                             f"PyReParse.SPLIT_REPORTS.")
+        if split_at == PyReParse.SPLIT_REPORTS and not self.report_boundaries:
+            raise ValueError("split_at=PyReParse.SPLIT_REPORTS requires a pattern with FLAG_NEW_REPORT.")
+
+    def _iter_chunks(self, file_path: str, split_at: str, encoding: Optional[str] = None):
+        if split_at == PyReParse.SPLIT_REPORTS:
+            return self._iter_report_chunks(file_path, encoding)
+        return self._iter_section_chunks(file_path, encoding)
+
+    def _check_result_format(self, result_format: str) -> None:
+        if result_format not in (PyReParse.RESULT_DICTS, PyReParse.RESULT_RECORDS):
+            raise ValueError(f"Unknown result_format '{result_format}', use PyReParse.RESULT_DICTS or "
+                             f"PyReParse.RESULT_RECORDS.")
+
+    @staticmethod
+    def _new_section(start_line: int, totals: Dict[str, Any], result_format: str) -> Union[Dict[str, Any], Section]:
+        if result_format == PyReParse.RESULT_RECORDS:
+            return Section(start_line, [], totals, True)
+        return {
+            'section_start': start_line,
+            'fields_list': [],
+            'totals': totals,
+            'valid': True
+        }
 
-        return boundaries
+    @staticmethod
+    def _new_item(match_def: List[str], fields: Dict[str, Any], result_format: str):
+        if result_format == PyReParse.RESULT_RECORDS:
+            return make_record(match_def, fields)
+        return {
+            'match_def': match_def,
+            'fields': fields.copy()
+        }
 
-    def _process_section_chunk(self, file_path: str, start_line: int, end_line: int) -> Dict[str, Any]:
+    def _process_section_lines(self, file_path: str, start_line: int, lines: List[str],
+                               result_format: str = RESULT_DICTS) -> Union[Dict[str, Any], Section]:
         """
-        Process a specific chunk of lines corresponding to a section.
-        Creates a new PyReParse instance to avoid state conflicts in parallel execution.
+        Process the lines of a section chunk.
+        Uses a clone() of this instance, so sections can be processed on parallel threads.
 
-        :param file_path: Path to the file.
-        :param start_line: Starting line number (1-based, inclusive).
-        :param end_line: Ending line number (1-based, inclusive).
+        :param file_path: Path to the file (used for messages).
+        :param start_line: Line number of the first line (1-based).
+        :param lines: The section's lines.
+        :param result_format: RESULT_DICTS or RESULT_RECORDS.
         :return: Dictionary containing section data, including matched fields.
         """
-        prp = PyReParse(self.raw_patterns)
+        # A clone shares the patterns' spec (and intern tables, so values are shared across sections too).
+        prp = self.clone()
         prp.set_file_name(file_path)
-        prp.report_reset()
-        prp.section_reset()
+        prp.input_line_count = start_line - 1
 
-        with open(file_path, 'r') as f:
-            all_lines = f.readlines()
-            lines = all_lines[start_line - 1 : end_line]
-
-        section_data = {
-            'section_start': start_line,
-            'fields_list': [],
-            'totals': {},
-            'valid': True
-        }
-        for line in lines:
+        section_data = self._new_section(start_line, {}, result_format)
+        fields_list = section_data['fields_list']
+        for line in prp._metered(lines):
             match_def, fields = prp.match(line.rstrip('\n'))
             if match_def:
-                section_data['fields_list'].append({
-                    'match_def': match_def,
-                    'fields': fields.copy()
-                })
+                fields_list.append(self._new_item(match_def, fields, result_format))
+        prp.flush_batches()
+        if prp.tracer is not None:
+            prp.tracer.flush()
+        section_data['totals'] = prp.section_totals
+        section_data['valid'] = prp.section_valid
         return section_data
 
-    def parse_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def _process_report_lines(self, file_path: str, start_line: int, lines: List[str],
+                              result_format: str = RESULT_DICTS) -> List[Union[Dict[str, Any], Section]]:
         """
-        Serial parsing returning same format as parse_file_parallel(depth=0).
+        Process the lines of a report chunk with a new PyReParse instance, like parse_file_stream() would.
+
+        :param file_path: Path to the file (used for messages).
+        :param start_line: Line number of the first line (1-based).
+        :param lines: The report's lines.
+        :param result_format: RESULT_DICTS or RESULT_RECORDS.
+        :return: The report's sections.
         """
-        boundaries = self._find_section_boundaries(file_path)
+        prp = self.clone()
+        prp.set_file_name(file_path)
+        prp.input_line_count = start_line - 1
+
         sections = []
-        for start, end in boundaries:
-            sec = self._process_section_chunk(file_path, start, end)
-            sections.append(sec)
+        current_sec = None
+        for line_num, line in enumerate(prp._metered(lines), start_line):
+            m, flds = prp.match(line.rstrip('\n'))
+            if m:
+                done_sec, current_sec = prp._section_step(current_sec, line_num, m, flds, result_format)
+                if done_sec is not None:
+                    sections.append(done_sec)
+        prp.flush_batches()
+        if prp.tracer is not None:
+            prp.tracer.flush()
+        if current_sec is not None:
+            sections.append(current_sec)
+        return sections
+
+    def _process_chunk(self, file_path: str, start_line: int, lines: List[str], result_format: str,
+                       split_at: str) -> List[Union[Dict[str, Any], Section]]:
+        if split_at == PyReParse.SPLIT_REPORTS:
+            return self._process_report_lines(file_path, start_line, lines, result_format)
+        return [self._process_section_lines(file_path, start_line, lines, result_format)]
+
+    def _open_cache(self, cache: Union[SectionCache, str, None], split_at: str
+                    ) -> Tuple[Optional[SectionCache], Optional[str]]:
+        '''
+        The SectionCache for a cache argument (a SectionCache or a directory), and the key prefix of its chunks.
+        '''
+        if cache is None:
+            return None, None
+        if not isinstance(cache, SectionCache):
+            cache = SectionCache(cache)
+        return cache, spec_fingerprint(self) + seed_fingerprint(self, split_at)
+
+    def _process_chunk_cached(self, cache: SectionCache, key_prefix: str, file_path: str, start_line: int,
+                              lines: List[str], result_format: str,
+                              split_at: str) -> List[Union[Dict[str, Any], Section]]:
+        key = cache.chunk_key(key_prefix, lines)
+        sections = cache.get(key, start_line)
+        if sections is None:
+            sections = self._process_chunk(file_path, start_line, lines, PyReParse.RESULT_DICTS, split_at)
+            cache.put(key, start_line, sections)
+        elif self.metrics is not None:
+            self.metrics.merge({'lines': len(lines), 'bytes': sum(map(len, lines))})
+        if result_format == PyReParse.RESULT_RECORDS:
+            return [Section(sec['section_start'],
+                            [make_record(item['match_def'], item['fields']) for item in sec['fields_list']],
+                            sec['totals'], sec['valid'])
+                    for sec in sections]
         return sections
 
-    def parse_file_parallel(self, file_path: str, max_workers: int = 4, parallel_depth: int = 1) -> List[Dict[str, Any]]:
+    def parse_file(self, file_path: str, memory_budget: Optional[int] = None, spill_dir: Optional[str] = None,
+                   result_format: str = RESULT_DICTS, split_at: str = SPLIT_SECTIONS,
+                   cache: Union[SectionCache, str, None] = None,
+                   encoding: Optional[str] = None) -> Union[List[Dict[str, Any]], SpillingSections]:
+        """
+        Serial parsing returning same format as parse_file_parallel(depth=0).
+        The file may be gzip, bz2 or xz compressed.
+
+        :param memory_budget: When given, sections beyond this many bytes (estimated) are spilled to a temporary
+                              file, and a lazy, re-iterable SpillingSections is returned instead of a list.
+                              Its peak_memory and peak_rss attributes report the peak memory use.
+        :param spill_dir: Directory for the spill file (default: the system temp directory).
+        :param result_format: RESULT_DICTS (default), or RESULT_RECORDS for compact records.Section sections
+                              holding per-pattern __slots__ records (see records.py).
+        :param split_at: SPLIT_SECTIONS (default) parses each section with fresh counters. SPLIT_REPORTS parses
+                         each report (FLAG_NEW_REPORT) with fresh counters, so <REPORT_LINE> and the report
+                         states are report-level, as in parse_file_stream().
+        :param cache: A cache.SectionCache, or a cache directory, to return the cached sections of chunks parsed
+                      before (with the same patterns) instead of parsing them again. The callbacks of cached
+                      chunks are not run. Evicted (see SectionCache) after the parse.
+        :param encoding: The file's encoding, e.g. 'cp037' or 'cp500' (EBCDIC) or 'cp1252' (default: the locale's).
+                         Decoded in blocks, see inputs.py.
+        """
+        self._check_result_format(result_format)
+        self._check_split_at(split_at)
+        cache, key_prefix = self._open_cache(cache, split_at)
+        process_chunk = self._process_chunk
+        if cache is not None:
+            process_chunk = partial(self._process_chunk_cached, cache, key_prefix)
+        if self.metrics is not None:
+            self.metrics.add_expected(input_size(file_path))
+        sections = [] if memory_budget is None else SpillingSections(memory_budget, spill_dir=spill_dir)
+        for start, lines in self._iter_chunks(file_path, split_at, encoding):
+            for sec in process_chunk(file_path, start, lines, result_format, split_at):
+                sections.append(sec)
+        if memory_budget is not None:
+            sections.finish()
+        if cache is not None:
+            cache.evict()
+        return sections
+
+    def parse_file_parallel(self, file_path: str, max_workers: int = 4, parallel_depth: int = 1,
+                            memory_budget: Optional[int] = None, spill_dir: Optional[str] = None,
+                            result_format: str = RESULT_DICTS, split_at: str = SPLIT_SECTIONS,
+                            backend: str = BACKEND_THREADS, cache: Union[SectionCache, str, None] = None,
+                            encoding: Optional[str] = None) -> Union[List[Dict[str, Any]], SpillingSections, SharedSections]:
         """
         Parse the entire file in parallel by dividing it into section chunks and processing them concurrently.
         Currently supports top-level sections (parallel_depth=1). Higher depths are stubbed for future recursion.
+        With split_at=SPLIT_REPORTS the chunks are whole reports instead, which are always independent.
+
+        The file is read once, and each section chunk is submitted as soon as it is complete, so no byte
+        offsets are needed and the file may be gzip, bz2 or xz compressed.
 
         :param file_path: Path to the file to parse.
         :param max_workers: Maximum number of worker threads to use.
         :param parallel_depth: Depth of parallelism (1 for top-level sections only).
-        :return: List of dictionaries, each representing parsed data for a section.
+        :param memory_budget: Spill sections to disk beyond this many bytes, see parse_file(). The number of
+                              section chunks in flight is also bounded (to 2 * max_workers), so the file is not
+                              read ahead of the workers.
+        :param spill_dir: Directory for the spill file.
+        :param result_format: RESULT_DICTS or RESULT_RECORDS, see parse_file().
+        :param split_at: SPLIT_SECTIONS or SPLIT_REPORTS, see parse_file().
+        :param backend: BACKEND_THREADS (default), or BACKEND_PROCESSES to parse on worker processes, which write
+                        their sections into shared memory columns (see columnar.py) instead of pickling them.
+                        A lazy SharedSections sequence mapping those columns is returned; close() it to free
+                        the shared memory (also done on garbage collection). The patterns, callbacks included,
+                        must be picklable, and callbacks run in the worker processes. Not combinable with
+                        memory_budget or cache.
+        :param cache: A SectionCache or cache directory, see parse_file().
+        :param encoding: The file's encoding, see parse_file(). The file is decoded by the reading thread.
+        :return: List of dictionaries, each representing parsed data for a section
+                 (a SpillingSections when memory_budget is given, a SharedSections for BACKEND_PROCESSES).
         """
         if parallel_depth > 1:
             raise NotImplementedError("TODO: Recurse into subsections for parallel_depth > 1")
 
         if not hasattr(self, 'raw_patterns'):
             raise ValueError("Patterns must be loaded first using load_re_lines()")
-
-        boundaries = self._find_section_boundaries(file_path)
+        self._check_result_format(result_format)
+        self._check_split_at(split_at)
+
+        if backend == PyReParse.BACKEND_PROCESSES:
+            if memory_budget is not None:
+                raise ValueError('memory_budget is not supported with backend=PyReParse.BACKEND_PROCESSES')
+            if self.line_guard is not None:
+                raise ValueError('set_line_guard() is not supported with backend=PyReParse.BACKEND_PROCESSES')
+            if cache is not None:
+                raise ValueError('cache is not supported with backend=PyReParse.BACKEND_PROCESSES')
+            if self.tracer is not None:
+                raise ValueError('start_trace() is not supported with backend=PyReParse.BACKEND_PROCESSES')
+            if self.metrics is not None:
+                self.metrics.add_expected(input_size(file_path))
+            return self._parse_file_processes(file_path, max_workers, result_format, split_at, encoding)
+        if backend != PyReParse.BACKEND_THREADS:
+            raise ValueError(f"Unknown backend '{backend}', use PyReParse.BACKEND_THREADS or "
+                             f"PyReParse.BACKEND_PROCESSES.")
+
+        cache, key_prefix = self._open_cache(cache, split_at)
+        process_chunk = self._process_chunk
+        if cache is not None:
+            process_chunk = partial(self._process_chunk_cached, cache, key_prefix)
+        if self.metrics is not None:
+            self.metrics.add_expected(input_size(file_path))
+
+        if memory_budget is not None:
+            sections = SpillingSections(memory_budget, spill_dir=spill_dir)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                in_flight = deque()
+                for s, lines in self._iter_chunks(file_path, split_at, encoding):
+                    in_flight.append(executor.submit(process_chunk, file_path, s, lines, result_format, split_at))
+                    if len(in_flight) >= 2 * max_workers:
+                        for sec in in_flight.popleft().result():
+                            sections.append(sec)
+                while in_flight:
+                    for sec in in_flight.popleft().result():
+                        sections.append(sec)
+            if cache is not None:
+                cache.evict()
+            return sections.finish()
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             futures = [
-                executor.submit(self._process_section_chunk, file_path, s, e)
-                for s, e in boundaries
+                executor.submit(process_chunk, file_path, s, lines, result_format, split_at)
+                for s, lines in self._iter_chunks(file_path, split_at, encoding)
             ]
-            sections = [future.result() for future in futures]
+            sections = [sec for future in futures for sec in future.result()]
 
         sections.sort(key=lambda x: x['section_start'])
+        if cache is not None:
+            cache.evict()
         return sections
 
-    def stream_matches(self, file_path: str, callback=None) -> Optional[Iterator[Tuple[List[str], Dict[str, Any]]]]:
+    def _iter_chunk_batches(self, file_path: str, split_at: str,
+                            encoding: Optional[str] = None) -> Iterator[List[Tuple[int, List[str]]]]:
+        batch = []
+        batch_lines = 0
+        for start, lines in self._iter_chunks(file_path, split_at, encoding):
+            batch.append((start, lines))
+            batch_lines += len(lines)
+            if batch_lines >= self.PROCESS_BATCH_LINES:
+                yield batch
+                batch = []
+                batch_lines = 0
+        if batch:
+            yield batch
+
+    def _parse_file_processes(self, file_path: str, max_workers: int, result_format: str,
+                              split_at: str, encoding: Optional[str] = None) -> SharedSections:
+        """
+        parse_file_parallel(backend=BACKEND_PROCESSES): Batches of chunks are parsed by worker processes, each
+        batch's sections are returned as a shared memory block of columns, mapped in order by the result.
+        """
+        # Workers must share our resource tracker, or theirs would unlink the blocks when the workers exit.
+        resource_tracker.ensure_running()
+        blocks = []
+        futures = []
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_process_worker_init,
+                                     initargs=(self.raw_patterns, self.use_counter_windows)) as executor:
+                futures = [executor.submit(_process_worker_task, file_path, batch, split_at, self.metrics is not None)
+                           for batch in self._iter_chunk_batches(file_path, split_at, encoding)]
+                for future in futures:
+                    block, counts = future.result()
+                    blocks.append(ColumnarSections(block, result_format))
+                    if counts is not None:
+                        self.metrics.merge(counts)
+        except BaseException:
+            for block in blocks:
+                block.close()
+            for future in futures[len(blocks):]:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    ColumnarSections(future.result()[0]).close()
+            raise
+        return SharedSections(blocks)
+
+    def _is_new_section(self, match_def: List[str]) -> bool:
+        return any(self.re_defs[pat].get(self.INDEX_RE_FLAGS, 0) & self.FLAG_NEW_SECTION for pat in match_def)
+
+    def _is_new_report(self, match_def: List[str]) -> bool:
+        return any(self.re_defs[pat].get(self.INDEX_RE_FLAGS, 0) & self.FLAG_NEW_REPORT for pat in match_def)
+
+    def _resume(self, checkpointer: Checkpointer) -> Tuple[int, int, Optional[Dict[str, Any]]]:
+        """
+        Restore the parser (and sink) from the checkpoint file, if there is one.
+        :return: (byte_offset, line_num, in_progress_section)
+        """
+        ckpt = checkpointer.load()
+        if ckpt is None:
+            self.report_reset()
+            self.input_line_count = 0
+            return 0, 0, None
+        self.set_state(ckpt['parser'])
+        if checkpointer.sink is not None and ckpt['sink'] is not None:
+            checkpointer.sink.set_position(ckpt['sink'])
+        section = ckpt['section']
+        if section is not None:
+            # The in-progress section shares its totals with the parser, as in parse_file_stream_from().
+            section['totals'] = self.section_totals
+        return ckpt['offset'], ckpt['line_num'], section
+
+    def stream_matches(self, file_path: str, callback=None, checkpoint_path: Optional[str] = None,
+                       checkpoint_every: int = 1, encoding: Optional[str] = None) -> Optional[Iterator[Tuple[List[str], Dict[str, Any]]]]:
         """
         Stream individual matches from the file, yielding (match_def, fields) or calling callback.
+        The file may be gzip, bz2 or xz compressed.
+
+        :param checkpoint_path: When given, the parser state is saved to this file every checkpoint_every
+                                section boundaries (FLAG_NEW_SECTION matches), and a run that finds the file
+                                resumes from it. If the callback is a sink (see pyreparse.sinks), its positions
+                                are saved too, and output written after the checkpoint is truncated on resume.
+                                The checkpoint file is removed when the run completes.
+        :param checkpoint_every: Number of section boundaries between checkpoints.
+        :param encoding: The file's encoding, see parse_file().
         """
+        if checkpoint_path is None:
+            yield from self.stream_matches_from(file_path, callback=callback, encoding=encoding)
+            return
+
+        checkpointer = Checkpointer(checkpoint_path, file_path, every=checkpoint_every, sink=find_sink(callback))
         self.set_file_name(file_path)
+        offset, line_num, _ = self._resume(checkpointer)
+        lines = iter_lines_at(file_path, offset, encoding=encoding)
+        for n_bytes, line in self._metered_at(lines, file_path, offset):
+            offset += n_bytes
+            line_num += 1
+            m, flds = self.match(line.rstrip('\n'))
+            if callback:
+                callback(m, flds)
+            else:
+                yield m, flds
+            if m and self._is_new_section(m):
+                checkpointer.boundary(self, offset, line_num)
+        self.flush_batches()
+        checkpointer.remove()
+
+    def stream_matches_from(self, source, callback=None,
+                            encoding: Optional[str] = None) -> Optional[Iterator[Tuple[List[str], Dict[str, Any]]]]:
+        """
+        Source-agnostic stream_matches(): yields (match_def, fields) for each line, or calls callback.
+
+        :param source: A file path, a text or binary file object (stdin, a pipe, a socket's makefile('rb'),
+                       an mmap...), or an iterable of str or bytes lines. See inputs.open_lines().
+        :param callback: Optional callback(match_def, fields).
+        :param encoding: The encoding of a file path or binary source (default: the locale's for files, utf-8
+                         for bytes lines).
+        """
+        self.set_file_name(source_name(source))
         self.report_reset()
-        with open(file_path, 'r') as f:
-            for line in f:
+        self.input_line_count = 0
+        with open_lines(source, encoding=encoding) as f:
+            for line in self._metered(f, source):
                 m, flds = self.match(line.rstrip('\n'))
                 if callback:
                     callback(m, flds)
                 else:
                     yield m, flds
+        self.flush_batches()
 
-    def parse_file_stream(self, file_path: str, callback=None) -> Optional[Iterator[Dict[str, Any]]]:
+    def parse_file_stream(self, file_path: str, callback=None, checkpoint_path: Optional[str] = None,
+                          checkpoint_every: int = 1, result_format: str = RESULT_DICTS,
+                          encoding: Optional[str] = None) -> Optional[Iterator[Dict[str, Any]]]:
         """
         Streamingly parse file into sections dynamically, yielding sections or calling callback.
+        The file may be gzip, bz2 or xz compressed.
+
+        :param checkpoint_path: Save/resume checkpoints to/from this file, see stream_matches().
+                                The section in progress at the checkpoint is saved with it.
+        :param checkpoint_every: Number of section boundaries between checkpoints.
+        :param result_format: RESULT_DICTS or RESULT_RECORDS, see parse_file().
+                              Checkpoints require RESULT_DICTS.
+        :param encoding: The file's encoding, see parse_file().
         """
+        if checkpoint_path is None:
+            yield from self.parse_file_stream_from(file_path, callback=callback, result_format=result_format,
+                                                   encoding=encoding)
+            return
+        if result_format != PyReParse.RESULT_DICTS:
+            raise ValueError('checkpoint_path requires result_format=PyReParse.RESULT_DICTS')
+
+        checkpointer = Checkpointer(checkpoint_path, file_path, every=checkpoint_every, sink=find_sink(callback))
+        self.set_file_name(file_path)
+        offset, line_num, current_sec = self._resume(checkpointer)
+        lines = iter_lines_at(file_path, offset, encoding=encoding)
+        for n_bytes, line in self._metered_at(lines, file_path, offset):
+            offset += n_bytes
+            line_num += 1
+            m, flds = self.match(line.rstrip('\n'))
+            if m:
+                done_sec, current_sec = self._section_step(current_sec, line_num, m, flds)
+                if done_sec is not None:
+                    if callback:
+                        callback(done_sec)
+                    else:
+                        yield done_sec
+                if self._is_new_section(m):
+                    checkpointer.boundary(self, offset, line_num, current_sec)
+        self.flush_batches()
+        if current_sec is not None:
+            if callback:
+                callback(current_sec)
+            else:
+                yield current_sec
+        checkpointer.remove()
+
+    def _follow_setup(self, file_path: str, callback, state_path: Optional[str]):
         self.set_file_name(file_path)
+        sink = find_sink(callback)
+        checkpointer = None
+        if state_path is not None:
+            checkpointer = Checkpointer(state_path, file_path, sink=sink)
+            return sink, checkpointer, self._resume(checkpointer)
+        self.report_reset()
+        self.input_line_count = 0
+        return sink, checkpointer, (0, 0, None)
+
+    def follow_matches(self, file_path: str, callback=None, state_path: Optional[str] = None,
+                       poll_interval: float = DEFAULT_POLL_INTERVAL, idle_timeout: Optional[float] = None,
+                       stop_event=None, use_inotify: bool = True,
+                       encoding: Optional[str] = None) -> Optional[Iterator[Tuple[List[str], Dict[str, Any]]]]:
+        """
+        Follow (tail) a growing file, yielding (match_def, fields) or calling callback for each line as it is
+        appended. Waits for new lines with inotify where available, else by polling the file size.
+        A partial trailing line is only matched once its newline has been written.
+
+        :param state_path: When given, the offset and parser state are saved to this file whenever all available
+                           lines have been processed, and a later follow of the same file resumes from it, so only
+                           new lines are matched. If the callback is a sink, it is flushed and its position saved.
+        :param poll_interval: Seconds between file size polls (the longest wait when inotify is used).
+        :param idle_timeout: Stop after this many seconds without new lines. None follows until stop_event is set.
+        :param stop_event: A threading.Event that stops following when set.
+        :param use_inotify: Set False to always poll.
+        :param encoding: The file's encoding, see parse_file().
+        """
+        sink, checkpointer, (offset, line_num, _) = self._follow_setup(file_path, callback, state_path)
+
+        def on_idle():
+            self.flush_batches()
+            if checkpointer is not None:
+                checkpointer.save(self, offset, line_num)
+            elif sink is not None:
+                sink.flush()
+
+        def on_truncate():
+            nonlocal offset, line_num
+            offset, line_num = 0, 0
+            self.flush_batches()
+            self.report_reset()
+            self.input_line_count = 0
+
+        lines = follow_lines(file_path, offset, poll_interval=poll_interval, idle_timeout=idle_timeout,
+                             stop_event=stop_event, on_idle=on_idle, on_truncate=on_truncate, encoding=encoding,
+                             use_inotify=use_inotify)
+        for n_bytes, line in self._metered_at(lines):
+            offset += n_bytes
+            line_num += 1
+            m, flds = self.match(line.rstrip('\n'))
+            if callback:
+                callback(m, flds)
+            else:
+                yield m, flds
+        self.flush_batches()
+
+    def follow_file_stream(self, file_path: str, callback=None, state_path: Optional[str] = None,
+                           poll_interval: float = DEFAULT_POLL_INTERVAL, idle_timeout: Optional[float] = None,
+                           stop_event=None, use_inotify: bool = True,
+                           encoding: Optional[str] = None) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        Follow (tail) a growing file, yielding sections or calling callback(section) as sections complete.
+        A section is complete when the next section starts (a FLAG_NEW_SECTION match).
+
+        When following stops, the section in progress is yielded, unless state_path is given, in which case it
+        is saved with the state and continued by the next follow of the file.
+        Parameters are as for follow_matches().
+        """
+        sink, checkpointer, (offset, line_num, current_sec) = self._follow_setup(file_path, callback, state_path)
+
+        def on_idle():
+            self.flush_batches()
+            if checkpointer is not None:
+                checkpointer.save(self, offset, line_num, current_sec)
+            elif sink is not None:
+                sink.flush()
+
+        def on_truncate():
+            nonlocal offset, line_num, current_sec
+            offset, line_num, current_sec = 0, 0, None
+            self.flush_batches()
+            self.report_reset()
+            self.input_line_count = 0
+
+        lines = follow_lines(file_path, offset, poll_interval=poll_interval, idle_timeout=idle_timeout,
+                             stop_event=stop_event, on_idle=on_idle, on_truncate=on_truncate, encoding=encoding,
+                             use_inotify=use_inotify)
+        for n_bytes, line in self._metered_at(lines):
+            offset += n_bytes
+            line_num += 1
+            m, flds = self.match(line.rstrip('\n'))
+            if m:
+                done_sec, current_sec = self._section_step(current_sec, line_num, m, flds)
+                if done_sec is not None:
+                    if callback:
+                        callback(done_sec)
+                    else:
+                        yield done_sec
+        self.flush_batches()
+        if current_sec is not None and checkpointer is None:
+            if callback:
+                callback(current_sec)
+            else:
+                yield current_sec
+
+    def _section_step(self, current_sec: Optional[Dict[str, Any]], line_num: int, m: List[str],
+                      flds: Dict[str, Any], result_format: str = RESULT_DICTS
+                      ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Add a match to the current section of a streamed parse, starting a new section on FLAG_NEW_SECTION.
+        A FLAG_NEW_REPORT match ends the current section: report lines before the report's first section belong
+        to no section, like the lines before the first section of a file.
+        :return: (completed_section or None, current_section)
+        """
+        done_sec = None
+        new_section = self._is_new_section(m)
+        if new_section or (self.report_boundaries and self._is_new_report(m)):
+            done_sec = current_sec
+            current_sec = None
+        if new_section:
+            current_sec = self._new_section(line_num, self.section_totals, result_format)
+        if current_sec is not None:
+            current_sec['fields_list'].append(self._new_item(m, flds, result_format))
+            current_sec['valid'] = self.section_valid
+        return done_sec, current_sec
+
+    def parse_file_stream_from(self, source, callback=None, result_format: str = RESULT_DICTS,
+                               encoding: Optional[str] = None) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        Source-agnostic parse_file_stream(): yields sections, or calls callback(section).
+
+        :param source: A file path, a text or binary file object, or an iterable of str or bytes lines.
+                       See inputs.open_lines().
+        :param callback: Optional callback(section).
+        :param result_format: RESULT_DICTS or RESULT_RECORDS, see parse_file().
+        :param encoding: The encoding of a file path or binary source, see stream_matches_from().
+        """
+        self._check_result_format(result_format)
+        self.set_file_name(source_name(source))
         self.report_reset()
+        self.input_line_count = 0
         current_sec = None
-        with open(file_path, 'r') as f:
-            for line_num, line in enumerate(f, 1):
+        with open_lines(source, encoding=encoding) as f:
+            for line_num, line in enumerate(self._metered(f, source), 1):
                 m, flds = self.match(line.rstrip('\n'))
                 if m:
-                    is_new_section = any(
-                        self.re_defs[pat].get(self.INDEX_RE_FLAGS, 0) & self.FLAG_NEW_SECTION
-                        for pat in m
-                    )
-                    if is_new_section:
-                        if current_sec is not None:
-                            if callback:
-                                callback(current_sec)
-                            else:
-                                yield current_sec
-                        current_sec = {
-                            'section_start': line_num,
-                            'fields_list': [],
-                            'totals': {},
-                            'valid': True
-                        }
-                    if current_sec is not None:
-                        current_sec['fields_list'].append({
-                            'match_def': m,
-                            'fields': flds.copy()
-                        })
+                    done_sec, current_sec = self._section_step(current_sec, line_num, m, flds, result_format)
+                    if done_sec is not None:
+                        if callback:
+                            callback(done_sec)
+                        else:
+                            yield done_sec
+        self.flush_batches()
         if current_sec is not None:
             if callback:
                 callback(current_sec)
             else:
                 yield current_sec
+
+    async def astream_matches(self, source, callback: Optional[Callable] = None,
+                              max_pending: int = DEFAULT_MAX_PENDING, encoding: Optional[str] = None
+                              ) -> AsyncIterator[Tuple[Optional[List[str]], Dict[str, Any]]]:
+        """
+        Asyncio stream_matches_from(): an async iterator of (match_def, fields) for each line, or, with a
+        callback, callback(match_def, fields) is called for each line (iterate the result to run the parse).
+
+        A coroutine callback is scheduled as a task, and the parse continues while it runs. When max_pending
+        callback tasks are outstanding, the parse waits for one to complete before reading on (backpressure).
+        Tasks complete in any order; use max_pending=1 to await each callback before the next line. All tasks
+        have completed when the iteration ends. If a callback raises, the parse stops, the outstanding tasks are
+        cancelled and the exception is raised.
+
+        Pattern callbacks (INDEX_RE_CALLBACK, INDEX_RE_BATCH_CALLBACK) are still called synchronously by match().
+
+        :param source: An asyncio.StreamReader, an async iterable of str or bytes lines, or any source
+                       stream_matches_from() accepts (read on the default executor). See aio.py.
+        :param callback: Optional callback(match_def, fields), a function or a coroutine function.
+        :param max_pending: Maximum number of outstanding callback tasks.
+        :param encoding: The encoding of a file path, binary source or StreamReader (default: the locale's for
+                         files, utf-8 for StreamReaders and bytes lines).
+        """
+        self.set_file_name(source_name(source))
+        self.report_reset()
+        self.input_line_count = 0
+        dispatcher = AsyncDispatcher(callback, max_pending) if callback else None
+        lines = aiter_lines(source, encoding=encoding)
+        if self.metrics is not None:
+            self.metrics.add_expected(input_size(source))
+            lines = self.metrics.ametered(self, lines)
+        try:
+            async for line in lines:
+                m, flds = self.match(line.rstrip('\n'))
+                if dispatcher:
+                    await dispatcher.call(m, flds)
+                else:
+                    yield m, flds
+            self.flush_batches()
+            if dispatcher:
+                await dispatcher.drain()
+        except BaseException:
+            if dispatcher:
+                await dispatcher.cancel()
+            raise
+        finally:
+            await lines.aclose()
+
+    async def aparse_file_stream(self, source, callback: Optional[Callable] = None,
+                                 max_pending: int = DEFAULT_MAX_PENDING, result_format: str = RESULT_DICTS,
+                                 encoding: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Asyncio parse_file_stream_from(): an async iterator of sections, or, with a callback, callback(section)
+        is called for each section. Coroutine callbacks, max_pending and errors are handled as by
+        astream_matches().
+
+        :param source: An asyncio.StreamReader, an async iterable of lines, or any parse_file_stream_from()
+                       source.
+        :param callback: Optional callback(section), a function or a coroutine function.
+        :param max_pending: Maximum number of outstanding callback tasks.
+        :param result_format: RESULT_DICTS or RESULT_RECORDS, see parse_file().
+        :param encoding: The source's encoding, see astream_matches().
+        """
+        self._check_result_format(result_format)
+        self.set_file_name(source_name(source))
+        self.report_reset()
+        self.input_line_count = 0
+        dispatcher = AsyncDispatcher(callback, max_pending) if callback else None
+        lines = aiter_lines(source, encoding=encoding)
+        if self.metrics is not None:
+            self.metrics.add_expected(input_size(source))
+            lines = self.metrics.ametered(self, lines)
+        current_sec = None
+        line_num = 0
+        try:
+            async for line in lines:
+                line_num += 1
+                m, flds = self.match(line.rstrip('\n'))
+                if m:
+                    done_sec, current_sec = self._section_step(current_sec, line_num, m, flds, result_format)
+                    if done_sec is not None:
+                        if dispatcher:
+                            await dispatcher.call(done_sec)
+                        else:
+                            yield done_sec
+            self.flush_batches()
+            if current_sec is not None:
+                if dispatcher:
+                    await dispatcher.call(current_sec)
+                else:
+                    yield current_sec
+            if dispatcher:
+                await dispatcher.drain()
+        except BaseException:
+            if dispatcher:
+                await dispatcher.cancel()
+            raise
+        finally:
+            await lines.aclose()
+
+
+# Worker process state of parse_file_parallel(backend=BACKEND_PROCESSES): the patterns are loaded once per process.
+_worker_prp: Optional[PyReParse] = None
+
+
+def _process_worker_init(raw_patterns: Dict[str, Any], use_counter_windows: bool) -> None:
+    global _worker_prp
+    _worker_prp = PyReParse(raw_patterns)
+    _worker_prp.use_counter_windows = use_counter_windows
+
+
+def _process_worker_task(file_path: str, chunks: List[Tuple[int, List[str]]], split_at: str,
+                         metered: bool = False) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    # With metrics, the batch's counts are returned with its sections, and merged by the parent.
+    _worker_prp.metrics = ParseMetrics() if metered else None
+    writer = ColumnarWriter()
+    for start, lines in chunks:
+        for sec in _worker_prp._process_chunk(file_path, start, lines, PyReParse.RESULT_DICTS, split_at):
+            writer.append(sec)
+    counts = _worker_prp.metrics.counts() if metered else None
+    return writer.to_shared_memory(), counts
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+'''
+Command line tools: python -m pyreparse <command> ...
+
+  profile   Profile a patterns spec over a report file (see profiling.py).
+  risk      Check the regexps of a patterns spec for catastrophic backtracking (see re_risk.py).
+  trace     Filter and print a binary trace recorded with PyReParse.start_trace() (see trace.py).
+'''
+
+import argparse
+import sys
+
+from . import profiling, re_risk, trace
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m pyreparse', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    profiling.add_parser(subparsers)
+    re_risk.add_parser(subparsers)
+    trace.add_parser(subparsers)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
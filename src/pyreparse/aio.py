@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+'''
+Asyncio support for astream_matches() / aparse_file_stream().
+
+aiter_lines() turns a line source into an async iterator of str lines...
+  - An asyncio.StreamReader (or any object with a coroutine readline()): Lines are awaited, and decoded with
+    encoding (default utf-8).
+  - An async iterable of str or bytes lines.
+  - Anything open_lines() accepts (a file path, compressed files included, a file object or an iterable): Blocks
+    of lines are read on the default executor, the next block being read while the current one is matched, so
+    file I/O never blocks the event loop.
+
+Matching itself runs on the event loop thread. aiter_lines() yields control to the loop every YIELD_EVERY lines,
+so callback coroutines make progress while a file is parsed.
+
+AsyncDispatcher calls the stream callback: plain functions are called, coroutine functions (or callbacks
+returning an awaitable) are scheduled as tasks. At most max_pending tasks are outstanding; when the limit is
+reached, the parse waits for one to complete. A slow sink thus slows down the reader instead of queueing
+results in memory.
+'''
+
+import asyncio
+import inspect
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Optional
+
+from .inputs import DEFAULT_BLOCK_SIZE, decode_line, open_lines
+
+DEFAULT_MAX_PENDING = 16  # Outstanding callback coroutines.
+LINES_PER_READ = 4096     # Lines read per executor call.
+YIELD_EVERY = 1024        # Lines matched between yields to the event loop.
+
+
+async def _aiter_source(source, encoding: Optional[str], block_size: int) -> AsyncIterator[str]:
+    readline = getattr(source, 'readline', None)
+    if readline is not None and inspect.iscoroutinefunction(readline):
+        encoding = encoding or 'utf-8'
+        while True:
+            raw = await readline()
+            if not raw:
+                return
+            yield decode_line(raw, encoding) if isinstance(raw, (bytes, bytearray)) else raw
+    elif hasattr(source, '__aiter__'):
+        async for line in source:
+            yield line.decode(encoding or 'utf-8') if isinstance(line, (bytes, bytearray)) else line
+    else:
+        loop = asyncio.get_running_loop()
+        opened = open_lines(source, encoding=encoding, block_size=block_size)
+        f = await loop.run_in_executor(None, opened.__enter__)
+        next_block = None
+        try:
+            it = iter(f)
+            next_block = loop.run_in_executor(None, list, islice(it, LINES_PER_READ))
+            while True:
+                block = await next_block
+                if not block:
+                    return
+                # Read ahead while this block is matched.
+                next_block = loop.run_in_executor(None, list, islice(it, LINES_PER_READ))
+                for line in block:
+                    yield line
+        finally:
+            if next_block is not None and not next_block.done():
+                # Stopped early: let the read ahead finish before the file is closed.
+                await asyncio.wait([next_block])
+            await loop.run_in_executor(None, opened.__exit__, None, None, None)
+
+
+async def aiter_lines(source, encoding: Optional[str] = None,
+                      block_size: int = DEFAULT_BLOCK_SIZE) -> AsyncIterator[str]:
+    '''
+    Iterate any line source (see the module docstring) as str lines, yielding to the event loop every YIELD_EVERY
+    lines.
+    '''
+    count = 0
+    lines = _aiter_source(source, encoding, block_size)
+    try:
+        async for line in lines:
+            yield line
+            count += 1
+            if count == YIELD_EVERY:
+                count = 0
+                await asyncio.sleep(0)
+    finally:
+        await lines.aclose()  # Closes a file opened for source, also when the caller stops early.
+
+
+class AsyncDispatcher:
+    '''
+    Calls a stream callback, keeping at most max_pending of its coroutines outstanding (see the module docstring).
+    The first exception raised by a callback is raised by the next call(), or by drain(). After an exception,
+    cancel() the remaining coroutines.
+
+    :param callback: A function or coroutine function.
+    :param max_pending: Maximum number of outstanding callback coroutines.
+    '''
+
+    def __init__(self, callback: Callable[..., Any], max_pending: int = DEFAULT_MAX_PENDING):
+        if max_pending < 1:
+            raise ValueError('max_pending must be >= 1')
+        self.callback = callback
+        self.max_pending = max_pending
+        self.pending = set()
+        self.peak_pending = 0
+
+    async def _wait(self, return_when) -> None:
+        done, self.pending = await asyncio.wait(self.pending, return_when=return_when)
+        # Retrieve every done task's exception (else the loop reports them as never retrieved), raise the first.
+        errors = [task.exception() for task in done if not task.cancelled()]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    async def call(self, *args) -> None:
+        result = self.callback(*args)
+        if inspect.isawaitable(result):
+            self.pending.add(asyncio.ensure_future(result))
+            self.peak_pending = max(self.peak_pending, len(self.pending))
+            if len(self.pending) >= self.max_pending:
+                await self._wait(asyncio.FIRST_COMPLETED)
+
+    async def drain(self) -> None:
+        '''
+        Wait for all outstanding callback coroutines.
+        '''
+        if self.pending:
+            await self._wait(asyncio.ALL_COMPLETED)
+
+    async def cancel(self) -> None:
+        '''
+        Cancel the outstanding callback coroutines, and wait for them to finish.
+        '''
+        pending, self.pending = self.pending, set()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
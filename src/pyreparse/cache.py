@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+'''
+Content-addressed section cache for parse_file() / parse_file_parallel() (cache=...).
+
+Archives are often re-parsed after a few reports were added or corrected. Each chunk (a section, or a report with
+split_at=SPLIT_REPORTS) is parsed from the same entry state: the fresh state of PyReParse.clone(). So the sections
+a chunk yields only depend on...
+  - The chunk's text.
+  - The compiled spec: the raw patterns (regexps, flags, triggers, sum checks, ...), with callbacks identified by
+    their qualified name and code, and the line guard's max_line_length.
+  - The seed state: the clone's entry state (get_state(), without the input line number) and split_at.
+
+SectionCache stores the sections of each chunk in one file named by the hash of all of these, so an unchanged
+chunk is not parsed again, wherever it moved to in the file. The chunk's line number is not part of the key:
+section_start is stored relative to the chunk, and rebased on a hit.
+
+Cached sections are returned as parsed the first time, without running the chunk's callbacks, quick check
+warnings or line guard sinks again. Changing a callback's code changes the key, but not changing what it reads
+(e.g. globals), so use the cache with callbacks that only transform the fields they are given.
+
+Sections are cached in the dicts format (records are rebuilt from them with RESULT_RECORDS), pickled and zlib
+compressed, and written atomically. evict() removes entries older than max_age seconds, then the least recently
+used entries (hits refresh an entry's mtime) until the cache holds at most max_bytes. parse_file() /
+parse_file_parallel() call it after each parse.
+'''
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.sections'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+
+def _callable_id(func) -> str:
+    '''
+    A stable identity for a callable: its qualified name, plus a hash of its code when it has any.
+    '''
+    name = f'{getattr(func, "__module__", "")}.{getattr(func, "__qualname__", type(func).__qualname__)}'
+    code = getattr(getattr(func, '__func__', func), '__code__', None)
+    if code is None:
+        return name
+    digest = hashlib.sha256(code.co_code + repr(code.co_consts).encode() + repr(code.co_names).encode())
+    return f'{name}:{digest.hexdigest()[:16]}'
+
+
+def _canonical(value):
+    if callable(value):
+        return _callable_id(value)
+    if isinstance(value, dict):
+        return {str(key): _canonical(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_canonical(val) for val in value]
+        return sorted(items, key=repr) if isinstance(value, (set, frozenset)) else items
+    return value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+
+
+def spec_fingerprint(prp) -> str:
+    '''
+    The hash of a PyReParse instance's compiled spec: everything loaded from the patterns that affects the
+    sections of a chunk.
+    '''
+    guard = prp.line_guard
+    spec = {
+        'version': CACHE_VERSION,
+        'patterns': _canonical(prp.raw_patterns),
+        'max_line_length': guard.max_line_length if guard is not None else None,
+        'reject_sink': _callable_id(guard.reject_sink) if guard is not None and guard.reject_sink else None,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def seed_fingerprint(prp, split_at: str) -> str:
+    '''
+    The hash of the entry state chunks are parsed from (a fresh clone) and split_at.
+    '''
+    state = prp.clone().get_state()
+    del state['input_line_count']  # The chunk's line number, which section_start is rebased on.
+    seed = {'state': state, 'split_at': split_at}
+    return hashlib.sha256(json.dumps(seed, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+class SectionCache:
+    '''
+    An on-disk cache of the sections of chunks, see the module docstring.
+
+    Attributes reported after a parse (cumulative): hits, misses, stored_bytes and evicted (entries removed).
+
+    :param cache_dir: Directory of the cache files (created if needed). Several parsers, processes included,
+                      may share it.
+    :param max_bytes: Size (bytes) the cache is evicted down to, None for no limit.
+    :param max_age: Seconds an entry is kept after its last use, None for no limit.
+    '''
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+                 max_age: Optional[float] = DEFAULT_MAX_AGE):
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError('max_bytes must be >= 0')
+        if max_age is not None and max_age < 0:
+            raise ValueError('max_age must be >= 0')
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.stored_bytes = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def chunk_key(prefix: str, lines: List[str]) -> str:
+        '''
+        The key of a chunk: the hash of its text, and the spec and seed fingerprints (prefix).
+        '''
+        digest = hashlib.sha256(prefix.encode())
+        digest.update(''.join(lines).encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key: str, start_line: int) -> Optional[List[Dict[str, Any]]]:
+        '''
+        The cached (dict format) sections of a chunk, rebased on start_line, or None.
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fh:
+                sections = pickle.loads(zlib.decompress(fh.read()))
+            os.utime(path)
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            # Missing, or evicted / truncated by another process meanwhile: parse the chunk again.
+            with self._lock:
+                self.misses += 1
+            return None
+        for sec in sections:
+            sec['section_start'] += start_line
+        with self._lock:
+            self.hits += 1
+        return sections
+
+    def put(self, key: str, start_line: int, sections: List[Dict[str, Any]]) -> None:
+        '''
+        Store the (dict format) sections of the chunk starting at start_line.
+        '''
+        relative = [dict(sec, section_start=sec['section_start'] - start_line) for sec in sections]
+        data = zlib.compress(pickle.dumps(relative, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self.stored_bytes += len(data)
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self) -> int:
+        '''
+        Total bytes of the cache files.
+        '''
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        '''
+        Remove entries unused for max_age seconds, then the least recently used ones beyond max_bytes.
+        Returns the number of entries removed.
+        '''
+        entries = sorted(self._entries())
+        removed = []
+        if self.max_age is not None:
+            cutoff = time.time() - self.max_age
+            while entries and entries[0][0] < cutoff:
+                removed.append(entries.pop(0))
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            while entries and total > self.max_bytes:
+                entry = entries.pop(0)
+                total -= entry[1]
+                removed.append(entry)
+        for _, _, path in removed:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.evicted += len(removed)
+        return len(removed)
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''
+Checkpoint files for resumable stream_matches() / parse_file_stream() runs.
+
+A checkpoint is a small JSON file holding...
+  - The input file name, the byte offset and line number just after the last processed line.
+  - The parser state (PyReParse.get_state()): counters, the subsection stack and per-pattern states.
+  - The positions of the sink receiving the results (if any), so partial output can be truncated on resume.
+  - For parse_file_stream(), the section that was in progress.
+
+Checkpoints are written atomically (write to a temporary file, then os.replace()).
+'''
+
+import json
+import os
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+CHECKPOINT_VERSION = 1
+
+
+def _encode(obj):
+    if isinstance(obj, Decimal):
+        return {'__decimal__': str(obj)}
+    raise TypeError(f'Object of type {type(obj).__name__} can not be saved in a checkpoint')
+
+
+def _decode(obj):
+    if '__decimal__' in obj and len(obj) == 1:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+def find_sink(callback):
+    '''
+    Return the sink behind a callback: a sink object itself, or the sink of a bound method such as
+    sink.write_section. Sinks are recognized by their get_position() / set_position() methods.
+    '''
+    for obj in (callback, getattr(callback, '__self__', None)):
+        if obj is not None and hasattr(obj, 'get_position') and hasattr(obj, 'set_position'):
+            return obj
+    return None
+
+
+class Checkpointer:
+    '''
+    Reads and writes the checkpoint file for one run.
+
+    :param checkpoint_path: Path of the checkpoint file.
+    :param file_path: The input file being parsed. A checkpoint for a different file is rejected.
+    :param every: Write a checkpoint every N section boundaries.
+    :param sink: Optional sink whose positions are saved and restored with the checkpoint.
+    '''
+
+    def __init__(self, checkpoint_path: str, file_path: str, every: int = 1, sink=None):
+        if every < 1:
+            raise ValueError('checkpoint_every must be >= 1')
+        self.checkpoint_path = checkpoint_path
+        self.file_path = file_path
+        self.every = every
+        self.sink = sink
+        self.boundaries = 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, 'r') as f:
+            ckpt = json.load(f, object_hook=_decode)
+        if ckpt.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version in [{self.checkpoint_path}]: {ckpt.get('version')}")
+        if ckpt['file_name'] != os.path.abspath(self.file_path):
+            raise ValueError(f"Checkpoint [{self.checkpoint_path}] is for file [{ckpt['file_name']}], "
+                             f"not [{self.file_path}]")
+        return ckpt
+
+    def boundary(self, prp_inst, offset: int, line_num: int, section: Optional[Dict[str, Any]] = None) -> None:
+        '''
+        Called at each section boundary, writes a checkpoint every self.every boundaries.
+        '''
+        self.boundaries += 1
+        if self.boundaries % self.every == 0:
+            self.save(prp_inst, offset, line_num, section)
+
+    def save(self, prp_inst, offset: int, line_num: int, section: Optional[Dict[str, Any]] = None) -> None:
+        # Batched callback matches are not part of the state: deliver them before the checkpoint moves past them.
+        prp_inst.flush_batches()
+        ckpt = {
+            'version': CHECKPOINT_VERSION,
+            'file_name': os.path.abspath(self.file_path),
+            'offset': offset,
+            'line_num': line_num,
+            'parser': prp_inst.get_state(),
+            'sink': self.sink.get_position() if self.sink is not None else None,
+            'section': section,
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(ckpt, f, default=_encode)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def remove(self) -> None:
+        '''
+        Remove the checkpoint file once a run completes, so the next run starts from the beginning.
+        '''
+        if os.path.exists(self.checkpoint_path):
+            os.unlink(self.checkpoint_path)
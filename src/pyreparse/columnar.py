@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+'''
+Columnar shared memory transport of section results, for parse_file_parallel(backend='processes').
+
+Pickling a list of section dicts in a worker process, and unpickling it in the parent, costs about as much as the
+matching. Instead, a worker appends its sections to a ColumnarWriter, which lays them out as columns in one
+multiprocessing.shared_memory block, and only returns a small handle (the block's name and layout)...
+
+  - sections:  section_start, end of its items, valid flag, totals shape and first totals value.
+  - items:     shape (match_def and field names), subsection depth, line count and parents, first value.
+  - values:    type tag plus an int64 column: the int itself, or an index into the strings.
+  - strings:   end offsets plus one UTF-8 blob. Strings are deduplicated within a block.
+
+The parent maps the block (memoryviews cast to the column types, no copy) in a ColumnarSections sequence, and
+SharedSections chains the blocks of all workers. Sections are decoded on access, to dicts or records.
+'''
+
+import pickle
+import weakref
+from array import array
+from decimal import Decimal
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .records import SUBSECTION_KEYS, make_record, Section
+
+# Value type tags
+TAG_STR = 0
+TAG_NONE = 1
+TAG_INT = 2
+TAG_DECIMAL = 3   # Stored as its str
+TAG_PICKLE = 4    # Anything else a callback put in the fields, pickled into the blob
+
+# (name, array typecode) of the columns, in block order.
+COLUMNS = (
+    ('sec_start', 'q'), ('sec_item_end', 'q'), ('sec_totals_shape', 'i'), ('sec_totals_start', 'q'),
+    ('item_shape', 'i'), ('item_value_start', 'q'), ('item_depth', 'i'), ('item_parents', 'i'),
+    ('item_line_count', 'q'), ('value_num', 'q'), ('str_end', 'q'),
+    ('sec_valid', 'B'), ('value_tag', 'B'), ('blob', 'B'),
+)
+
+
+class ColumnarWriter:
+    '''
+    Collects sections (in the dict result format) into columns.
+    '''
+
+    def __init__(self):
+        self.cols = {name: array(code) for name, code in COLUMNS}
+        self.shapes: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], int] = {}
+        self.totals_keys: Dict[Tuple[str, ...], int] = {}
+        self.parents: Dict[Tuple[str, ...], int] = {}
+        self.strings: Dict[Any, int] = {}
+        self.blob = bytearray()
+
+    def _bytes(self, key, data: bytes) -> int:
+        index = self.strings.get(key)
+        if index is None:
+            index = self.strings[key] = len(self.strings)
+            self.blob += data
+            self.cols['str_end'].append(len(self.blob))
+        return index
+
+    def _value(self, val) -> None:
+        tag_col, num_col = self.cols['value_tag'], self.cols['value_num']
+        if type(val) is str:
+            tag_col.append(TAG_STR)
+            num_col.append(self._bytes(val, val.encode('utf-8')))
+        elif val is None:
+            tag_col.append(TAG_NONE)
+            num_col.append(0)
+        elif type(val) is int and -(1 << 63) <= val < (1 << 63):
+            tag_col.append(TAG_INT)
+            num_col.append(val)
+        elif type(val) is Decimal:
+            text = str(val)
+            tag_col.append(TAG_DECIMAL)
+            num_col.append(self._bytes(text, text.encode('ascii')))
+        else:
+            data = pickle.dumps(val, protocol=pickle.HIGHEST_PROTOCOL)
+            tag_col.append(TAG_PICKLE)
+            num_col.append(self._bytes(('pickle', data), data))
+
+    def append(self, section: Dict[str, Any]) -> None:
+        cols = self.cols
+        strings = self.strings
+        tag_append, num_append = cols['value_tag'].append, cols['value_num'].append
+        for item in section['fields_list']:
+            fields = item['fields']
+            shape_key = (tuple(item['match_def']), tuple(fields))
+            cols['item_shape'].append(self.shapes.setdefault(shape_key, len(self.shapes)))
+            cols['item_value_start'].append(len(cols['value_tag']))
+            cols['item_depth'].append(fields.get('subsection_depth', 0))
+            parents = tuple(fields.get('current_subsection_parents', ()))
+            cols['item_parents'].append(self.parents.setdefault(parents, len(self.parents)))
+            cols['item_line_count'].append(fields.get('subsection_line_count', 0))
+            for key, val in fields.items():
+                if key in SUBSECTION_KEYS:
+                    continue
+                if type(val) is str:
+                    # Inlined fast path of _value() for the common case.
+                    index = strings.get(val)
+                    if index is None:
+                        index = self._bytes(val, val.encode('utf-8'))
+                    tag_append(TAG_STR)
+                    num_append(index)
+                else:
+                    self._value(val)
+        totals = section['totals']
+        cols['sec_start'].append(section['section_start'])
+        cols['sec_item_end'].append(len(cols['item_shape']))
+        cols['sec_valid'].append(1 if section['valid'] else 0)
+        cols['sec_totals_shape'].append(self.totals_keys.setdefault(tuple(totals), len(self.totals_keys)))
+        cols['sec_totals_start'].append(len(cols['value_tag']))
+        for val in totals.values():
+            self._value(val)
+
+    def to_shared_memory(self) -> Dict[str, Any]:
+        '''
+        Copy the columns into a new shared memory block. Returns the (picklable) handle for ColumnarSections.
+        The block is left for the reader to unlink.
+        '''
+        self.cols['blob'] = array('B', self.blob)
+        layout = {}
+        offset = 0
+        for name, _ in COLUMNS:
+            col = self.cols[name]
+            offset = (offset + 7) & ~7
+            layout[name] = (offset, len(col))
+            offset += len(col) * col.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for name, _ in COLUMNS:
+                start, _ = layout[name]
+                data = memoryview(self.cols[name]).cast('B')
+                shm.buf[start:start + len(data)] = data
+                data.release()
+        finally:
+            shm.close()
+        return {
+            'name': shm.name,
+            'layout': layout,
+            'shapes': list(self.shapes),
+            'totals_keys': list(self.totals_keys),
+            'parents': list(self.parents),
+        }
+
+
+def _release(shm, views):
+    for view in views:
+        view.release()
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ColumnarSections:
+    '''
+    A read-only sequence of the sections in one shared memory block (see ColumnarWriter).
+
+    :param handle: The handle returned by ColumnarWriter.to_shared_memory().
+    :param result_format: 'dicts' or 'records', as PyReParse.RESULT_DICTS / RESULT_RECORDS.
+    '''
+
+    def __init__(self, handle: Dict[str, Any], result_format: str = 'dicts'):
+        self.result_format = result_format
+        self._shm = shared_memory.SharedMemory(name=handle['name'])
+        views = []
+        for name, code in COLUMNS:
+            start, length = handle['layout'][name]
+            view = self._shm.buf[start:start + length * array(code).itemsize]
+            views.append(view)
+            if code != 'B':
+                view = view.cast(code)
+                views.append(view)
+            setattr(self, '_' + name, view)
+        self._shapes = [(list(match_def), keys) for match_def, keys in handle['shapes']]
+        self._value_keys = [tuple(key for key in keys if key not in SUBSECTION_KEYS) for _, keys in self._shapes]
+        self._totals_keys = handle['totals_keys']
+        self._parents = handle['parents']
+        self._strings: List[Any] = [None] * len(self._str_end)
+        self._finalizer = weakref.finalize(self, _release, self._shm, views)
+
+    def __len__(self) -> int:
+        return len(self._sec_start)
+
+    def _string(self, index: int) -> str:
+        # Decoded strings are cached, so equal values share one str, like interned ones.
+        val = self._strings[index]
+        if val is None:
+            start = self._str_end[index - 1] if index else 0
+            val = self._strings[index] = str(self._blob[start:self._str_end[index]], 'utf-8')
+        return val
+
+    def _value(self, index: int):
+        tag = self._value_tag[index]
+        num = self._value_num[index]
+        if tag == TAG_STR:
+            return self._string(num)
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_INT:
+            return num
+        if tag == TAG_DECIMAL:
+            return Decimal(self._string(num))
+        start = self._str_end[num - 1] if num else 0
+        return pickle.loads(self._blob[start:self._str_end[num]])
+
+    def __getitem__(self, index: int):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('section index out of range')
+        records = self.result_format == 'records'
+        fields_list = []
+        strings, tags, nums = self._strings, self._value_tag, self._value_num
+        for item in range(self._sec_item_end[index - 1] if index else 0, self._sec_item_end[index]):
+            shape = self._item_shape[item]
+            match_def, keys = self._shapes[shape]
+            value_index = self._item_value_start[item]
+            fields = {}
+            for value_index, key in enumerate(self._value_keys[shape], value_index):
+                if tags[value_index] == TAG_STR:
+                    val = strings[nums[value_index]]
+                    fields[key] = val if val is not None else self._string(nums[value_index])
+                else:
+                    fields[key] = self._value(value_index)
+            if 'subsection_depth' in keys:
+                fields['subsection_depth'] = self._item_depth[item]
+            if 'current_subsection_parents' in keys:
+                fields['current_subsection_parents'] = list(self._parents[self._item_parents[item]])
+            if 'subsection_line_count' in keys:
+                fields['subsection_line_count'] = self._item_line_count[item]
+            if records:
+                fields_list.append(make_record(match_def, fields))
+            else:
+                fields_list.append({'match_def': list(match_def), 'fields': fields})
+        totals_start = self._sec_totals_start[index]
+        totals = {key: self._value(totals_start + i)
+                  for i, key in enumerate(self._totals_keys[self._sec_totals_shape[index]])}
+        valid = bool(self._sec_valid[index])
+        if records:
+            return Section(self._sec_start[index], fields_list, totals, valid)
+        return {'section_start': self._sec_start[index], 'fields_list': fields_list, 'totals': totals,
+                'valid': valid}
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self) -> None:
+        '''
+        Unmap and unlink the shared memory block. (Also done on garbage collection.)
+        '''
+        self._finalizer()
+
+
+class SharedSections:
+    '''
+    A lazy, re-iterable sequence of the sections of several ColumnarSections blocks, in order.
+    '''
+
+    def __init__(self, blocks: List[ColumnarSections]):
+        self._blocks = blocks
+        self._ends = []
+        total = 0
+        for block in blocks:
+            total += len(block)
+            self._ends.append(total)
+
+    def __len__(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def __getitem__(self, index: int):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('section index out of range')
+        for block, end in zip(self._blocks, self._ends):
+            if index < end:
+                return block[index - end + len(block)]
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self._blocks:
+            yield from block
+
+    def close(self) -> None:
+        '''
+        Release the shared memory blocks.
+        '''
+        for block in self._blocks:
+            block.close()
+        self._blocks = []
+        self._ends = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
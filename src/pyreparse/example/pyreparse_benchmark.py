@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+
+'''
+PyReParse benchmark suite...
+
+Runs the example NSF report patterns over a (repeated) report file and prints throughput figures.
+
+    python src/pyreparse/example/pyreparse_benchmark.py [file_path] [--repeat N] [--only match sinks sqlite spill intern records windows processes guard load ignore cache batch async trace metrics encoding ...]
+'''
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from pyreparse import PyReParse
+from pyreparse.cache import SectionCache
+from pyreparse.example.pyreparse_example import PyReParse_Example
+from pyreparse.inputs import iter_lines_at, open_text
+from pyreparse.sinks import JsonlSink, CsvSink, SqliteSink
+from pyreparse.spill import estimate_section_size
+
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'tests', 'data', 'NsfPosFees',
+                            '999-063217-XXXX-PAID-NSF POS FEES CHARGED page 0001 to 0188.TXT')
+
+
+def make_input(file_path, repeat, tmp_dir):
+    '''
+    Concatenate file_path repeat times into a file within tmp_dir.
+    :return: (path, line_count, byte_count)
+    '''
+    with open(file_path, 'r') as f:
+        text = f.read()
+    path = os.path.join(tmp_dir, 'bench_input.txt')
+    with open(path, 'w') as f:
+        for _ in range(repeat):
+            f.write(text)
+    with open(path, 'r') as f:
+        line_count = sum(1 for _ in f)
+    return path, line_count, os.path.getsize(path)
+
+
+def report(name, elapsed, lines, extra='', unit='lines'):
+    rate = lines / elapsed if elapsed > 0 else float('inf')
+    print(f'  {name:<36} {elapsed:8.3f}s  {rate:12,.0f} {unit}/s  {extra}')
+
+
+def new_parser():
+    return PyReParse(PyReParse_Example.test_re_lines)
+
+
+def bench_match(args, path, lines, tmp_dir):
+    '''
+    Baseline: the match() loop, stream_matches(), parse_file() and parse_file_parallel().
+    '''
+    prp = new_parser()
+    start = time.perf_counter()
+    with open(path, 'r') as f:
+        for line in f:
+            prp.match(line)
+    report('match() loop', time.perf_counter() - start, lines)
+
+    prp = new_parser()
+    start = time.perf_counter()
+    for _ in prp.stream_matches(path):
+        pass
+    report('stream_matches()', time.perf_counter() - start, lines)
+
+    prp = new_parser()
+    start = time.perf_counter()
+    prp.parse_file(path)
+    report('parse_file()', time.perf_counter() - start, lines)
+
+    prp = new_parser()
+    start = time.perf_counter()
+    prp.parse_file_parallel(path)
+    report('parse_file_parallel()', time.perf_counter() - start, lines)
+
+
+def bench_sinks(args, path, lines, tmp_dir):
+    '''
+    Output sinks for stream_matches() versus a json.dumps() + write() per row callback.
+    '''
+    out_dir = os.path.join(tmp_dir, 'sink_out')
+
+    prp = new_parser()
+    files = {}
+
+    def naive_cb(match_def, fields):
+        if match_def:
+            for pat in match_def:
+                f = files.get(pat)
+                if f is None:
+                    f = files[pat] = open(os.path.join(out_dir, pat + '.naive.jsonl'), 'w')
+                f.write(json.dumps(fields) + '\n')
+
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    list(prp.stream_matches(path, callback=naive_cb))
+    for f in files.values():
+        f.close()
+    report('callback json.dumps()', time.perf_counter() - start, lines)
+
+    variants = [
+        ('JsonlSink', JsonlSink, {}),
+        ('JsonlSink threaded', JsonlSink, {'threaded': True}),
+        ('JsonlSink gzip threaded', JsonlSink, {'threaded': True, 'compress': True}),
+        ('CsvSink', CsvSink, {}),
+        ('CsvSink gzip threaded', CsvSink, {'threaded': True, 'compress': True}),
+    ]
+    for name, sink_class, kwargs in variants:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        prp = new_parser()
+        start = time.perf_counter()
+        with sink_class(prp, out_dir, **kwargs) as sink:
+            list(prp.stream_matches(path, callback=sink))
+        elapsed = time.perf_counter() - start
+        rows = sum(sink.rows_written.values())
+        report(name, elapsed, lines, f'{rows / elapsed:12,.0f} rows/s')
+
+
+def bench_sqlite(args, path, lines, tmp_dir):
+    '''
+    SqliteSink versus a callback doing a row-at-a-time INSERT + COMMIT.
+    '''
+    db_path = os.path.join(tmp_dir, 'bench_naive.db')
+    prp = new_parser()
+    conn = sqlite3.connect(db_path)
+    for pat in prp.re_defs:
+        cols = list(prp.get_fld_names(pat))
+        if cols:
+            conn.execute(f'CREATE TABLE "{pat}" ({", ".join(c + " TEXT" for c in cols)})')
+
+    def naive_cb(match_def, fields):
+        if match_def:
+            for pat in match_def:
+                cols = list(prp.get_fld_names(pat))
+                if cols:
+                    conn.execute(f'INSERT INTO "{pat}" VALUES ({", ".join("?" * len(cols))})',
+                                 [fields[c] for c in cols])
+                    conn.commit()
+
+    start = time.perf_counter()
+    list(prp.stream_matches(path, callback=naive_cb))
+    conn.close()
+    report('callback INSERT + COMMIT', time.perf_counter() - start, lines)
+
+    for name, kwargs in [('SqliteSink', {'threaded': False}), ('SqliteSink threaded', {'threaded': True})]:
+        db_path = os.path.join(tmp_dir, f'bench_sink_{len(name)}.db')
+        prp = new_parser()
+        start = time.perf_counter()
+        with SqliteSink(prp, db_path, **kwargs) as sink:
+            list(prp.stream_matches(path, callback=sink))
+        elapsed = time.perf_counter() - start
+        rows = sum(sink.rows_written.values())
+        report(name, elapsed, lines, f'{rows / elapsed:12,.0f} rows/s')
+
+
+def bench_spill(args, path, lines, tmp_dir):
+    '''
+    parse_file() building a list versus parse_file(memory_budget=...) spilling to disk.
+    '''
+    prp = new_parser()
+    start = time.perf_counter()
+    sections = prp.parse_file(path)
+    elapsed = time.perf_counter() - start
+    size = sum(estimate_section_size(sec) for sec in sections)
+    report('parse_file() list', elapsed, lines, f'{size / 1e6:8.1f} MB of sections in memory')
+    del sections
+
+    for budget in (64 << 20, 4 << 20, 1 << 20):
+        prp = new_parser()
+        start = time.perf_counter()
+        sections = prp.parse_file(path, memory_budget=budget, spill_dir=tmp_dir)
+        elapsed = time.perf_counter() - start
+        report(f'parse_file(memory_budget={budget >> 20}MB)', elapsed, lines,
+               f'{sections.peak_memory / 1e6:8.1f} MB peak in memory, '
+               f'{sections.spilled_bytes / 1e6:.1f} MB spilled')
+        start = time.perf_counter()
+        count = sum(1 for _ in sections)
+        report(f'  iterate {count} sections', time.perf_counter() - start, lines)
+        sections.close()
+
+
+def bench_intern(args, path, lines, tmp_dir):
+    '''
+    Memory retained by parse_file() results with and without INDEX_RE_INTERN fields.
+    '''
+    no_intern = {pat: {k: v for k, v in pat_def.items() if k != PyReParse.INDEX_RE_INTERN}
+                 for pat, pat_def in PyReParse_Example.test_re_lines.items()}
+    for name, patterns in [('parse_file() no interning', no_intern),
+                           ('parse_file() interned fields', PyReParse_Example.test_re_lines)]:
+        prp = PyReParse(patterns)
+        tracemalloc.start()
+        start = time.perf_counter()
+        sections = prp.parse_file(path)
+        elapsed = time.perf_counter() - start
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rows = sum(len(sec['fields_list']) for sec in sections)
+        report(name, elapsed, lines, f'{retained / 1e6:8.1f} MB retained, {retained / rows:6.0f} bytes/row')
+        del sections
+
+
+def bench_records(args, path, lines, tmp_dir):
+    '''
+    Memory per retained row: the dict result format versus result_format=RESULT_RECORDS.
+    '''
+    for name, result_format in [('parse_file() dicts', PyReParse.RESULT_DICTS),
+                                ('parse_file() records', PyReParse.RESULT_RECORDS)]:
+        prp = new_parser()
+        tracemalloc.start()
+        start = time.perf_counter()
+        sections = prp.parse_file(path, result_format=result_format)
+        elapsed = time.perf_counter() - start
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rows = sum(len(sec['fields_list']) for sec in sections)
+        report(name, elapsed, lines, f'{retained / 1e6:8.1f} MB retained, {retained / rows:6.0f} bytes/row')
+        del sections
+
+
+def bench_windows(args, path, lines, tmp_dir):
+    '''
+    match() loop with trigger counter windows off/on, for the example patterns after 10 header patterns
+    that can only match on fixed report lines ('<REPORT_LINE> == n').
+    '''
+    patterns = {}
+    for n in range(2, 12):
+        patterns[f'hdr_{n}'] = {
+            PyReParse.INDEX_RE_STRING: rf'^HEADER{n}\s+(?P<hdr_{n}>.*)$',
+            PyReParse.INDEX_RE_TRIGGER_ON: f'<REPORT_LINE> == {n}',
+        }
+    patterns.update(PyReParse_Example.test_re_lines)
+    with open(path, 'r') as f:
+        text_lines = f.readlines()
+    for use_windows in (False, True):
+        prp = PyReParse(patterns)
+        prp.use_counter_windows = use_windows
+        start = time.perf_counter()
+        for line in text_lines:
+            prp.match(line)
+        report(f'match() loop, use_counter_windows={use_windows}', time.perf_counter() - start, lines)
+
+
+def bench_processes(args, path, lines, tmp_dir):
+    '''
+    parse_file_parallel() backends: threads, and processes returning shared memory columns. The pickle round trip
+    of the dict sections shows the transport cost the shared memory columns avoid.
+    '''
+    prp = new_parser()
+    start = time.perf_counter()
+    sections = prp.parse_file_parallel(path)
+    report('threads', time.perf_counter() - start, lines)
+
+    start = time.perf_counter()
+    data = pickle.dumps(sections, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.loads(data)
+    report('pickle round trip of the sections', time.perf_counter() - start, lines, f'{len(data) / 1e6:8.1f} MB')
+    del sections, data
+
+    start = time.perf_counter()
+    with prp.parse_file_parallel(path, backend=PyReParse.BACKEND_PROCESSES) as sections:
+        mapped = time.perf_counter() - start
+        report('processes, mapped', mapped, lines)
+        rows = sum(len(sec['fields_list']) for sec in sections)
+        report('processes, all sections decoded', time.perf_counter() - start, lines, f'{rows:,} rows')
+
+
+def bench_guard(args, path, lines, tmp_dir):
+    '''
+    match() loop over the input with corrupt lines (every 1000th line joined with the next 200, as when page
+    newlines are lost): no guard, a slow-line log, and max_line_length truncating or rejecting the joined lines.
+    '''
+    with open(path, 'r') as f:
+        text_lines = [line.rstrip('\n') for line in f]
+    corrupt = []
+    i = 0
+    while i < len(text_lines):
+        if i % 1000 == 999:
+            corrupt.append(''.join(text_lines[i:i + 200]))
+            i += 200
+        else:
+            corrupt.append(text_lines[i])
+            i += 1
+    for name, guard in (('no guard', None),
+                        ('slow_line_threshold=0.001', dict(slow_line_threshold=0.001)),
+                        ('max_line_length=1000', dict(max_line_length=1000)),
+                        ('max_line_length=1000, reject_sink', dict(max_line_length=1000, reject_sink=list.append))):
+        prp = new_parser()
+        if guard is not None:
+            if 'reject_sink' in guard:
+                rejects = []
+                guard['reject_sink'] = lambda line_number, section_number, line: rejects.append(line_number)
+            line_guard = prp.set_line_guard(**guard)
+        long_time = 0.0
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for line in corrupt:
+                if len(line) > 1000:
+                    line_start = time.perf_counter()
+                    prp.match(line)
+                    long_time += time.perf_counter() - line_start
+                else:
+                    prp.match(line)
+        elapsed = time.perf_counter() - start
+        stats = '' if guard is None else ' '.join(f'{k}={v}' for k, v in line_guard.get_stats().items())
+        report(name, elapsed, len(corrupt), f'joined lines {long_time * 1e3:7.2f} ms  {stats}')
+
+
+def bench_ignore(args, path, lines, tmp_dir):
+    '''
+    match() loop and parse_file() without and with FLAG_IGNORE patterns for blank lines and the column header
+    line, which are checked with string operations before the triggers and regexps. Reports the fraction of lines
+    short-circuited.
+    '''
+    ignore_patterns = {
+        'blank': {PyReParse.INDEX_RE_STRING: r'^\s*$', PyReParse.INDEX_RE_FLAGS: PyReParse.FLAG_IGNORE},
+        'column_header': {PyReParse.INDEX_RE_STRING: r'^Account\ ', PyReParse.INDEX_RE_FLAGS: PyReParse.FLAG_IGNORE},
+    }
+    with open(path, 'r') as f:
+        text_lines = f.readlines()
+    results = []
+    for name, patterns in (('without FLAG_IGNORE', PyReParse_Example.test_re_lines),
+                           ('with FLAG_IGNORE', dict(ignore_patterns, **PyReParse_Example.test_re_lines))):
+        prp = PyReParse(patterns)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for line in text_lines:
+                prp.match(line)
+        report(f'match() loop, {name}', time.perf_counter() - start, lines,
+               f'{prp.ignored_line_count / len(text_lines):6.1%} short-circuited')
+        prp = PyReParse(patterns)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            results.append(prp.parse_file(path))
+        report(f'parse_file(), {name}', time.perf_counter() - start, lines)
+    if results[0] != results[1]:
+        print('  *** Results differ with the ignore patterns!')
+
+
+def generate_patterns(count, groups=8):
+    '''
+    A spec of count generated patterns with groups named groups each, triggered by a section header pattern and
+    counter conditions, some referencing earlier patterns.
+    '''
+    patterns = {'hdr': {PyReParse.INDEX_RE_STRING: r'^HDR\s+(?P<hdr_id>\d+)$',
+                        PyReParse.INDEX_RE_FLAGS: PyReParse.FLAG_NEW_SECTION}}
+    for i in range(count):
+        fields = r'\s+'.join(rf'(?P<f{i}_{g}>[\w.]+)' for g in range(groups))
+        trigger = f'{{hdr}} and <SECTION_LINE> <= {i % 50 + 2}'
+        if i > 1:
+            trigger += f' or {{p{i // 2}}}'
+        patterns[f'p{i}'] = {PyReParse.INDEX_RE_STRING: rf'^P{i}\s+{fields}\s*$',
+                             PyReParse.INDEX_RE_TRIGGER_ON: trigger}
+    return patterns
+
+
+def bench_load(args, path, lines, tmp_dir):
+    '''
+    Loading a spec of 5,000 generated patterns (8 named groups each): validate_re_defs(), the full
+    load_re_lines() (regexp compilation included), get_all_fld_names() and clone().
+    '''
+    patterns = generate_patterns(5000)
+    start = time.perf_counter()
+    PyReParse().validate_re_defs(patterns)
+    report('validate_re_defs()', time.perf_counter() - start, len(patterns), unit='patterns')
+
+    start = time.perf_counter()
+    prp = PyReParse(patterns)
+    report('load_re_lines()', time.perf_counter() - start, len(patterns), unit='patterns')
+
+    start = time.perf_counter()
+    fields = prp.get_all_fld_names()
+    report('get_all_fld_names()', time.perf_counter() - start, len(patterns), f'{len(fields):,} fields', unit='patterns')
+
+    start = time.perf_counter()
+    prp.clone()
+    report('clone()', time.perf_counter() - start, len(patterns), unit='patterns')
+
+
+def bench_cache(args, path, lines, tmp_dir):
+    '''
+    parse_file() without a cache, then with a SectionCache: cold, warm (every section a hit), and after the
+    archive grew by one more copy of the report. The input repeats one report, so even the cold run mostly hits.
+    '''
+    prp = new_parser()
+    start = time.perf_counter()
+    expected = prp.parse_file(path)
+    report('parse_file() no cache', time.perf_counter() - start, lines)
+
+    cache = SectionCache(os.path.join(tmp_dir, 'section_cache'), max_bytes=None)
+    for name in ('cold', 'warm'):
+        prp = new_parser()
+        start = time.perf_counter()
+        sections = prp.parse_file(path, cache=cache)
+        elapsed = time.perf_counter() - start
+        assert sections == expected
+        report(f'parse_file(cache) {name}', elapsed, lines,
+               f'{cache.hits} hits, {cache.misses} misses, {cache.size() / 1e6:.1f} MB cached')
+
+    grown = os.path.join(tmp_dir, 'grown.txt')
+    with open(grown, 'w') as out, open(path) as f_in, open(args.file_path) as f_add:
+        shutil.copyfileobj(f_in, out)
+        shutil.copyfileobj(f_add, out)
+    hits, misses = cache.hits, cache.misses
+    prp = new_parser()
+    start = time.perf_counter()
+    prp.parse_file(grown, cache=cache)
+    report('parse_file(cache) grown archive', time.perf_counter() - start, lines,
+           f'{cache.hits - hits} hits, {cache.misses - misses} misses')
+    os.unlink(grown)
+
+
+def bench_batch(args, path, lines, tmp_dir):
+    '''
+    match() loop inserting the tx_line fields into an in-memory SQLite table: a per-match INDEX_RE_CALLBACK
+    (one execute() per row) versus an INDEX_RE_BATCH_CALLBACK (one executemany() per batch of rows or columns).
+    '''
+    with open(path, 'r') as f:
+        text_lines = f.readlines()
+    columns = list(PyReParse(PyReParse_Example.test_re_lines).get_fld_names('tx_line'))
+    insert = f'INSERT INTO tx_line VALUES ({", ".join("?" * len(columns))})'
+
+    def per_match(prp_inst, pattern_name):
+        flds = prp_inst.last_captured_fields
+        conn.execute(insert, [flds[col] for col in columns])
+
+    def batched(prp_inst, pattern_name, batch):
+        conn.executemany(insert, [[flds[col] for col in columns] for flds in batch])
+
+    def columnar(prp_inst, pattern_name, batch):
+        conn.executemany(insert, zip(*(batch[col] for col in columns)))
+
+    no_callback = {key: val for key, val in PyReParse_Example.test_re_lines['tx_line'].items()
+                   if key != PyReParse.INDEX_RE_CALLBACK}
+    variants = [
+        ('no tx_line callback', no_callback),
+        ('INDEX_RE_CALLBACK', dict(no_callback, **{PyReParse.INDEX_RE_CALLBACK: per_match})),
+        ('INDEX_RE_BATCH_CALLBACK', dict(no_callback, **{PyReParse.INDEX_RE_BATCH_CALLBACK: batched})),
+        ('batch, columnar', dict(no_callback, **{PyReParse.INDEX_RE_BATCH_CALLBACK: columnar,
+                                                 PyReParse.INDEX_RE_BATCH_COLUMNAR: True})),
+    ]
+    for name, tx_line in variants:
+        conn = sqlite3.connect(':memory:')
+        conn.execute(f'CREATE TABLE tx_line ({", ".join(columns)})')
+        prp = PyReParse(dict(PyReParse_Example.test_re_lines, tx_line=tx_line))
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for line in text_lines:
+                prp.match(line)
+            prp.flush_batches()
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        rows = conn.execute('SELECT COUNT(*) FROM tx_line').fetchone()[0]
+        report(f'match() loop, {name}', elapsed, lines, f'{rows:,} rows inserted')
+        conn.close()
+
+
+def bench_async(args, path, lines, tmp_dir):
+    '''
+    aparse_file_stream() with a coroutine callback simulating a 2 ms database write per section: awaited one at a
+    time (max_pending=1) versus overlapped with the parse (max_pending=16), and parse_file_stream() with a
+    blocking 2 ms write for reference.
+    '''
+    write_time = 0.002
+
+    def blocking_write(section):
+        time.sleep(write_time)
+
+    async def async_write(section):
+        await asyncio.sleep(write_time)
+
+    async def parse(max_pending):
+        async for _ in new_parser().aparse_file_stream(path, callback=async_write, max_pending=max_pending):
+            pass
+
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in new_parser().parse_file_stream(path, callback=blocking_write):
+            pass
+    report('parse_file_stream(), blocking writes', time.perf_counter() - start, lines)
+    for max_pending in (1, 16):
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            asyncio.run(parse(max_pending))
+        report(f'aparse_file_stream(max_pending={max_pending})', time.perf_counter() - start, lines)
+
+
+def bench_trace(args, path, lines, tmp_dir):
+    '''
+    match() loop without tracing, then with start_trace(): to a trace file, to a ring buffer, and to a file
+    with triggers=False (regexp attempts and section events only).
+    '''
+    with open(path, 'r') as f:
+        text_lines = f.readlines()
+    trace_path = os.path.join(tmp_dir, 'bench.trace')
+    variants = [
+        ('no trace', None),
+        ('trace file', dict(path=trace_path)),
+        ('ring buffer', dict()),
+        ('trace file, triggers=False', dict(path=trace_path, triggers=False)),
+    ]
+    for name, trace_args in variants:
+        prp = new_parser()
+        if trace_args is not None:
+            prp.start_trace(**trace_args)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for line in text_lines:
+                prp.match(line)
+        tracer = prp.stop_trace()
+        elapsed = time.perf_counter() - start
+        extra = ''
+        if tracer is not None:
+            extra = f'{tracer.event_count:,} events'
+            if tracer.path:
+                extra += f', {os.path.getsize(tracer.path) / 1e6:.1f} MB'
+        report(f'match() loop, {name}', elapsed, lines, extra)
+
+
+def bench_metrics(args, path, lines, tmp_dir):
+    '''
+    parse_file_stream() and parse_file_parallel() without metrics, then with start_metrics() scraped over HTTP
+    every 0.1s (far more often than a Prometheus server would).
+    '''
+    import threading
+    import urllib.request
+    for name, run in [('parse_file_stream()', lambda prp: list(prp.parse_file_stream(path))),
+                      ('parse_file_parallel()', lambda prp: prp.parse_file_parallel(path, max_workers=4))]:
+        for metered in (False, True):
+            prp = new_parser()
+            stop = threading.Event()
+            scrapes = []
+            if metered:
+                metrics = prp.start_metrics(http_port=0)
+                url = f'http://127.0.0.1:{metrics.http_port}/metrics'
+
+                def scrape():
+                    while not stop.wait(0.1):
+                        with urllib.request.urlopen(url) as resp:
+                            scrapes.append(resp.read())
+
+                scraper = threading.Thread(target=scrape, daemon=True)
+                scraper.start()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                run(prp)
+            elapsed = time.perf_counter() - start
+            extra = ''
+            if metered:
+                stop.set()
+                scraper.join()
+                sample = prp.stop_metrics().sample()
+                extra = f"{len(scrapes)} scrapes, {sample['lines']:,} lines, {sample['sections']:,} sections"
+            report(f"{name}, {'metrics' if metered else 'no metrics'}", elapsed, lines, extra)
+
+
+def bench_encoding(args, path, lines, tmp_dir):
+    '''
+    The input re-encoded to cp037 (EBCDIC) and cp1252: decoding alone (a separate re-encode to UTF-8 pass, as
+    before encoding=, text mode with 8 KB and block decode chunks, and the byte offset reader), then the
+    combined decode and parse_file_stream(encoding=...).
+    '''
+    with open(path, 'r') as f:
+        text = f.read()
+    for encoding in ('cp037', 'cp1252'):
+        enc_path = os.path.join(tmp_dir, f'bench.{encoding}')
+        with open(enc_path, 'wb') as f:
+            f.write(text.encode(encoding, 'replace'))
+
+        utf8_path = os.path.join(tmp_dir, 'bench.utf8')
+        start = time.perf_counter()
+        with open(enc_path, 'r', encoding=encoding) as src, open(utf8_path, 'w', encoding='utf-8') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        report(f'{encoding} re-encode to utf-8 pass', time.perf_counter() - start, lines)
+
+        start = time.perf_counter()
+        with open(enc_path, 'r', encoding=encoding) as f:
+            count = sum(1 for _ in f)
+        report(f'{encoding} decode, 8 KB chunks', time.perf_counter() - start, count)
+
+        start = time.perf_counter()
+        with open_text(enc_path, encoding=encoding) as f:
+            count = sum(1 for _ in f)
+        report(f'{encoding} decode, open_text()', time.perf_counter() - start, count)
+
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_lines_at(enc_path, encoding=encoding))
+        report(f'{encoding} decode, iter_lines_at()', time.perf_counter() - start, count)
+
+        prp = new_parser()
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            sections = sum(1 for _ in prp.parse_file_stream(enc_path, encoding=encoding))
+        report(f'{encoding} parse_file_stream()', time.perf_counter() - start, lines, f'{sections:,} sections')
+
+
+BENCHMARKS = {
+    'match': bench_match,
+    'sinks': bench_sinks,
+    'sqlite': bench_sqlite,
+    'spill': bench_spill,
+    'intern': bench_intern,
+    'records': bench_records,
+    'windows': bench_windows,
+    'processes': bench_processes,
+    'guard': bench_guard,
+    'load': bench_load,
+    'ignore': bench_ignore,
+    'cache': bench_cache,
+    'batch': bench_batch,
+    'async': bench_async,
+    'trace': bench_trace,
+    'metrics': bench_metrics,
+    'encoding': bench_encoding,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PyReParse Benchmarks')
+    parser.add_argument('file_path', nargs='?', default=DEFAULT_FILE)
+    parser.add_argument('--repeat', type=int, default=20, help='Concatenate the input file N times')
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help='Benchmarks to run')
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp(prefix='pyreparse_bench_')
+    try:
+        path, lines, size = make_input(args.file_path, args.repeat, tmp_dir)
+        print(f'Input: {lines:,} lines, {size:,} bytes ({args.repeat} x {os.path.basename(args.file_path)})')
+        for name in (args.only or BENCHMARKS):
+            print(f'[{name}] {BENCHMARKS[name].__doc__.strip()}')
+            BENCHMARKS[name](args, path, lines, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
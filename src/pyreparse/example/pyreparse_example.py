@@ -159,6 +159,8 @@ class PyReParse_Example():
             PRP.INDEX_RE_TRIGGER_ON: '{start_tx_lines}',
             PRP.INDEX_RE_TRIGGER_OFF: '{end_tx_lines}',
             PRP.INDEX_RE_CALLBACK: cb_tx_line,
+            # These fields have few distinct values, share one str per value across all retained matches.
+            PRP.INDEX_RE_INTERN: ('ac_type', 'fee_code', 'tx_date', 'fee_type'),
         },
         'end_tx_lines': {
             PRP.INDEX_RE_STRING:
@@ -172,7 +174,9 @@ class PyReParse_Example():
                 r'^Total\ NSF:\s*(?P<total_nsf>[\-\$\ \d\,\.]+)',
             PRP.INDEX_RE_FLAGS: PRP.FLAG_RETURN_ON_MATCH | PRP.FLAG_ONCE_PER_SECTION,
             PRP.INDEX_RE_TRIGGER_ON: '{end_tx_lines}',
-            PRP.INDEX_RE_TRIGGER_OFF: '{total_nsf}' # Insufficient Funds Total
+            PRP.INDEX_RE_TRIGGER_OFF: '{total_nsf}', # Insufficient Funds Total
+            # The sum of all nsf_fee values captured by tx_line within the section must equal total_nsf.
+            PRP.INDEX_RE_SUM_CHECK: {'total_nsf': ('tx_line', 'nsf_fee')}
         },
         'total_odt': {
             PRP.INDEX_RE_STRING:
@@ -201,7 +205,9 @@ class PyReParse_Example():
         if self.args.stream:
             print("Streaming mode...")
             match_count = 0
-            for m, f in self.prp.stream_matches(self.file_path):
+            # '-' streams the report from stdin, e.g. a pipe: zcat report.gz | pyreparse_example.py - --stream
+            source = sys.stdin.buffer if self.file_path == '-' else self.file_path
+            for m, f in self.prp.stream_matches_from(source):
                 if m:
                     match_count += 1
                     print(f"Match: {m} - {f}")
@@ -214,8 +220,9 @@ class PyReParse_Example():
 
             # Common processing: print/merge sections
             total_matches = sum(len(s['fields_list']) for s in sections)
+            invalid_sections = [s['section_start'] for s in sections if not s['valid']]
             print(f"Processed {len(sections)} sections, {total_matches} matches")
-            # TODO aggregate totals/validations
+            print(f"Sections failing sum checks: {len(invalid_sections)} {invalid_sections}")
 
 if __name__ == '__main__':
     prg = PyReParse_Example()
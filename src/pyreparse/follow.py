@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+'''
+Follow (tail) a growing report file.
+
+follow_lines() yields the complete lines appended to a file, starting at a byte offset. At EOF it waits for the file
+to grow: with inotify (Linux, via ctypes) when available, else by polling the file's size with os.stat().
+A trailing line without its newline is held back until the rest of the line has been written.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from typing import Callable, Iterator, Optional, Tuple
+
+from .inputs import DEFAULT_BLOCK_SIZE, LineDecoder, detect_compression
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify event masks (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+
+class _Inotify:
+    '''
+    A minimal inotify watch on one file, through libc with ctypes.
+    '''
+
+    def __init__(self, file_path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+        mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(self.fd, os.fsencode(file_path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch() failed for [{file_path}]')
+
+    def wait(self, timeout: float) -> None:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # Drain the queued events; the caller re-reads the file anyway.
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FileWatcher:
+    '''
+    Waits for a file to change: inotify where available, otherwise a sleep between os.stat() polls.
+
+    :param file_path: The file to watch.
+    :param poll_interval: Seconds between polls. With inotify, the longest wait before the file is checked anyway.
+    :param use_inotify: Set False to always poll.
+    '''
+
+    def __init__(self, file_path: str, poll_interval: float = DEFAULT_POLL_INTERVAL, use_inotify: bool = True):
+        self.poll_interval = poll_interval
+        self.inotify = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.inotify = _Inotify(file_path)
+            except (OSError, AttributeError):
+                self.inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+        if self.inotify is not None:
+            self.inotify.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def close(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+def follow_lines(file_path: str, offset: int = 0, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 idle_timeout: Optional[float] = None, stop_event=None,
+                 on_idle: Optional[Callable[[], None]] = None, on_truncate: Optional[Callable[[], None]] = None,
+                 encoding: Optional[str] = None, block_size: int = DEFAULT_BLOCK_SIZE,
+                 use_inotify: bool = True) -> Iterator[Tuple[int, str]]:
+    '''
+    Yield (byte_count, line) for each complete line of file_path from byte offset on, waiting for more lines
+    at EOF. Only complete lines (ending in a newline) are yielded.
+
+    :param idle_timeout: Stop after this many seconds without new data. None follows until stop_event is set.
+    :param stop_event: A threading.Event (or anything with is_set()) that stops following when set.
+    :param on_idle: Called each time all available data has been yielded, before waiting.
+    :param on_truncate: Called when the file shrinks below the current offset (it was truncated), before
+                        following restarts from offset 0.
+    :param encoding: The file's encoding (default: the locale's), see inputs.LineDecoder.
+    '''
+    if detect_compression(file_path) is not None:
+        raise ValueError(f'Follow mode does not support compressed files: [{file_path}]')
+    decoder = LineDecoder(encoding)
+    with open(file_path, 'rb', buffering=0) as f, \
+            FileWatcher(file_path, poll_interval=poll_interval, use_inotify=use_inotify) as watcher:
+        f.seek(offset)
+        last_data = time.monotonic()
+        while True:
+            data = f.read(block_size)
+            if data:
+                last_data = time.monotonic()
+                yield from decoder.feed(data)
+                continue
+
+            if on_idle is not None:
+                on_idle()
+            if stop_event is not None and stop_event.is_set():
+                return
+            idle = time.monotonic() - last_data
+            if idle_timeout is not None and idle >= idle_timeout:
+                return
+            if os.stat(file_path).st_size < f.tell():
+                print(f'*** File [{file_path}] was truncated, following it from the start.')
+                f.seek(0)
+                decoder.reset()
+                if on_truncate is not None:
+                    on_truncate()
+                continue
+            watcher.wait(None if idle_timeout is None else idle_timeout - idle)
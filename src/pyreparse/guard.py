@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+'''
+Line guard: predictable worst-case match() latency on corrupt input.
+
+A corrupt line (e.g. a missing newline joining pages into a 30 KB line) is matched by every active regexp, and
+ambiguous regexps can take far longer on it than on a normal line (see re_risk.py). A LineGuard, set with
+PyReParse.set_line_guard(), adds...
+
+  - max_line_length: Longer lines are not dispatched to the regexps as is. With a reject_sink, the line is
+                     passed to reject_sink(line_number, section_number, line) and not matched at all (match()
+                     returns no match, but the line is counted). Without one, the line is truncated to
+                     max_line_length and matched.
+  - slow_line_threshold: Lines whose regexp match time (the sum over all patterns tried) exceeds this many
+                     seconds are recorded in the slow-line log, with the line number, section number and the
+                     slowest pattern.
+
+Line numbers are 1-based input line numbers (PyReParse.input_line_count), section numbers are section_count.
+
+Clones of a PyReParse instance share its LineGuard, so parallel workers log into one guard. The guard is
+thread-safe.
+'''
+
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+SLOW_LINE_LOG_SIZE = 1000   # Slow lines kept in the log (the most recent ones).
+SLOW_LINE_TEXT_LIMIT = 256  # Characters of a slow line kept in the log.
+
+
+class SlowLine(NamedTuple):
+    line_number: int
+    section_number: int
+    pattern: Optional[str]  # The pattern whose regexp took longest on the line.
+    seconds: float          # Total regexp match time of the line.
+    line: str               # The line (its first SLOW_LINE_TEXT_LIMIT characters).
+
+
+class LineGuard:
+    '''
+    See the module docstring.
+
+    :param max_line_length: Maximum line length (characters) dispatched to the regexps, None for no limit.
+    :param slow_line_threshold: Seconds of regexp match time after which a line is logged, None to not time lines.
+    :param reject_sink: Callable receiving (line_number, section_number, line) for each line over
+                        max_line_length, instead of the line being truncated and matched.
+    :param log_size: Number of (most recent) slow lines kept.
+    '''
+
+    def __init__(self, max_line_length: Optional[int] = None, slow_line_threshold: Optional[float] = None,
+                 reject_sink: Optional[Callable[[int, int, str], Any]] = None, log_size: int = SLOW_LINE_LOG_SIZE):
+        if max_line_length is not None and (not isinstance(max_line_length, int) or max_line_length < 1):
+            raise ValueError('max_line_length must be a positive integer.')
+        if slow_line_threshold is not None and slow_line_threshold < 0:
+            raise ValueError('slow_line_threshold must be >= 0.')
+        if reject_sink is not None and max_line_length is None:
+            raise ValueError('reject_sink requires max_line_length.')
+        self.max_line_length = max_line_length
+        self.slow_line_threshold = slow_line_threshold
+        self.reject_sink = reject_sink
+        self.slow_lines = deque(maxlen=log_size)
+        self.slow_line_count = 0
+        self.truncated_count = 0
+        self.rejected_count = 0
+        self._lock = threading.Lock()
+
+    def reject(self, line_number: int, section_number: int, line: str) -> None:
+        with self._lock:
+            self.rejected_count += 1
+            self.reject_sink(line_number, section_number, line)
+
+    def truncated(self) -> None:
+        with self._lock:
+            self.truncated_count += 1
+
+    def log_slow_line(self, line_number: int, section_number: int, pattern: Optional[str], seconds: float,
+                      line: str) -> None:
+        entry = SlowLine(line_number, section_number, pattern, seconds, line[:SLOW_LINE_TEXT_LIMIT])
+        with self._lock:
+            self.slow_line_count += 1
+            self.slow_lines.append(entry)
+
+    def get_slow_lines(self) -> List[SlowLine]:
+        '''
+        The slow-line log, in line number order.
+        '''
+        with self._lock:
+            return sorted(self.slow_lines)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'slow': self.slow_line_count, 'truncated': self.truncated_count, 'rejected': self.rejected_count}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+'''
+Ignorable lines: FLAG_IGNORE patterns.
+
+Reports are full of lines no pattern is meant to match: blank lines, repeated page and column headers. match()
+checks FLAG_IGNORE patterns first, and an ignored line skips report boundaries, triggers and regexps altogether.
+
+ignore_test() turns an ignore pattern's regexp into the cheapest equivalent test of a line (without its newline)...
+
+    r'^$'                       -> KIND_BLANK:  not line
+    r'^\\s*$'                    -> KIND_BLANK:  not line or line.isspace()
+    r'^\\s+$'                    -> KIND_BLANK:  line.isspace()
+    r'^Account\\ '               -> KIND_PREFIX: line.startswith('Account ')
+    r'^Account\\s+Fee'           -> KIND_REGEXP  (not a literal)
+    r'^(?:PAGE|\\f)'             -> KIND_PREFIX: line.startswith(('PAGE', '\\f'))
+    anything else               -> KIND_REGEXP: regexp.match(line)
+
+Patterns are compiled with re.X, so literal spaces in a prefix must be escaped (r'^Account\\ \\ Fee') or written as
+a character class ('[ ]'); case insensitive patterns always use the regexp.
+'''
+
+import re
+from operator import methodcaller, not_
+from typing import Callable, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+KIND_BLANK = 'blank'
+KIND_PREFIX = 'prefix'
+KIND_REGEXP = 'regexp'
+
+
+def _is_blank(line: str) -> bool:
+    return not line or line.isspace()
+
+
+def _literal(items) -> Optional[str]:
+    '''
+    The text of a sequence of literal items, else None.
+    '''
+    chars = []
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars.append(chr(av))
+        elif op == sre_constants.IN and len(av) == 1 and av[0][0] == sre_constants.LITERAL:
+            chars.append(chr(av[0][1]))  # A one character class, e.g. [ ]
+        else:
+            return None
+    return ''.join(chars)
+
+
+def _prefixes(items) -> Optional[Tuple[str, ...]]:
+    '''
+    The literal prefixes matched by a sequence: one literal, or an alternation of literals.
+    '''
+    text = _literal(items)
+    if text:
+        return (text,)
+    if len(items) != 1:
+        return None
+    op, av = items[0]
+    if op == sre_constants.SUBPATTERN and not av[1] and not av[2]:
+        return _prefixes(list(av[3]))
+    if op == sre_constants.BRANCH:
+        texts = [_literal(list(branch)) for branch in av[1]]
+        return tuple(texts) if all(texts) else None
+    if op == sre_constants.IN and all(item_op == sre_constants.LITERAL for item_op, _ in av):
+        return tuple(chr(item_av) for _, item_av in av)  # (?:A|B) of single characters is a class.
+    return None
+
+
+def _is_space_repeat(op, av) -> Optional[int]:
+    '''
+    The minimum count of a greedy repeat of \\s, else None.
+    '''
+    if op == sre_constants.MAX_REPEAT and av[1] == sre_constants.MAXREPEAT:
+        body = list(av[2])
+        if body == [(sre_constants.IN, [(sre_constants.CATEGORY, sre_constants.CATEGORY_SPACE)])]:
+            return av[0]
+    return None
+
+
+def ignore_test(regexp) -> Tuple[str, Callable[[str], bool]]:
+    '''
+    The (kind, test) of an ignore pattern's compiled regexp: test(line) is True when regexp.match(line) would match
+    (for lines without a newline).
+    '''
+    if not regexp.flags & re.IGNORECASE:
+        items = list(sre_parse.parse(regexp.pattern, regexp.flags))
+        if items and items[0] == (sre_constants.AT, sre_constants.AT_BEGINNING):
+            items = items[1:]
+        if items and items[-1] == (sre_constants.AT, sre_constants.AT_END):
+            body = items[:-1]
+            if not body:
+                return KIND_BLANK, not_
+            if len(body) == 1:
+                min_count = _is_space_repeat(*body[0])
+                if min_count == 0:
+                    return KIND_BLANK, _is_blank
+                if min_count == 1:
+                    return KIND_BLANK, str.isspace
+        else:
+            prefixes = _prefixes(items)
+            if prefixes:
+                return KIND_PREFIX, methodcaller('startswith', prefixes if len(prefixes) > 1 else prefixes[0])
+    return KIND_REGEXP, regexp.match
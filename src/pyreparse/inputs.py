@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+'''
+Input helpers for the PyReParse file APIs.
+
+open_text() opens a report file for line iteration. Plain files are read directly in binary blocks.
+Compressed files (gzip, bz2, xz) are detected by their magic bytes and decompressed on a background thread,
+which feeds large decompressed blocks through a bounded queue into the text reader. That way decompression
+(which releases the GIL) and matching overlap on separate cores.
+
+open_lines() accepts any line source: a file path, a text file object, a binary file object (pipe, socket
+makefile('rb'), mmap, BytesIO...) or an iterable of str or bytes lines.
+
+Encodings: Every file API takes encoding= (default: the locale's preferred encoding), e.g. 'cp037' or 'cp500' for
+EBCDIC mainframe reports, or 'cp1252'. Files and binary streams are read in blocks of block_size bytes. Line ends
+are universal newlines ('\\n', '\\r\\n' and '\\r'), plus NEL (b'\\x15') in EBCDIC code pages, which end lines with
+either NEL or '\\n' (b'\\x25'). Text is read with a TextIOWrapper, or for EBCDIC with a LineReader, whose
+LineDecoder splits blocks into lines and decodes single byte code pages a block at a time. The byte offset readers
+(iter_lines_at() and follow.follow_lines(), used by checkpoints and follow mode) split blocks with a LineDecoder
+too, counting the bytes of each line.
+'''
+
+import bz2
+import codecs
+import gzip
+import io
+import locale
+import lzma
+import os
+import queue
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from itertools import chain
+from typing import Iterator, List, Optional, Tuple
+
+# Magic bytes -> (compression name, opener)
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip', gzip.open),
+    (b'BZh', 'bz2', bz2.open),
+    (b'\xfd7zXZ\x00', 'xz', lzma.open),
+)
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+DEFAULT_QUEUE_DEPTH = 4
+
+
+def detect_compression(file_path: str) -> Optional[str]:
+    '''
+    Return 'gzip', 'bz2' or 'xz' when file_path starts with that format's magic bytes, else None.
+    '''
+    with open(file_path, 'rb') as f:
+        head = f.read(6)
+    for magic, name, _ in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class _QueueReader(io.RawIOBase):
+    '''
+    A raw binary stream whose data is produced by a background thread.
+
+    The thread calls producer(put) where put(block) places a bytes block onto a bounded queue (blocking while
+    the queue is full). readinto() hands the blocks to the reader in order.
+    '''
+
+    def __init__(self, producer, queue_depth: int = DEFAULT_QUEUE_DEPTH):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._block = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._run, args=(producer,), name='pyreparse-reader', daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, producer):
+        try:
+            producer(self._put)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not len(self._block):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            self._block = memoryview(item)
+        n = min(len(b), len(self._block))
+        b[:n] = self._block[:n]
+        self._block = self._block[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            # Unblock a producer waiting on a full queue, then let it finish.
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        super().close()
+
+
+def open_compressed(file_path: str, compression: str, encoding: Optional[str] = None,
+                    block_size: int = DEFAULT_BLOCK_SIZE, queue_depth: int = DEFAULT_QUEUE_DEPTH) -> io.TextIOBase:
+    '''
+    Open a compressed file as a text stream, decompressing blocks of block_size bytes on a background thread.
+    '''
+    opener = {name: opener for _, name, opener in COMPRESSION_MAGIC}[compression]
+
+    def producer(put):
+        with opener(file_path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block or not put(block):
+                    break
+
+    raw = _QueueReader(producer, queue_depth=queue_depth)
+    return _text_reader(io.BufferedReader(raw, buffer_size=block_size), encoding, block_size)
+
+
+def open_text(file_path: str, encoding: Optional[str] = None, block_size: int = DEFAULT_BLOCK_SIZE,
+              queue_depth: int = DEFAULT_QUEUE_DEPTH) -> io.TextIOBase:
+    '''
+    Open a report file for reading lines, transparently decompressing gzip, bz2 and xz files.
+    Lines end with universal newlines, as in open(file_path, 'r'), or with NEL in EBCDIC code pages (see LineDecoder).
+    '''
+    compression = detect_compression(file_path)
+    if compression is None:
+        return _text_reader(open(file_path, 'rb', buffering=block_size), encoding, block_size)
+    return open_compressed(file_path, compression, encoding=encoding, block_size=block_size,
+                           queue_depth=queue_depth)
+
+
+class _ReadAdapter(io.RawIOBase):
+    '''
+    A raw binary stream over any object with a read(n) method returning bytes (e.g. a pipe, a socket file,
+    an mmap). Closing the adapter does not close the underlying object.
+    '''
+
+    def __init__(self, source):
+        super().__init__()
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._source.read(len(b))
+        if not data:
+            return 0
+        n = len(data)
+        b[:n] = data
+        return n
+
+
+def is_single_byte(encoding: str) -> bool:
+    '''
+    True for encodings of one byte per character: latin-1, ascii and the charmap code pages (cp037, cp500, cp1252,
+    iso8859-x...).
+    '''
+    info = codecs.lookup(encoding)
+    if info.name in ('iso8859-1', 'ascii'):
+        return True
+    module = sys.modules.get(getattr(info.decode, '__module__', None) or '')
+    return isinstance(getattr(module, 'decoding_table', None), str)
+
+
+class LineDecoder:
+    '''
+    Splits blocks of raw data into lines: (byte_count, line) for each complete line, or just the line when
+    byte_counts is False. A trailing partial line is kept for the next block.
+
+    Line ends are universal newlines, as in open(file_path, 'r'): '\\n', '\\r\\n' and '\\r', all translated to
+    '\\n'. EBCDIC code pages (which encode '\\n' as b'\\x25') also end lines with NEL ('\\x85', b'\\x15'), the
+    usual record end of mainframe reports.
+
+    Single byte encodings are decoded a block at a time (a character is a byte, so the byte counts are the line
+    lengths). Other encodings must encode '\\n' as one byte (as ASCII compatible ones do); for byte counts they
+    are split raw and decoded line by line.
+    '''
+
+    def __init__(self, encoding: Optional[str] = None, byte_counts: bool = True):
+        self.encoding = encoding = encoding or locale.getpreferredencoding(False)
+        self.newline = '\n'.encode(encoding)
+        if len(self.newline) != 1:
+            raise ValueError(f"Reading lines at byte offsets requires an encoding with a one byte newline, "
+                             f"not '{encoding}'.")
+        self.carriage_return = '\r'.encode(encoding)
+        self.single_byte = is_single_byte(encoding)
+        self.byte_counts = byte_counts
+        self.ebcdic = self.newline != b'\n'
+        self.line_ends = (self.newline, self.carriage_return) + (('\x85'.encode(encoding),) if self.ebcdic else ())
+        self._text_line_end = re.compile('(\r\n|[\r\n\x85])' if self.ebcdic else '(\r\n|[\r\n])')
+        crlf, cr, nl = self.carriage_return + self.newline, re.escape(self.carriage_return), re.escape(self.newline)
+        self._raw_line_end = re.compile(b'(' + re.escape(crlf) + b'|[' + cr + nl + b'])')
+        self.partial = b''
+
+    def _split_text(self, text: str) -> list:
+        if '\r' in text or (self.ebcdic and '\x85' in text):
+            parts = self._text_line_end.split(text)
+            tail = parts.pop()
+            ends = parts[1::2]
+            parts = parts[0::2]
+        else:
+            parts = text.split('\n')
+            tail = parts.pop()
+            ends = None
+        if not self.byte_counts:
+            lines = [part + '\n' for part in parts]
+        elif ends is None:
+            lines = [(len(part) + 1, part + '\n') for part in parts]
+        else:
+            lines = [(len(part) + len(end), part + '\n') for part, end in zip(parts, ends)]
+        if tail:
+            lines.append((len(tail), tail) if self.byte_counts else tail)
+        return lines
+
+    def _split_raw(self, data: bytes) -> List[Tuple[int, str]]:
+        encoding = self.encoding
+        if self.carriage_return in data:
+            parts = self._raw_line_end.split(data)
+            tail = parts.pop()
+            lines = [(len(raw) + len(end), raw.decode(encoding) + '\n') for raw, end in zip(parts[0::2], parts[1::2])]
+        else:
+            raws = data.split(self.newline)
+            tail = raws.pop()
+            lines = [(len(raw) + 1, raw.decode(encoding) + '\n') for raw in raws]
+        if tail:
+            lines.append((len(tail), tail.decode(encoding)))
+        return lines
+
+    def _decode(self, data: bytes) -> list:
+        if self.single_byte or not self.byte_counts:
+            return self._split_text(data.decode(self.encoding))
+        return self._split_raw(data)
+
+    def _line_end(self, data: bytes, end: int) -> int:
+        return max(data.rfind(line_end, 0, end) for line_end in self.line_ends) + 1
+
+    def feed(self, data: bytes) -> list:
+        '''
+        The complete lines of data, following the partial line of the previous block.
+        '''
+        if self.partial:
+            data = self.partial + data
+        end = self._line_end(data, len(data))
+        if end == len(data) and data.endswith(self.carriage_return):
+            end = self._line_end(data, end - 1)  # The '\r' may be the first half of a '\r\n'.
+        self.partial = data[end:]
+        return self._decode(data[:end]) if end else []
+
+    def finish(self) -> list:
+        '''
+        The lines left at the end of the data (a last line without a newline, or ending in '\\r'), if any.
+        '''
+        partial, self.partial = self.partial, b''
+        return self._decode(partial) if partial else []
+
+    def reset(self) -> None:
+        self.partial = b''
+
+
+class LineReader(io.TextIOBase):
+    '''
+    A text stream of the lines of a binary stream, read block_size bytes at a time and split by a LineDecoder.
+    Closing the reader closes the binary stream.
+    '''
+
+    def __init__(self, raw, encoding: Optional[str] = None, block_size: int = DEFAULT_BLOCK_SIZE):
+        super().__init__()
+        self._raw = raw
+        self._decoder = LineDecoder(encoding, byte_counts=False)
+        self._block_size = block_size
+        self._lines = chain.from_iterable(self._iter_blocks())
+
+    @property
+    def encoding(self):
+        return self._decoder.encoding
+
+    def _iter_blocks(self) -> Iterator[List[str]]:
+        read, block_size, decoder = self._raw.read1, self._block_size, self._decoder
+        while True:
+            data = read(block_size)
+            if not data:
+                break
+            yield decoder.feed(data)
+        yield decoder.finish()
+
+    def readable(self):
+        return True
+
+    def __iter__(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        return self._lines
+
+    def __next__(self):
+        return next(self._lines)
+
+    def readline(self, size=-1):
+        return next(self._lines, '')
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+def _text_reader(raw: io.BufferedReader, encoding: Optional[str], block_size: int) -> io.TextIOBase:
+    '''
+    A LineReader over raw for EBCDIC code pages (to end lines with NEL too), else a TextIOWrapper (the same
+    universal newlines, split in C).
+    '''
+    newline = '\n'.encode(encoding or locale.getpreferredencoding(False))
+    if len(newline) == 1 and newline != b'\n':
+        return LineReader(raw, encoding=encoding, block_size=block_size)
+    return io.TextIOWrapper(raw, encoding=encoding)
+
+
+def iter_lines_at(file_path: str, offset: int = 0, encoding: Optional[str] = None,
+                  block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[Tuple[int, str]]:
+    '''
+    Iterate the lines of a (possibly compressed) file starting at byte offset, yielding (byte_count, line).
+    Offsets of compressed files are offsets into the decompressed data.
+
+    Blocks of block_size bytes are split into lines by a LineDecoder, and '\\r\\n' is translated to '\\n'.
+    '''
+    decoder = LineDecoder(encoding)
+    compression = detect_compression(file_path)
+    if compression is None:
+        f = open(file_path, 'rb', buffering=0)
+    else:
+        f = {name: opener for _, name, opener in COMPRESSION_MAGIC}[compression](file_path, 'rb')
+    with f:
+        if offset:
+            f.seek(offset)
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            yield from decoder.feed(data)
+        yield from decoder.finish()
+
+
+def decode_line(raw: bytes, encoding: str) -> str:
+    '''
+    Decode a raw line, translating a '\\r\\n' line end to '\\n'.
+    '''
+    line = raw.decode(encoding)
+    if line.endswith('\r\n'):
+        line = line[:-2] + '\n'
+    return line
+
+
+def _iter_decoded(lines, encoding: Optional[str]) -> Iterator[str]:
+    '''
+    Iterate an iterable of str or bytes lines as str lines.
+    '''
+    it = iter(lines)
+    first = next(it, None)
+    if first is None:
+        return
+    lines = chain((first,), it)
+    if isinstance(first, (bytes, bytearray)):
+        encoding = encoding or 'utf-8'
+        for line in lines:
+            yield line.decode(encoding)
+    else:
+        yield from lines
+
+
+def source_name(source) -> str:
+    '''
+    A name for messages: the path, the file object's name, or '<stream>'.
+    '''
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    name = getattr(source, 'name', None)
+    return name if isinstance(name, str) else '<stream>'
+
+
+@contextmanager
+def open_lines(source, encoding: Optional[str] = None, block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[str]:
+    '''
+    Open any line source for iteration of str lines...
+
+      - str or os.PathLike: A file path, opened with open_text() (so compressed files work too).
+      - io.TextIOBase: A text file object (e.g. sys.stdin, io.StringIO), iterated as is.
+      - An object with read(): A binary file object (e.g. sys.stdin.buffer, a pipe, a socket's makefile('rb'),
+        mmap, io.BytesIO). It is read in blocks of block_size bytes and decoded incrementally.
+      - Any other iterable: Lines as str, or as bytes (decoded with encoding, default utf-8).
+
+    File objects passed in are not closed.
+    '''
+    if isinstance(source, (str, os.PathLike)):
+        with open_text(os.fspath(source), encoding=encoding, block_size=block_size) as f:
+            yield f
+    elif isinstance(source, io.TextIOBase):
+        yield source
+    elif hasattr(source, 'read'):
+        with _text_reader(io.BufferedReader(_ReadAdapter(source), buffer_size=block_size), encoding, block_size) as f:
+            yield f
+    else:
+        yield _iter_decoded(source, encoding)
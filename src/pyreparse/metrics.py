@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+'''
+Operational metrics of long-running parses: PyReParse.start_metrics().
+
+A ParseMetrics registry exports, in the Prometheus text format...
+
+  - pyreparse_lines_total, pyreparse_input_bytes_total: Input lines and bytes processed.
+  - pyreparse_sections_total: Sections started (FLAG_NEW_SECTION matches).
+  - pyreparse_pattern_matches_total{pattern="..."}: Lines matched per pattern.
+  - pyreparse_quick_check_misses_total{pattern="..."}: Lines a pattern's re_quick_check caught but its regexp
+    missed.
+  - pyreparse_sum_check_failures_total{pattern="..."}: Sum checks failed per pattern.
+  - pyreparse_workers: Parsers (streams, parallel chunk workers) currently running.
+  - pyreparse_lines_per_second, pyreparse_input_bytes_per_second: Throughput since the first parse started.
+  - pyreparse_input_size_bytes, pyreparse_eta_seconds: The size of the inputs, and the time left to process
+    them at the current throughput. Only known for uncompressed files given by path.
+
+The hot loop only increments plain counters: each PyReParse instance counts its sections, and its matches, quick
+check misses and sum check failures per pattern (match()), and the file APIs count lines and bytes through metered()
+when metrics are on.
+Nothing is locked or formatted per line: the registry samples the counters of the running parsers when it is
+scraped, and folds a parser's counts into its totals when the parser finishes.
+
+Clones share their instance's registry, so the workers of parse_file_parallel() are aggregated: each chunk is
+tracked while it is parsed. Worker processes (BACKEND_PROCESSES) return their counts with each batch of chunks,
+which are merged as the batches complete.
+
+Bytes are the characters of the decoded lines (the bytes of single-byte encodings, less one per line for \\r\\n
+line ends), except for checkpointed and followed streams, which count the file's bytes. Cached chunks (see
+cache.py) count their lines and bytes, but not their sections and matches, which were not parsed again.
+
+Export by scraping the registry's HTTP endpoint (serve(), GET /metrics), or by letting it rewrite a file every
+interval seconds (start_textfile(), e.g. for node_exporter's textfile collector). Files are replaced atomically.
+'''
+
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple
+
+from .inputs import detect_compression
+
+DEFAULT_INTERVAL = 15.0  # Seconds between rewrites of the metrics file.
+DEFAULT_HTTP_HOST = '127.0.0.1'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def input_size(source, offset: int = 0) -> Optional[int]:
+    '''
+    The bytes left to read of a source from offset: the file size for an uncompressed file path, else None.
+    '''
+    if not isinstance(source, (str, os.PathLike)) or not os.path.isfile(source):
+        return None
+    if detect_compression(source) is not None:
+        return None  # The decompressed size is not known up front.
+    return max(os.path.getsize(source) - offset, 0)
+
+
+def _empty_counts() -> Dict[str, Any]:
+    return {'lines': 0, 'bytes': 0, 'sections': 0, 'matches': {}, 'quick_check_misses': {}, 'sum_check_failures': {}}
+
+
+def _add_counts(total: Dict[str, Any], counts: Dict[str, Any]) -> None:
+    for key in ('lines', 'bytes', 'sections'):
+        total[key] += counts.get(key, 0)
+    for key in ('matches', 'quick_check_misses', 'sum_check_failures'):
+        per_pattern = total[key]
+        for pat_name, count in counts.get(key, {}).items():
+            per_pattern[pat_name] = per_pattern.get(pat_name, 0) + count
+
+
+def _since(counts: Dict[str, int], base: Dict[str, int]) -> Dict[str, int]:
+    return {pat_name: count - base.get(pat_name, 0) for pat_name, count in dict(counts).items()}
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Probe:
+    '''
+    A running parser: the lines and bytes it was fed, and the baselines of its own counters when tracking
+    started (an instance may have parsed before).
+    '''
+    __slots__ = ('prp', 'lines', 'bytes', 'sections_base', 'matches_base', 'misses_base', 'failures_base')
+
+    def __init__(self, prp):
+        self.prp = prp
+        self.lines = 0
+        self.bytes = 0
+        self.sections_base = prp.section_count
+        self.matches_base = dict(prp.match_counts)
+        self.misses_base = dict(prp.quick_check_miss_counts)
+        self.failures_base = dict(prp.sum_check_fail_counts)
+
+    def counts(self) -> Dict[str, Any]:
+        prp = self.prp
+        return {
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'sections': prp.section_count - self.sections_base,
+            'matches': _since(prp.match_counts, self.matches_base),
+            'quick_check_misses': _since(prp.quick_check_miss_counts, self.misses_base),
+            'sum_check_failures': _since(prp.sum_check_fail_counts, self.failures_base),
+        }
+
+
+class ParseMetrics:
+    '''
+    The metrics registry, see the module docstring. Thread-safe.
+    '''
+
+    def __init__(self):
+        self.expected_bytes = 0
+        self.has_size = False
+        self.started = None  # time.monotonic() of the first parse.
+        self.http_port = None
+        self.textfile = None
+        self._totals = _empty_counts()
+        self._probes = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._writer = None
+        self._stop = None  # Set to stop the current writer (each start_textfile() gets a new event).
+
+    def _start_clock(self) -> None:
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def add_expected(self, size: Optional[int]) -> None:
+        '''
+        Add the size of an input about to be parsed (None when unknown) to the progress total.
+        '''
+        if size is not None:
+            with self._lock:
+                self.expected_bytes += size
+                self.has_size = True
+
+    def track(self, prp) -> _Probe:
+        '''
+        Start sampling a parser's counters. release() the returned probe when it is done.
+        '''
+        probe = _Probe(prp)
+        with self._lock:
+            self._start_clock()
+            self._probes.add(probe)
+        return probe
+
+    def release(self, probe: _Probe) -> None:
+        with self._lock:
+            if probe in self._probes:
+                self._probes.discard(probe)
+                _add_counts(self._totals, probe.counts())
+
+    def merge(self, counts: Dict[str, Any]) -> None:
+        '''
+        Add counts (as returned by counts()) of a parse done elsewhere, e.g. in a worker process.
+        '''
+        with self._lock:
+            self._start_clock()
+            _add_counts(self._totals, counts)
+
+    def metered(self, prp, lines: Iterable[str], size: Optional[int] = None) -> Iterator[str]:
+        '''
+        Iterate lines, counting them for the parser prp (tracked while iterating).
+        '''
+        self.add_expected(size)
+        probe = self.track(prp)
+        try:
+            for line in lines:
+                probe.lines += 1
+                probe.bytes += len(line)
+                yield line
+        finally:
+            self.release(probe)
+
+    def metered_at(self, prp, lines: Iterable[Tuple[int, str]],
+                   size: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        '''
+        metered() for (n_bytes, line) pairs, as read by checkpointed and followed streams.
+        '''
+        self.add_expected(size)
+        probe = self.track(prp)
+        try:
+            for n_bytes, line in lines:
+                probe.lines += 1
+                probe.bytes += n_bytes
+                yield n_bytes, line
+        finally:
+            self.release(probe)
+
+    async def ametered(self, prp, lines: AsyncIterator[str]) -> AsyncIterator[str]:
+        '''
+        metered() for async generators of lines, which are closed with this one.
+        '''
+        probe = self.track(prp)
+        try:
+            async for line in lines:
+                probe.lines += 1
+                probe.bytes += len(line)
+                yield line
+        finally:
+            self.release(probe)
+            await lines.aclose()
+
+    def counts(self) -> Dict[str, Any]:
+        '''
+        The counters so far, those of the running parsers included.
+        '''
+        with self._lock:
+            total = _empty_counts()
+            _add_counts(total, self._totals)
+            for probe in self._probes:
+                _add_counts(total, probe.counts())
+        return total
+
+    def sample(self) -> Dict[str, Any]:
+        '''
+        counts(), plus workers, uptime (seconds since the first parse), lines_per_second, bytes_per_second,
+        and input_size and eta_seconds (None when an input's size is unknown).
+        '''
+        sample = self.counts()
+        with self._lock:
+            sample['workers'] = len(self._probes)
+            started = self.started
+            size = self.expected_bytes if self.has_size else None
+        uptime = time.monotonic() - started if started is not None else 0.0
+        sample['uptime'] = uptime
+        sample['lines_per_second'] = sample['lines'] / uptime if uptime > 0 else 0.0
+        sample['bytes_per_second'] = bytes_rate = sample['bytes'] / uptime if uptime > 0 else 0.0
+        sample['input_size'] = size
+        sample['eta_seconds'] = None
+        if size is not None and bytes_rate > 0:
+            sample['eta_seconds'] = max(size - sample['bytes'], 0) / bytes_rate
+        return sample
+
+    def to_prometheus(self) -> str:
+        '''
+        The current sample() in the Prometheus text exposition format.
+        '''
+        sample = self.sample()
+        out = []
+
+        def metric(name, kind, help_text, value, samples=None):
+            out.append(f'# HELP pyreparse_{name} {help_text}')
+            out.append(f'# TYPE pyreparse_{name} {kind}')
+            if samples is None:
+                out.append(f'pyreparse_{name} {value}')
+            for labels, val in samples or ():
+                out.append(f'pyreparse_{name}{{{labels}}} {val}')
+
+        metric('lines_total', 'counter', 'Input lines processed.', sample['lines'])
+        metric('input_bytes_total', 'counter', 'Input bytes processed.', sample['bytes'])
+        metric('sections_total', 'counter', 'Sections started.', sample['sections'])
+        metric('pattern_matches_total', 'counter', 'Lines matched per pattern.', None,
+               [(f'pattern="{_escape_label(pat_name)}"', count)
+                for pat_name, count in sorted(sample['matches'].items())])
+        metric('quick_check_misses_total', 'counter', 'Lines caught by a quick check but missed by its regexp.', None,
+               [(f'pattern="{_escape_label(pat_name)}"', count)
+                for pat_name, count in sorted(sample['quick_check_misses'].items())])
+        metric('sum_check_failures_total', 'counter', 'Sum checks failed.', None,
+               [(f'pattern="{_escape_label(pat_name)}"', count)
+                for pat_name, count in sorted(sample['sum_check_failures'].items())])
+        metric('workers', 'gauge', 'Parsers currently running.', sample['workers'])
+        metric('uptime_seconds', 'gauge', 'Seconds since the first parse started.', f"{sample['uptime']:.3f}")
+        metric('lines_per_second', 'gauge', 'Lines processed per second.', f"{sample['lines_per_second']:.1f}")
+        metric('input_bytes_per_second', 'gauge', 'Input bytes processed per second.',
+               f"{sample['bytes_per_second']:.1f}")
+        if sample['input_size'] is not None:
+            metric('input_size_bytes', 'gauge', 'Total size of the inputs.', sample['input_size'])
+        if sample['eta_seconds'] is not None:
+            metric('eta_seconds', 'gauge', 'Estimated seconds until the inputs are processed.',
+                   f"{sample['eta_seconds']:.1f}")
+        return '\n'.join(out) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        '''
+        Write to_prometheus() to path, atomically.
+        '''
+        text = self.to_prometheus()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                fh.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def start_textfile(self, path: str, interval: float = DEFAULT_INTERVAL) -> None:
+        '''
+        Rewrite the metrics file every interval seconds (and once more on close()), on a daemon thread.
+        '''
+        if interval <= 0:
+            raise ValueError('interval must be > 0')
+        if self._writer is not None:
+            raise ValueError('A metrics file is already being written.')
+        self.textfile = path
+        self.write_textfile(path)
+        self._stop = stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.write_textfile(path)
+
+        self._writer = threading.Thread(target=run, name='pyreparse-metrics-file', daemon=True)
+        self._writer.start()
+
+    def serve(self, port: int = 0, host: str = DEFAULT_HTTP_HOST) -> int:
+        '''
+        Serve to_prometheus() at http://host:port/metrics on a daemon thread.
+        :return: The port (chosen by the system when port is 0), also set as http_port.
+        '''
+        if self._server is not None:
+            raise ValueError('Metrics are already being served.')
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.http_port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='pyreparse-metrics-http', daemon=True).start()
+        return self.http_port
+
+    def close(self) -> None:
+        '''
+        Stop the HTTP endpoint and the file writer, writing the file a last time. Both can be started again.
+        '''
+        if self._writer is not None:
+            self._stop.set()
+            self._writer.join()
+            self._writer = None
+            self.write_textfile(self.textfile)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
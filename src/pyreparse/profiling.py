@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+'''
+Profiling of a patterns spec over a report file: python -m pyreparse profile <spec-module> <file>
+
+The spec's compiled regexps and trigger functions are wrapped with timing proxies, then the file is run through one
+of the file APIs...
+
+  - loop:     match() on each line.
+  - stream:   stream_matches().
+  - serial:   parse_file().
+  - parallel: parse_file_parallel() (threads). Clones share the wrapped spec, so workers are profiled too.
+
+The report gives lines/s, a per-pattern table of match attempts, matches and regexp time, trigger function calls
+and time, quick-check misses and sum check failures (read from the parsers' counters through start_metrics(), so
+clones are counted too), and the peak RSS. PyReParse's messages are suppressed unless --messages is given. --cprofile / --pstats add cProfile output for deeper analysis.
+
+Times are wall clock times, so in the parallel mode they include waits for the GIL (on builds that have one).
+In the serial and parallel modes, attempts of FLAG_NEW_SECTION / FLAG_NEW_REPORT patterns include the pass that
+splits the file into chunks.
+'''
+
+import argparse
+import cProfile
+import importlib
+import importlib.util
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+
+from .PyReParse import PyReParse
+from .inputs import open_text
+from .spill import peak_rss
+
+MODES = ('loop', 'stream', 'serial', 'parallel')
+
+# Per-pattern stat slots
+ATTEMPTS, MATCHES, MATCH_TIME, TRIGGER_CALLS, TRIGGER_TIME = range(5)
+
+
+
+def load_spec(spec_ref: str) -> Dict[str, Any]:
+    '''
+    Load a patterns spec dict from 'module[:attr]', where module is a dotted module name or a .py file path, and
+    attr a (dotted) attribute path, e.g. 'pyreparse.example.pyreparse_example:PyReParse_Example.test_re_lines'.
+    Without attr, the one spec dict found in the module's globals (or its classes' attributes) is used.
+    '''
+    module_ref, _, attr = spec_ref.partition(':')
+    if module_ref.endswith('.py') or os.path.sep in module_ref:
+        name = os.path.splitext(os.path.basename(module_ref))[0]
+        mod_spec = importlib.util.spec_from_file_location(name, module_ref)
+        if mod_spec is None:
+            raise ValueError(f'Can not load spec module [{module_ref}]')
+        module = importlib.util.module_from_spec(mod_spec)
+        mod_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_ref)
+    if attr:
+        obj = module
+        for part in attr.split('.'):
+            obj = getattr(obj, part)
+        if not _is_spec(obj):
+            raise ValueError(f'[{spec_ref}] is not a PyReParse patterns dict')
+        return obj
+
+    found = {}
+    for name, obj in vars(module).items():
+        if _is_spec(obj):
+            found[name] = obj
+        elif isinstance(obj, type) and obj.__module__ == module.__name__:
+            for cls_attr, cls_obj in vars(obj).items():
+                if _is_spec(cls_obj):
+                    found[f'{name}.{cls_attr}'] = cls_obj
+    if len(found) != 1:
+        raise ValueError(f'Found {len(found)} patterns dicts in [{module_ref}] {sorted(found)}, '
+                         f'select one with {module_ref}:<attr>')
+    return next(iter(found.values()))
+
+
+def _is_spec(obj) -> bool:
+    return (isinstance(obj, dict) and len(obj) > 0 and
+            all(isinstance(d, dict) and PyReParse.INDEX_RE_STRING in d for d in obj.values()))
+
+
+class _TimedRegexp:
+    '''
+    A compiled regexp proxy that counts and times match() calls.
+    '''
+    __slots__ = ('_regexp', '_pat_name', '_profiler')
+
+    def __init__(self, regexp, pat_name, profiler):
+        self._regexp = regexp
+        self._pat_name = pat_name
+        self._profiler = profiler
+
+    def match(self, *args):
+        start = time.perf_counter()
+        m = self._regexp.match(*args)
+        elapsed = time.perf_counter() - start
+        stats = self._profiler.stats(self._pat_name)
+        stats[ATTEMPTS] += 1
+        stats[MATCH_TIME] += elapsed
+        if m:
+            stats[MATCHES] += 1
+        return m
+
+    def __getattr__(self, name):
+        return getattr(self._regexp, name)
+
+
+class Profiler:
+    '''
+    Wraps the regexps and trigger functions of a loaded PyReParse instance with timing proxies.
+    Stats are kept per thread (so parallel workers don't race) and summed by pattern_stats().
+    '''
+
+    def __init__(self, prp: PyReParse):
+        self.prp = prp
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_stats: List[Dict[str, List[float]]] = []
+        rtrpc = PyReParse
+        for pat_name, pat_def in prp.re_defs.items():
+            if pat_def.get(rtrpc.INDEX_RE_REGEXP) is not None:
+                pat_def[rtrpc.INDEX_RE_REGEXP] = _TimedRegexp(pat_def[rtrpc.INDEX_RE_REGEXP], pat_name, self)
+            for key in (rtrpc.INDEX_RE_TRIGGER_ON_FUNC, rtrpc.INDEX_RE_TRIGGER_OFF_FUNC):
+                if pat_def.get(key) is not None:
+                    pat_def[key] = self._timed_trigger(pat_def[key], pat_name)
+        prp.report_boundaries = [(pat_name, prp.re_defs[pat_name][rtrpc.INDEX_RE_REGEXP])
+                                 for pat_name, _ in prp.report_boundaries]
+
+    def stats(self, pat_name: str) -> List[float]:
+        thread_stats = getattr(self._local, 'stats', None)
+        if thread_stats is None:
+            thread_stats = self._local.stats = {}
+            with self._lock:
+                self._thread_stats.append(thread_stats)
+        stats = thread_stats.get(pat_name)
+        if stats is None:
+            stats = thread_stats[pat_name] = [0, 0, 0.0, 0, 0.0]
+        return stats
+
+    def _timed_trigger(self, func, pat_name):
+        def timed_trigger(prp_inst, trig_pat_name, trigger_name):
+            start = time.perf_counter()
+            try:
+                return func(prp_inst, trig_pat_name, trigger_name)
+            finally:
+                stats = self.stats(pat_name)
+                stats[TRIGGER_CALLS] += 1
+                stats[TRIGGER_TIME] += time.perf_counter() - start
+        return timed_trigger
+
+    def pattern_stats(self) -> Dict[str, List[float]]:
+        '''
+        {pattern: [attempts, matches, match_time, trigger_calls, trigger_time]} summed over all threads.
+        '''
+        totals = {pat_name: [0, 0, 0.0, 0, 0.0] for pat_name in self.prp.re_defs}
+        with self._lock:
+            for thread_stats in self._thread_stats:
+                for pat_name, stats in thread_stats.items():
+                    totals[pat_name] = [a + b for a, b in zip(totals[pat_name], stats)]
+        return totals
+
+
+def run_profile(spec: Dict[str, Any], file_path: str, mode: str = 'loop', max_workers: int = 4,
+                cprofile_path: Optional[str] = None, pstats_count: int = 0, messages=None,
+                encoding: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    Profile spec over file_path in one of MODES. Returns the figures printed by format_profile().
+
+    :param cprofile_path: Dump cProfile stats to this file (load with pstats or snakeviz).
+    :param pstats_count: Also collect the top N functions by cumulative time, as text.
+    :param messages: A stream to echo PyReParse's messages to (default: they are discarded).
+    :param encoding: The file's encoding (default: the locale's).
+    '''
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', use one of {MODES}")
+    prp = PyReParse(spec)
+    profiler = Profiler(prp)
+    prp.set_file_name(file_path)
+    with open_text(file_path, encoding=encoding) as f:
+        lines = sum(1 for _ in f)
+
+    metrics = prp.start_metrics()
+    cprof = cProfile.Profile() if cprofile_path or pstats_count else None
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull if messages is None else messages):
+        if cprof is not None:
+            cprof.enable()
+        start = time.perf_counter()
+        if mode == 'loop':
+            with open_text(file_path, encoding=encoding) as f:
+                for line in metrics.metered(prp, f):
+                    prp.match(line)
+                prp.flush_batches()
+        elif mode == 'stream':
+            for _ in prp.stream_matches(file_path, encoding=encoding):
+                pass
+        elif mode == 'serial':
+            prp.parse_file(file_path, encoding=encoding)
+        else:
+            prp.parse_file_parallel(file_path, max_workers=max_workers, encoding=encoding)
+        elapsed = time.perf_counter() - start
+        if cprof is not None:
+            cprof.disable()
+    prp.stop_metrics()
+    counts = metrics.counts()
+
+    pstats_text = None
+    if cprof is not None:
+        if cprofile_path:
+            cprof.dump_stats(cprofile_path)
+        if pstats_count:
+            out = io.StringIO()
+            pstats.Stats(cprof, stream=out).sort_stats('cumulative').print_stats(pstats_count)
+            pstats_text = out.getvalue()
+
+    return {
+        'file_path': file_path,
+        'mode': mode,
+        'lines': lines,
+        'elapsed': elapsed,
+        'patterns': profiler.pattern_stats(),
+        'quick_check_misses': {pat_name: count for pat_name, count in counts['quick_check_misses'].items() if count},
+        'sum_check_failures': {pat_name: count for pat_name, count in counts['sum_check_failures'].items() if count},
+        'peak_rss': peak_rss(),
+        'pstats': pstats_text,
+    }
+
+
+def format_profile(result: Dict[str, Any]) -> str:
+    '''
+    Format a run_profile() result as a text report.
+    '''
+    elapsed = result['elapsed']
+    rate = result['lines'] / elapsed if elapsed > 0 else float('inf')
+    rss = result['peak_rss']
+    out = [f"File: {result['file_path']}",
+           f"Mode: {result['mode']}  Lines: {result['lines']:,}  Elapsed: {elapsed:.3f}s  "
+           f"Lines/s: {rate:,.0f}  Peak RSS: {'n/a' if rss is None else f'{rss / 1e6:,.1f} MB'}",
+           '',
+           f"{'Pattern':<24} {'Attempts':>10} {'Matches':>9} {'Match ms':>10} {'us/try':>7} "
+           f"{'Trig calls':>10} {'Trig ms':>9} {'QC miss':>7}"]
+    totals = [0, 0, 0.0, 0, 0.0]
+    qc = result['quick_check_misses']
+    for pat_name, stats in result['patterns'].items():
+        attempts, matches, match_time, trig_calls, trig_time = stats
+        per_try = match_time * 1e6 / attempts if attempts else 0.0
+        out.append(f'{pat_name:<24} {attempts:>10,} {matches:>9,} {match_time * 1e3:>10.1f} {per_try:>7.2f} '
+                   f'{trig_calls:>10,} {trig_time * 1e3:>9.1f} {qc.get(pat_name, 0):>7,}')
+        totals = [a + b for a, b in zip(totals, stats)]
+    out.append(f"{'Total':<24} {totals[ATTEMPTS]:>10,} {totals[MATCHES]:>9,} {totals[MATCH_TIME] * 1e3:>10.1f} "
+               f"{'':>7} {totals[TRIGGER_CALLS]:>10,} {totals[TRIGGER_TIME] * 1e3:>9.1f} {sum(qc.values()):>7,}")
+    out.append('')
+    share = totals[TRIGGER_TIME] / elapsed * 100 if elapsed > 0 else 0.0
+    out.append(f'Trigger cost: {totals[TRIGGER_CALLS]:,} calls, {totals[TRIGGER_TIME] * 1e3:.1f} ms '
+               f'({share:.1f}% of elapsed)')
+    out.append(f'Quick-check misses: {sum(qc.values()):,}  '
+               f"Sum check failures: {sum(result['sum_check_failures'].values()):,}")
+    if result['pstats']:
+        out += ['', result['pstats']]
+    return '\n'.join(out)
+
+
+def add_parser(subparsers) -> argparse.ArgumentParser:
+    parser = subparsers.add_parser('profile', help='Profile a patterns spec over a report file',
+                                   description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('spec', help="Spec module[:attr], e.g. 'mypkg.specs:NSF_PATTERNS' or 'specs.py'")
+    parser.add_argument('file_path', help='Report file to parse (may be gzip, bz2 or xz compressed)')
+    parser.add_argument('--mode', choices=MODES, default='loop', help='File API to profile (default: loop)')
+    parser.add_argument('--workers', type=int, default=4, help='max_workers of the parallel mode')
+    parser.add_argument('--cprofile', metavar='PATH', help='Dump cProfile stats to PATH')
+    parser.add_argument('--pstats', type=int, default=0, metavar='N',
+                        help='Print the top N functions by cumulative time')
+    parser.add_argument('--messages', action='store_true', help="Echo PyReParse's messages to stderr")
+    parser.add_argument('--encoding', help="The file's encoding, e.g. cp037 (default: the locale's)")
+    parser.set_defaults(func=main)
+    return parser
+
+
+def main(args) -> int:
+    spec = load_spec(args.spec)
+    result = run_profile(spec, args.file_path, mode=args.mode, max_workers=args.workers,
+                         cprofile_path=args.cprofile, pstats_count=args.pstats,
+                         messages=sys.stderr if args.messages else None, encoding=args.encoding)
+    print(format_profile(result))
+    return 0
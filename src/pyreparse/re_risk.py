@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+
+'''
+Regex risk analysis: catastrophic backtracking checks for a patterns spec, before it ships.
+
+Opt-in through validate_re_defs(patterns, check_risk=True), or: python -m pyreparse risk <spec-module>
+
+Static checks walk each regexp's parse tree (sre_parse)...
+  - nested:     A variable quantifier inside another one, e.g. (\\d+\\s?)+, can backtrack exponentially.
+  - adjacent:   Neighbouring variable quantifiers over overlapping characters, e.g. [\\-\\$\\s\\d\\,]+\\s+ or .*\\s*,
+                can split a run of shared characters in many ways (polynomial backtracking).
+  - whitespace: An adjacent overlap involving \\s, the typical case in fixed-column reports (reported as an
+                ambiguous whitespace run).
+
+Then each pattern is fuzzed with adversarial lines: lines generated to match up to an ambiguous quantifier (or the
+pattern's quick-check), followed by a growing run of the overlapping character and a character that makes the match
+fail, and truncated variants of a generated matching line (corrupt or truncated rows). The worst match() time seen,
+its line, and the growth of the time with the run length are reported.
+
+The fuzzing steps the run length up slowly and stops once a match takes longer than time_limit, so even exponential
+patterns are fuzzed in bounded time.
+'''
+
+import math
+import re
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+MAXREPEAT = sre_constants.MAXREPEAT
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+# Possessive quantifiers and atomic groups (Python 3.11+) do not backtrack.
+_NO_BACKTRACK = tuple(getattr(sre_constants, name) for name in ('POSSESSIVE_REPEAT', 'ATOMIC_GROUP')
+                      if hasattr(sre_constants, name))
+
+# Characters considered when comparing character sets.
+ALPHABET = frozenset(chr(i) for i in range(128))
+_SPACE = frozenset(' \t\n\r\f\v')
+_DIGIT = frozenset('0123456789')
+_WORD = frozenset(c for c in ALPHABET if c.isalnum() or c == '_')
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: _DIGIT,
+    sre_constants.CATEGORY_NOT_DIGIT: ALPHABET - _DIGIT,
+    sre_constants.CATEGORY_SPACE: _SPACE,
+    sre_constants.CATEGORY_NOT_SPACE: ALPHABET - _SPACE,
+    sre_constants.CATEGORY_WORD: _WORD,
+    sre_constants.CATEGORY_NOT_WORD: ALPHABET - _WORD,
+}
+# Preferred characters when generating text for a character set.
+_PREFERRED = 'a0 A.$,-/:b1'
+
+DEFAULT_TIME_LIMIT = 0.05   # Seconds per match() before the fuzzing of a candidate stops.
+DEFAULT_MAX_RUN = 512       # Longest run of an ambiguous character tried.
+RISK_WARN_TIME = 0.01       # validate_re_defs() warns when a fuzzed match() took longer.
+EXPONENTIAL_GROWTH = 6.0    # Growth exponents from here on are reported as exponential.
+
+
+class Finding(NamedTuple):
+    kind: str      # 'nested', 'adjacent' or 'whitespace'
+    message: str
+
+
+class RiskReport(NamedTuple):
+    pattern: str
+    findings: List[Finding]
+    worst_time: float      # Seconds of the slowest fuzzed match().
+    worst_line: str
+    growth: Optional[float]  # Exponent k of time ~ run_length ** k, from the last doubling of the run (None: n/a).
+
+
+def _char_set(op, av) -> Optional[frozenset]:
+    '''
+    The characters (within ALPHABET) matched by a single character item, or None if it is not one.
+    '''
+    if op == sre_constants.LITERAL:
+        return frozenset((chr(av),))
+    if op == sre_constants.NOT_LITERAL:
+        return ALPHABET - {chr(av)}
+    if op == sre_constants.ANY:
+        return ALPHABET - {'\n'}
+    if op == sre_constants.IN:
+        chars = set()
+        negate = False
+        for item_op, item_av in av:
+            if item_op == sre_constants.NEGATE:
+                negate = True
+            elif item_op == sre_constants.LITERAL:
+                chars.add(chr(item_av))
+            elif item_op == sre_constants.RANGE:
+                chars.update(chr(i) for i in range(item_av[0], min(item_av[1], 127) + 1))
+            elif item_op == sre_constants.CATEGORY:
+                chars.update(_CATEGORIES.get(item_av, ()))
+            else:
+                return None
+        return ALPHABET - chars if negate else frozenset(chars)
+    return None
+
+
+def _repeat_set(op, av) -> Optional[frozenset]:
+    '''
+    The character set of a quantifier over a single character item (e.g. [\\d,]+), else None.
+    '''
+    if op in _REPEATS:
+        body = list(av[2])
+        if len(body) == 1:
+            return _char_set(*body[0])
+    return None
+
+
+def _is_variable(op, av) -> bool:
+    return op in _REPEATS and av[0] != av[1] and av[1] > 1
+
+
+def _flatten(items) -> List[Tuple[Any, Any]]:
+    '''
+    A sequence with capture groups expanded inline (groups do not change what is matched).
+    '''
+    flat = []
+    for op, av in items:
+        if op == sre_constants.SUBPATTERN and not av[1] and not av[2]:
+            flat.extend(_flatten(av[3]))
+        else:
+            flat.append((op, av))
+    return flat
+
+
+def _describe(chars: frozenset) -> str:
+    if chars == ALPHABET - {'\n'}:
+        return '.'
+    for name, cat in (('\\S', _SPACE), ('\\D', _DIGIT), ('\\W', _WORD)):
+        if chars == ALPHABET - cat:
+            return name
+    if len(ALPHABET - chars) <= 4:
+        return '[^' + ''.join(sorted(repr(c)[1:-1] for c in ALPHABET - chars)) + ']'
+    parts = []
+    for name, cat in (('\\s', _SPACE), ('\\d', _DIGIT)):
+        if cat <= chars:
+            parts.append(name)
+            chars = chars - cat
+    if len(chars) > 12:
+        return '[' + ''.join(parts) + f'<{len(chars)} more>]'
+    return '[' + ''.join(parts) + ''.join(sorted(repr(c)[1:-1] for c in chars)) + ']'
+
+
+def _walk_sequences(items) -> Iterator[List[Tuple[Any, Any]]]:
+    '''
+    Yield every (flattened) sequence of the tree: the top level, group, branch, lookaround and repeat bodies.
+    '''
+    seq = _flatten(items)
+    yield seq
+    for op, av in seq:
+        if op in _REPEATS:
+            yield from _walk_sequences(av[2])
+        elif op == sre_constants.SUBPATTERN:
+            yield from _walk_sequences(av[3])
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                yield from _walk_sequences(branch)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            yield from _walk_sequences(av[1])
+
+
+def _contains_variable(items) -> bool:
+    for op, av in items:
+        if op in _NO_BACKTRACK:
+            continue
+        if _is_variable(op, av):
+            return True
+        if op in _REPEATS and _contains_variable(av[2]):
+            return True
+        if op == sre_constants.SUBPATTERN and _contains_variable(av[3]):
+            return True
+        if op == sre_constants.BRANCH and any(_contains_variable(branch) for branch in av[1]):
+            return True
+    return False
+
+
+def _is_nested(op, av) -> bool:
+    '''
+    A variable repeat whose body has a variable repeat that can also match the start of the next iteration, like
+    (\\d+\\s?)+ (unlike (,\\d+)*, where each iteration starts with a separator).
+    '''
+    if not _is_variable(op, av) or not _contains_variable(av[2]):
+        return False
+    body = _flatten(av[2])
+    first = (_char_set(*body[0]) or _repeat_set(*body[0])) if body else None
+    if first is None:
+        return True
+    for seq in _walk_sequences(av[2]):
+        for inner_op, inner_av in seq:
+            if _is_variable(inner_op, inner_av):
+                inner = _repeat_set(inner_op, inner_av)
+                if inner is None or inner & first:
+                    return True
+    return False
+
+
+def _ambiguous_pairs(tree) -> Iterator[Tuple[Tuple[Any, Any], Tuple[Any, Any], frozenset]]:
+    for seq in _walk_sequences(tree):
+        for (op_a, av_a), (op_b, av_b) in zip(seq, seq[1:]):
+            # A fixed count on either side leaves no choice of where one run ends and the next starts.
+            if not (_is_variable(op_a, av_a) and _is_variable(op_b, av_b)):
+                continue
+            set_a, set_b = _repeat_set(op_a, av_a), _repeat_set(op_b, av_b)
+            if set_a is not None and set_b is not None and set_a & set_b:
+                yield (op_a, av_a), (op_b, av_b), set_a & set_b
+
+
+def analyze_regex(re_string: str, flags: int = re.X) -> List[Finding]:
+    '''
+    Static risk checks of a regular expression (see the module docstring).
+    '''
+    tree = sre_parse.parse(re_string, flags)
+    findings = []
+    for seq in _walk_sequences(tree):
+        for op, av in seq:
+            if _is_nested(op, av):
+                findings.append(Finding('nested', f'Nested quantifiers: a variable repeat inside a {_quantifier(av)} '
+                                                  f'repeat can backtrack exponentially.'))
+    for (op_a, av_a), (op_b, av_b), overlap in _ambiguous_pairs(tree):
+        set_a, set_b = _repeat_set(op_a, av_a), _repeat_set(op_b, av_b)
+        kind = 'whitespace' if overlap & _SPACE else 'adjacent'
+        what = 'Ambiguous whitespace run' if kind == 'whitespace' else 'Adjacent overlapping quantifiers'
+        finding = Finding(kind, f'{what}: {_describe(set_a)}{_quantifier(av_a)} followed by '
+                                f'{_describe(set_b)}{_quantifier(av_b)} both match {_describe(overlap)}.')
+        if finding not in findings:
+            findings.append(finding)
+    return findings
+
+
+def _quantifier(av) -> str:
+    low, high = av[0], av[1]
+    if high == MAXREPEAT:
+        return {0: '*', 1: '+'}.get(low, f'{{{low},}}')
+    if low == high:
+        return f'{{{low}}}'
+    return f'{{{low},{high}}}'
+
+
+def _pick(chars: frozenset) -> str:
+    for c in _PREFERRED:
+        if c in chars:
+            return c
+    return min(chars) if chars else ''
+
+
+class _Generator:
+    '''
+    Generates text matching (a prefix of) a parse tree: the minimum count of each repeat (at least one),
+    one preferred character of each set, the first branch of alternations.
+    '''
+
+    def __init__(self, repeat_count: int = 1):
+        self.repeat_count = repeat_count
+
+    def text(self, items) -> str:
+        return ''.join(self.item(op, av) for op, av in items)
+
+    def item(self, op, av) -> str:
+        chars = _char_set(op, av)
+        if chars is not None:
+            return _pick(chars)
+        if op in _REPEATS or op in _NO_BACKTRACK and op != getattr(sre_constants, 'ATOMIC_GROUP', None):
+            low, high = av[0], av[1]
+            count = min(max(low, self.repeat_count), high)
+            return self.text(av[2]) * count
+        if op == sre_constants.SUBPATTERN:
+            return self.text(av[3])
+        if op == getattr(sre_constants, 'ATOMIC_GROUP', None):
+            return self.text(av)
+        if op == sre_constants.BRANCH:
+            return self.text(av[1][0])
+        return ''  # Anchors, lookarounds, group references.
+
+
+def _fuzz_lines(tree, quick_check: Optional[str]) -> Iterator[Tuple[str, str, str]]:
+    '''
+    Yield (prefix, run_char, suffix) candidates: the line prefix + run_char * n + suffix is matched for growing n.
+    '''
+    gen = _Generator()
+    fail = ('\x00', '!')
+    seq = _flatten(tree)
+    # Runs of the shared character of ambiguous pairs, after a matching prefix.
+    for i, (op, av) in enumerate(seq):
+        chars = _repeat_set(op, av)
+        if chars is None or not _is_variable(op, av):
+            continue
+        prefix = gen.text(seq[:i])
+        overlaps = [overlap for pair_a, _, overlap in _ambiguous_pairs(tree) if pair_a == (op, av)]
+        for run_chars in overlaps or [chars]:
+            for suffix in fail:
+                yield prefix, _pick(run_chars), suffix
+    # Nested quantifiers: runs of the whole body, and of each inner repeat's character.
+    for seq_ in _walk_sequences(tree):
+        for op, av in seq_:
+            if _is_nested(op, av):
+                prefix = gen.text(seq[:seq.index((op, av))]) if (op, av) in seq else ''
+                runs = [gen.text(av[2])]
+                runs += [_pick(chars) for inner in _walk_sequences(av[2]) for inner_op, inner_av in inner
+                         if _is_variable(inner_op, inner_av) and (chars := _repeat_set(inner_op, inner_av))]
+                for run in runs:
+                    for suffix in fail:
+                        yield prefix, run, suffix
+    # Lines matching the quick-check, continued with runs of the pattern's repeat characters.
+    if quick_check:
+        qc_prefix = _Generator().text(sre_parse.parse(quick_check, re.X))
+        for op, av in seq:
+            chars = _repeat_set(op, av)
+            if chars is not None and _is_variable(op, av):
+                yield qc_prefix, _pick(chars), fail[0]
+
+
+def _has_nested(tree) -> bool:
+    return any(_is_nested(op, av) for seq in _walk_sequences(tree) for op, av in seq)
+
+
+def _truncated_lines(tree) -> Iterator[str]:
+    # Long runs in a truncated line could take exponential time on nested quantifiers (which the runs of
+    # _fuzz_lines() approach step by step instead).
+    line = _Generator(repeat_count=1 if _has_nested(tree) else 12).text(tree)
+    for cut in sorted({len(line) * k // 16 for k in range(1, 16)}):
+        yield line[:cut] + '\x00'
+        yield line[:cut]
+
+
+def _time_match(regexp, line: str) -> float:
+    # Best of 3 (of 2 for slow matches), to filter out scheduling noise.
+    best = math.inf
+    for attempt in range(3):
+        start = time.perf_counter()
+        regexp.match(line)
+        best = min(best, time.perf_counter() - start)
+        if attempt and best > 1e-3:
+            break
+    return best
+
+
+def _growth(samples: List[Tuple[int, float]], n: int, elapsed: float) -> Optional[float]:
+    # The exponent k of elapsed ~ n ** k, against the sample nearest to half the run length.
+    if elapsed < 1e-4 or not samples:
+        return None
+    half_n, half_t = min(samples, key=lambda sample: abs(sample[0] - n / 2))
+    if half_n >= n or half_t <= 0:
+        return None
+    return math.log(elapsed / half_t) / math.log(n / half_n)
+
+
+def fuzz_regex(regexp, quick_check: Optional[str] = None, time_limit: float = DEFAULT_TIME_LIMIT,
+               max_run: int = DEFAULT_MAX_RUN) -> Tuple[float, str, Optional[float]]:
+    '''
+    Fuzz a compiled regexp with adversarial lines. Returns (worst_time, worst_line, growth), see RiskReport.
+    '''
+    tree = sre_parse.parse(regexp.pattern, regexp.flags)
+    worst_time, worst_line, growth = 0.0, '', None
+    for prefix, run, suffix in _fuzz_lines(tree, quick_check):
+        if not run:
+            continue
+        samples = []
+        n, step = 1, 1
+        while n <= max_run:
+            line = prefix + run * n + suffix
+            elapsed = _time_match(regexp, line)
+            if elapsed > worst_time:
+                worst_time, worst_line = elapsed, line
+                growth = _growth(samples, n, elapsed)
+            if elapsed > time_limit:
+                break
+            # Grow the run geometrically while the time grows slowly (polynomial), one character at a time
+            # once it grows fast (exponential), so no match overshoots time_limit by much.
+            fast = samples and elapsed > 2 * samples[-1][1] and elapsed > 1e-5
+            step = 1 if fast else max(step, n // 4, 1)
+            samples.append((n, elapsed))
+            n += step
+    for line in _truncated_lines(tree):
+        elapsed = _time_match(regexp, line)
+        if elapsed > worst_time:
+            worst_time, worst_line = elapsed, line
+    return worst_time, worst_line, growth
+
+
+def analyze_patterns(patterns: Dict[str, Dict[str, Any]], fuzz: bool = True,
+                     time_limit: float = DEFAULT_TIME_LIMIT) -> Dict[str, RiskReport]:
+    '''
+    Run the static checks, and unless fuzz is False the fuzzing, on every pattern of a spec.
+    '''
+    # Local import: PyReParse imports this module.
+    from .PyReParse import PyReParse as PRP
+    reports = {}
+    for pat_name, pat_def in patterns.items():
+        re_string = pat_def[PRP.INDEX_RE_STRING]
+        findings = analyze_regex(re_string)
+        worst_time, worst_line, growth = 0.0, '', None
+        if fuzz:
+            worst_time, worst_line, growth = fuzz_regex(re.compile(re_string, re.X),
+                                                        quick_check=pat_def.get(PRP.INDEX_RE_QUICK_CHECK),
+                                                        time_limit=time_limit)
+        reports[pat_name] = RiskReport(pat_name, findings, worst_time, worst_line, growth)
+    return reports
+
+
+def format_risk_report(reports: Dict[str, RiskReport]) -> str:
+    '''
+    Format analyze_patterns() results as a text report.
+    '''
+    out = [f"{'Pattern':<24} {'Findings':>8} {'Worst ms':>10} {'Growth':>7}  Worst line"]
+    for rep in reports.values():
+        growth = '' if rep.growth is None else 'exp' if rep.growth >= EXPONENTIAL_GROWTH else f'n^{rep.growth:.1f}'
+        line = repr(rep.worst_line)
+        if len(line) > 60:
+            line = line[:57] + '...'
+        out.append(f'{rep.pattern:<24} {len(rep.findings):>8} {rep.worst_time * 1e3:>10.3f} {growth:>7}  {line}')
+    for rep in reports.values():
+        for finding in rep.findings:
+            out.append(f'  [{rep.pattern}] {finding.message}')
+    return '\n'.join(out)
+
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser('risk', help='Check the regexps of a patterns spec for catastrophic backtracking',
+                                   description=__doc__.split('\n\n')[0])
+    parser.add_argument('spec', help="Spec module[:attr], as for 'profile'")
+    parser.add_argument('--no-fuzz', action='store_true', help='Only run the static checks')
+    parser.add_argument('--time-limit', type=float, default=DEFAULT_TIME_LIMIT,
+                        help='Seconds per match() before fuzzing of a candidate line stops')
+    parser.set_defaults(func=main)
+    return parser
+
+
+def main(args) -> int:
+    from .profiling import load_spec
+    reports = analyze_patterns(load_spec(args.spec), fuzz=not args.no_fuzz, time_limit=args.time_limit)
+    print(format_risk_report(reports))
+    return 0
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+'''
+Compact result types for parse_file*() / parse_file_stream() with result_format='records'.
+
+In the default format each retained match is {'match_def': [pattern, ...], 'fields': {...}}: two dicts, a list,
+and a fresh current_subsection_parents list per match. With result_format='records' each match is a Record
+instead: an instance of a __slots__ class generated per (match_def, field names), so a row costs one small object.
+The match_def is a class attribute, and subsection parents are shared tuples.
+
+Records are read-only Mappings of the same fields as the dict format (current_subsection_parents included, as a
+list), so record['fee_type'], record.get('fee_type') and dict(record) all work. Fields are also attributes:
+record.fee_type, except fields named like a Record attribute (keys, get, match_def...). Sections are Section objects, which also allow dict style access: section['fields_list'].
+'''
+
+import keyword
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Tuple
+
+SUBSECTION_KEYS = ('subsection_depth', 'current_subsection_parents', 'subsection_line_count')
+
+_record_classes: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], type] = {}
+_parents: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+class Record(Mapping):
+    '''
+    Base class of the generated per-pattern record classes.
+
+    Class attributes of generated classes:
+      - match_def: Tuple of the pattern names that matched.
+      - _keys: Field names, in the order of the dict format's fields.
+      - _slots: The slot holding each field (the field name itself when it is a valid identifier).
+    '''
+    __slots__ = ('subsection_depth', 'subsection_parents', 'subsection_line_count')
+    match_def: Tuple[str, ...] = ()
+    _keys: Tuple[str, ...] = ()
+    _slots: Dict[str, str] = {}
+
+    def __getitem__(self, key):
+        if key == 'current_subsection_parents':
+            return list(self.subsection_parents)
+        try:
+            return getattr(self, self._slots[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._slots or key == 'current_subsection_parents'
+
+    def to_dict(self) -> Dict[str, Any]:
+        '''
+        The fields as a dict, like the 'fields' entry of the dict result format.
+        '''
+        return {key: self[key] for key in self._keys}
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def __reduce__(self):
+        # Generated classes are not importable, so pickle (e.g. disk spill) rebuilds them from the field names.
+        return _rebuild_record, (self.match_def, self._keys, tuple(self[key] for key in self._keys))
+
+
+def _slot_name(i: int, key: str) -> str:
+    if key.isidentifier() and not keyword.iskeyword(key) and not key.startswith('_') and not hasattr(Record, key):
+        return key
+    return f'_f{i}'
+
+
+def record_class(match_def: Tuple[str, ...], keys: Tuple[str, ...]) -> type:
+    '''
+    Get (or generate) the record class for a match_def and the field names of its matches.
+    '''
+    cls = _record_classes.get((match_def, keys))
+    if cls is not None:
+        return cls
+    fld_keys = [key for key in keys if key not in SUBSECTION_KEYS]
+    slots = {key: _slot_name(i, key) for i, key in enumerate(fld_keys)}
+    # Like namedtuple, generate an __init__ that assigns the slots directly.
+    args = ', '.join(f'_{i}' for i in range(len(fld_keys)))
+    body = ''.join(f'\n    self.{slots[key]} = _{i}' for i, key in enumerate(fld_keys))
+    src = (f'def __init__(self, {args}{", " if args else ""}subsection_depth, subsection_parents, '
+           f'subsection_line_count):{body}\n'
+           f'    self.subsection_depth = subsection_depth\n'
+           f'    self.subsection_parents = subsection_parents\n'
+           f'    self.subsection_line_count = subsection_line_count\n')
+    namespace = {}
+    exec(src, namespace)
+    attrs = {
+        '__slots__': tuple(slots.values()),
+        '__init__': namespace['__init__'],
+        'match_def': match_def,
+        '_keys': keys,
+        '_slots': dict(slots, subsection_depth='subsection_depth', subsection_line_count='subsection_line_count'),
+    }
+    # Fields stored under another slot name are still reachable with getattr(record, key), unless key is a Record
+    # or Mapping attribute (keys, get, match_def...): those fields are only reachable as record[key].
+    for key, slot in slots.items():
+        if key != slot and not hasattr(Record, key):
+            attrs[key] = property(lambda self, slot=slot: getattr(self, slot))
+    name = ''.join(part.capitalize() for pat in match_def for part in pat.split('_')) + 'Record'
+    return _record_classes.setdefault((match_def, keys), type(name, (Record,), attrs))
+
+
+def make_record(match_def: List[str], fields: Dict[str, Any]) -> Record:
+    '''
+    Build a record from a match() result: (match_def, fields).
+    '''
+    cls = record_class(tuple(match_def), tuple(fields))
+    parents = tuple(fields.get('current_subsection_parents', ()))
+    parents = _parents.setdefault(parents, parents)
+    values = [val for key, val in fields.items() if key not in SUBSECTION_KEYS]
+    return cls(*values, fields.get('subsection_depth'), parents, fields.get('subsection_line_count'))
+
+
+def _rebuild_record(match_def, keys, values):
+    return make_record(list(match_def), dict(zip(keys, values)))
+
+
+class Section:
+    '''
+    A section of the 'records' result format. Entries are attributes, and can also be accessed dict style.
+    '''
+    __slots__ = ('section_start', 'fields_list', 'totals', 'valid')
+
+    def __init__(self, section_start: int, fields_list: Optional[List[Record]] = None,
+                 totals: Optional[Dict[str, Any]] = None, valid: bool = True):
+        self.section_start = section_start
+        self.fields_list = [] if fields_list is None else fields_list
+        self.totals = {} if totals is None else totals
+        self.valid = valid
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Section):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self):
+        return (f'Section(section_start={self.section_start}, {len(self.fields_list)} records, '
+                f'totals={self.totals!r}, valid={self.valid})')
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots__, state):
+            setattr(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        '''
+        The section in the dict result format.
+        '''
+        return {
+            'section_start': self.section_start,
+            'fields_list': [{'match_def': list(rec.match_def), 'fields': rec.to_dict()} for rec in self.fields_list],
+            'totals': self.totals,
+            'valid': self.valid,
+        }
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+'''
+Counter windows of triggers.
+
+A trigger like '<REPORT_LINE> == 1' can only be True on one line, yet it is evaluated on every line. trigger_window()
+statically analyzes a compiled trigger expression (see PyReParse.__create_trigger()) over the counters
+<REPORT_LINE>, <SECTION_LINE>, <SUBSECTION_LINE> and <SECTION_COUNT>, and derives the window of counter values
+outside of which the trigger can not be True...
+
+    '<REPORT_LINE> == 1'                            -> {'report_line_count': (1, 1)}
+    '<SECTION_LINE> >= 3 and {start_tx_lines}'      -> {'section_line_count': (3, inf)}
+    '<SECTION_LINE> < 5 or <SECTION_LINE> > 90'     -> {'section_line_count': (-inf, inf)}   (hull of the union)
+
+match() checks a pattern's window (a few integer comparisons) before calling its trigger functions, and treats
+a closed window like a False trigger_on, so the pattern sleeps until its window opens.
+
+Windows are conservative: anything the analysis does not understand (function calls, counters compared to
+variables, 'or' over different counters...) leaves that part of the expression unconstrained, so the window is
+always a superset of the lines where the trigger can be True, and results are unchanged.
+'''
+
+import ast
+import math
+from typing import Dict, Optional, Tuple
+
+INF = math.inf
+
+# Counter attributes of a PyReParse instance, as referenced by compiled triggers: prp_inst.<attr>
+WINDOW_COUNTERS = ('report_line_count', 'section_line_count', 'subsection_line_count', 'section_count')
+
+Window = Dict[str, Tuple[float, float]]
+
+_NEGATED_OPS = {ast.Lt: ast.GtE, ast.LtE: ast.Gt, ast.Gt: ast.LtE, ast.GtE: ast.Lt, ast.Eq: ast.NotEq,
+                ast.NotEq: ast.Eq}
+_SWAPPED_OPS = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq,
+                ast.NotEq: ast.NotEq}
+
+
+def _counter(node) -> Optional[str]:
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'prp_inst' \
+            and node.attr in WINDOW_COUNTERS:
+        return node.attr
+    return None
+
+
+def _number(node) -> Optional[float]:
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        val = _number(node.operand)
+        return None if val is None else -val
+    return None
+
+
+def _interval(op, value) -> Optional[Tuple[float, float]]:
+    '''
+    The integer interval of a counter satisfying: counter <op> value
+    '''
+    if isinstance(op, ast.Lt):
+        return -INF, math.ceil(value) - 1
+    if isinstance(op, ast.LtE):
+        return -INF, math.floor(value)
+    if isinstance(op, ast.Gt):
+        return math.floor(value) + 1, INF
+    if isinstance(op, ast.GtE):
+        return math.ceil(value), INF
+    if isinstance(op, ast.Eq):
+        return (value, value) if value == int(value) else (1, 0)
+    return None
+
+
+def _intersect(a: Optional[Window], b: Optional[Window]) -> Optional[Window]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    window = dict(a)
+    for attr, (lo, hi) in b.items():
+        if attr in window:
+            window[attr] = (max(lo, window[attr][0]), min(hi, window[attr][1]))
+        else:
+            window[attr] = (lo, hi)
+    return window
+
+
+def _union(a: Optional[Window], b: Optional[Window]) -> Optional[Window]:
+    # A union is only representable (as its hull) when both sides constrain the same single counter.
+    if a is None or b is None or len(a) != 1 or a.keys() != b.keys():
+        return None
+    (attr, (lo_a, hi_a)), = a.items()
+    lo_b, hi_b = b[attr]
+    if lo_a > hi_a:
+        return dict(b)
+    if lo_b > hi_b:
+        return dict(a)
+    return {attr: (min(lo_a, lo_b), max(hi_a, hi_b))}
+
+
+def _compare(node: ast.Compare, negate: bool) -> Optional[Window]:
+    window = None
+    left = node.left
+    for op, right in zip(node.ops, node.comparators):
+        part = None
+        if negate and len(node.ops) > 1:
+            # not (a < b < c) is an 'or'; leave it unconstrained.
+            return None
+        op_type = _NEGATED_OPS.get(type(op)) if negate else type(op)
+        if op_type is not None:
+            attr, value = _counter(left), _number(right)
+            if attr is None:
+                attr, value = _counter(right), _number(left)
+                op_type = _SWAPPED_OPS.get(op_type)  # None for is, in...: unconstrained.
+            if attr is not None and value is not None and op_type is not None:
+                interval = _interval(op_type(), value)
+                if interval is not None:
+                    part = {attr: interval}
+        window = _intersect(window, part)
+        left = right
+    return window
+
+
+def _analyze(node, negate: bool = False) -> Optional[Window]:
+    '''
+    The window of the expression node (or of its negation), None when unconstrained.
+    '''
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return _analyze(node.operand, not negate)
+    if isinstance(node, ast.BoolOp) or (isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr))):
+        values = node.values if isinstance(node, ast.BoolOp) else [node.left, node.right]
+        is_and = isinstance(node.op, (ast.And, ast.BitAnd))
+        # De Morgan: not (a and b) == (not a) or (not b)
+        if is_and != negate:
+            window = None
+            for value in values:
+                window = _intersect(window, _analyze(value, negate))
+            return window
+        window = _analyze(values[0], negate)
+        for value in values[1:]:
+            window = _union(window, _analyze(value, negate))
+        return window
+    if isinstance(node, ast.Compare):
+        return _compare(node, negate)
+    if isinstance(node, ast.Constant) and isinstance(node.value, bool) and node.value == negate:
+        # 'False' (or False under negation for 'True'): an empty window.
+        return {WINDOW_COUNTERS[0]: (1, 0)}
+    return None
+
+
+def trigger_window(func_text: str, negate: bool = False) -> Optional[Window]:
+    '''
+    Analyze the text of a compiled trigger function, returning the window of counter values where it may be True
+    (or False, when negate is True): {counter_attr: (low, high)}. Returns None when no counter is constrained.
+    '''
+    tree = ast.parse(func_text)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Return):
+            return _analyze(node.value, negate)
+    return None
+
+
+def pattern_window(trigger_on_text: Optional[str], trigger_off_text: Optional[str]) -> Optional[Window]:
+    '''
+    The window where a pattern may be active: trigger_on may be True and trigger_off may be False.
+    '''
+    window = None
+    if trigger_on_text:
+        window = _intersect(window, trigger_window(trigger_on_text))
+    if trigger_off_text:
+        window = _intersect(window, trigger_window(trigger_off_text, negate=True))
+    return window
+
+
+def window_checks(window: Window) -> Tuple[Tuple[str, float, float], ...]:
+    '''
+    The (attr, low, high) checks of a window, leaving out unbounded sides.
+    '''
+    return tuple((attr, lo, hi) for attr, (lo, hi) in sorted(window.items()) if lo > -INF or hi < INF)
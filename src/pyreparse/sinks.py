@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+
+'''
+Output sinks for PyReParse results.
+
+A sink receives matches from stream_matches() or sections from parse_file*() / parse_file_stream() and writes
+one output per pattern. Column orders are computed once per pattern from the pattern's named groups, rows are
+collected into batches, and each batch is serialized and written with a single write() into a large buffer.
+Optionally, serialization and writing are moved onto a background thread and output is gzip compressed.
+
+Sinks are thread-safe, so parallel workers may feed one sink, which then acts as the single writer.
+
+File and SQLite sinks support checkpoints (see stream_matches(checkpoint_path=...)): get_position() returns
+the committed output position and set_position() truncates output written after it, before a resumed run.
+
+Usage...
+
+    with JsonlSink(prp, 'out_dir') as sink:
+        list(prp.stream_matches('report.txt', callback=sink))
+
+    with CsvSink(prp, 'out_dir', compress=True, threaded=True) as sink:
+        list(prp.parse_file_stream('report.txt', callback=sink.write_section))
+'''
+
+import csv
+import gzip
+import io
+import os
+import queue
+import sqlite3
+import threading
+from json.encoder import encode_basestring
+from typing import Any, Dict, Iterable, List, Optional
+
+from .records import Record
+
+
+class MatchSink:
+    '''
+    Base class for buffered, per-pattern sinks.
+
+    Sub-classes implement _write_rows(), and optionally _flush_files() and _close_files().
+
+    :param prp_inst: A PyReParse instance with patterns loaded. Used for pattern column orders.
+    :param patterns: Pattern names to write. Defaults to all patterns that have named groups.
+    :param batch_rows: Number of pending rows held before a batch is written out.
+    :param threaded: When True, batches are serialized and written by a background thread.
+    :param queue_depth: Maximum number of batches waiting for the background thread.
+    '''
+
+    def __init__(self, prp_inst, patterns: Optional[Iterable[str]] = None, batch_rows: int = 4096,
+                 threaded: bool = False, queue_depth: int = 8):
+        PRP = type(prp_inst)
+        if patterns is None:
+            patterns = [pat for pat in prp_inst.re_defs if prp_inst.re_defs[pat][PRP.INDEX_RE_REGEXP].groupindex]
+        self.columns: Dict[str, List[str]] = {}
+        for pat in patterns:
+            groupindex = prp_inst.re_defs[pat][PRP.INDEX_RE_REGEXP].groupindex
+            self.columns[pat] = sorted(prp_inst.get_fld_names(pat), key=groupindex.get)
+        self.batch_rows = batch_rows
+        self.rows_written = {pat: 0 for pat in self.columns}
+        self._pending: Dict[str, List[list]] = {pat: [] for pat in self.columns}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._queue = None
+        self._thread = None
+        self._thread_error = None
+        if threaded:
+            self._queue = queue.Queue(maxsize=queue_depth)
+            self._thread = threading.Thread(target=self._writer_loop, name=f'{type(self).__name__}-writer',
+                                            daemon=True)
+            self._thread.start()
+
+    def __call__(self, match_def, fields):
+        '''
+        Callback signature of stream_matches(): callback(match_def, fields).
+        '''
+        self.write_match(match_def, fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_match(self, match_def: Optional[List[str]], fields: Dict[str, Any]) -> None:
+        '''
+        Queue a row for each pattern in match_def. Lines that did not match (match_def is None) are ignored.
+        '''
+        if not match_def:
+            return
+        with self._lock:
+            for pat in match_def:
+                cols = self.columns.get(pat)
+                if cols is None:
+                    continue
+                self._pending[pat].append([fields.get(c) for c in cols])
+                self._pending_count += 1
+            if self._pending_count >= self.batch_rows:
+                self._flush_pending()
+
+    def write_section(self, section: Dict[str, Any]) -> None:
+        '''
+        Callback signature of parse_file_stream(): callback(section). Sections of both result formats are accepted.
+        The section's rows are gathered before the sink's lock is taken once, to keep contention between
+        parallel workers low.
+        '''
+        rows = {}
+        count = 0
+        for item in section['fields_list']:
+            if isinstance(item, Record):
+                match_def, fields = item.match_def, item
+            else:
+                match_def, fields = item['match_def'], item['fields']
+            for pat in match_def:
+                cols = self.columns.get(pat)
+                if cols is None:
+                    continue
+                rows.setdefault(pat, []).append([fields.get(c) for c in cols])
+                count += 1
+        if not count:
+            return
+        with self._lock:
+            for pat, pat_rows in rows.items():
+                self._pending[pat].extend(pat_rows)
+            self._pending_count += count
+            if self._pending_count >= self.batch_rows:
+                self._flush_pending()
+
+    def write_sections(self, sections: Iterable[Dict[str, Any]]) -> None:
+        '''
+        Write all sections returned by parse_file() or parse_file_parallel().
+        '''
+        for section in sections:
+            self.write_section(section)
+
+    def flush(self, sync: bool = True) -> None:
+        '''
+        Hand all pending rows to the writer.
+
+        :param sync: When True, also wait for the background thread (if any) and flush the output files.
+        '''
+        with self._lock:
+            self._flush_pending()
+        if sync:
+            if self._queue is not None:
+                self._queue.join()
+                self._raise_thread_error()
+            self._flush_files()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        with self._lock:
+            self._flush_pending()
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._raise_thread_error()
+        self._close_files()
+
+    def _flush_pending(self):
+        if self._pending_count:
+            for pat, rows in self._pending.items():
+                if rows:
+                    self.rows_written[pat] += len(rows)
+                    self._dispatch(pat, rows)
+                    self._pending[pat] = []
+            self._pending_count = 0
+
+    def _dispatch(self, pat, rows):
+        if self._queue is None:
+            self._write_rows(pat, rows)
+        else:
+            self._raise_thread_error()
+            self._queue.put((pat, rows))
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._thread_error is None:
+                    self._write_rows(*item)
+            except Exception as e:
+                self._thread_error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_thread_error(self):
+        if self._thread_error is not None:
+            e, self._thread_error = self._thread_error, None
+            raise e
+
+    def _write_rows(self, pat, rows):
+        raise NotImplementedError
+
+    def _flush_files(self):
+        pass
+
+    def _close_files(self):
+        pass
+
+
+class _FileSink(MatchSink):
+    '''
+    A MatchSink that writes one file per pattern into out_dir: <out_dir>/<pattern><suffix>[.gz]
+
+    :param out_dir: Directory for the output files (created if missing).
+    :param buffer_size: Write buffer size of each output file.
+    :param compress: Write gzip compressed output.
+    :param compresslevel: gzip compression level. Low levels keep compression from dominating the run time.
+    '''
+    suffix = ''
+
+    def __init__(self, prp_inst, out_dir: str, patterns: Optional[Iterable[str]] = None, batch_rows: int = 4096,
+                 threaded: bool = False, queue_depth: int = 8, buffer_size: int = 1 << 20,
+                 compress: bool = False, compresslevel: int = 1):
+        self.out_dir = out_dir
+        self.buffer_size = buffer_size
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self.files: Dict[str, Any] = {}
+        self._append = set()
+        os.makedirs(out_dir, exist_ok=True)
+        super().__init__(prp_inst, patterns=patterns, batch_rows=batch_rows, threaded=threaded,
+                         queue_depth=queue_depth)
+
+    def file_path(self, pat: str) -> str:
+        path = os.path.join(self.out_dir, pat + self.suffix)
+        if self.compress:
+            path += '.gz'
+        return path
+
+    def _open_pattern(self, pat):
+        path = self.file_path(pat)
+        append = pat in self._append
+        if self.compress:
+            raw = gzip.open(path, 'wb', compresslevel=self.compresslevel)
+            f = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=self.buffer_size),
+                                 encoding='utf-8', newline='')
+        else:
+            f = open(path, 'a' if append else 'w', encoding='utf-8', newline='', buffering=self.buffer_size)
+        self.files[pat] = f
+        self._start_file(pat, f, append)
+        return f
+
+    def _start_file(self, pat, f, append):
+        pass
+
+    def get_position(self) -> Dict[str, Any]:
+        '''
+        Flush all output and return the position of each output file, for checkpoints.
+        '''
+        if self.compress:
+            raise ValueError('Checkpoints are not supported with compressed sink output.')
+        self.flush(sync=True)
+        sizes = {pat: os.path.getsize(self.file_path(pat)) for pat in self.files}
+        return {'sizes': sizes, 'rows_written': dict(self.rows_written)}
+
+    def set_position(self, position: Dict[str, Any]) -> None:
+        '''
+        Truncate the output files to a position returned by get_position(); later rows are appended.
+        Files of patterns that had no output at that position are removed.
+        '''
+        if self.compress:
+            raise ValueError('Checkpoints are not supported with compressed sink output.')
+        self.flush(sync=True)
+        self._close_files()
+        self._append = set()
+        for pat in self.columns:
+            path = self.file_path(pat)
+            size = position['sizes'].get(pat)
+            if size is not None:
+                os.truncate(path, size)
+                self._append.add(pat)
+            elif os.path.exists(path):
+                os.unlink(path)
+        self.rows_written.update(position['rows_written'])
+
+    def _flush_files(self):
+        for f in self.files.values():
+            f.flush()
+
+    def _close_files(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class JsonlSink(_FileSink):
+    '''
+    Write one JSON object per matched row to <out_dir>/<pattern>.jsonl
+
+    The "key": prefixes are encoded once per pattern, and values are encoded with json's C string encoder.
+    Non-string values (e.g. Decimal values set by a callback) are written as their str().
+    '''
+    suffix = '.jsonl'
+
+    def __init__(self, prp_inst, out_dir: str, **kwargs):
+        super().__init__(prp_inst, out_dir, **kwargs)
+        self._key_prefixes = {pat: [encode_basestring(c) + ': ' for c in cols] for pat, cols in self.columns.items()}
+
+    def _write_rows(self, pat, rows):
+        f = self.files.get(pat) or self._open_pattern(pat)
+        prefixes = self._key_prefixes[pat]
+        enc = encode_basestring
+        lines = []
+        for row in rows:
+            lines.append('{' + ', '.join([
+                p + ('null' if v is None else enc(v if v.__class__ is str else str(v)))
+                for p, v in zip(prefixes, row)
+            ]) + '}\n')
+        f.write(''.join(lines))
+
+
+class CsvSink(_FileSink):
+    '''
+    Write matched rows to <out_dir>/<pattern>.csv with a header line of the pattern's named groups.
+    '''
+    suffix = '.csv'
+
+    def __init__(self, prp_inst, out_dir: str, **kwargs):
+        self._writers = {}
+        super().__init__(prp_inst, out_dir, **kwargs)
+
+    def _start_file(self, pat, f, append):
+        self._writers[pat] = csv.writer(f)
+        if not append:
+            self._writers[pat].writerow(self.columns[pat])
+
+    def _write_rows(self, pat, rows):
+        if pat not in self.files:
+            self._open_pattern(pat)
+        self._writers[pat].writerows(rows)
+
+
+class SqliteSink(MatchSink):
+    '''
+    Bulk load matched rows into a local SQLite database file, one table per pattern.
+
+    Each table is named after its pattern and has one TEXT column per named group (in group order).
+    Rows are inserted with executemany() in batches of batch_rows, inside transactions that span
+    rows_per_transaction rows. The database is put into WAL journal mode with synchronous=NORMAL.
+    By default a single background thread owns the connection and does all the writing, so results from
+    parallel workers (e.g. parse_file_parallel() section callbacks) funnel through one writer.
+
+    :param db_path: Path of the SQLite database file (created if missing).
+    :param batch_rows: Rows per executemany() call.
+    :param rows_per_transaction: Rows inserted before a COMMIT.
+    :param journal_mode: SQLite journal_mode pragma.
+    :param synchronous: SQLite synchronous pragma.
+    '''
+
+    def __init__(self, prp_inst, db_path: str, patterns: Optional[Iterable[str]] = None, batch_rows: int = 10000,
+                 threaded: bool = True, queue_depth: int = 8, rows_per_transaction: int = 200000,
+                 journal_mode: str = 'WAL', synchronous: str = 'NORMAL'):
+        self.db_path = db_path
+        self.rows_per_transaction = rows_per_transaction
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.conn = None
+        self._insert_sql = {}
+        self._tx_rows = 0
+        super().__init__(prp_inst, patterns=patterns, batch_rows=batch_rows, threaded=threaded,
+                         queue_depth=queue_depth)
+
+    @staticmethod
+    def _quote(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def _connect(self):
+        # The connection is only used by one thread at a time: the writer thread, or the caller's
+        # thread once the writer has been joined.
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        self.conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        for pat, cols in self.columns.items():
+            col_defs = ', '.join(f'{self._quote(c)} TEXT' for c in cols)
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {self._quote(pat)} ({col_defs})')
+            self._insert_sql[pat] = (f'INSERT INTO {self._quote(pat)} VALUES '
+                                     f'({", ".join("?" * len(cols))})')
+
+    def _write_rows(self, pat, rows):
+        if self.conn is None:
+            self._connect()
+        if not self.conn.in_transaction:
+            self.conn.execute('BEGIN')
+        for row in rows:
+            for i, v in enumerate(row):
+                if v is not None and v.__class__ is not str:
+                    row[i] = str(v)
+        self.conn.executemany(self._insert_sql[pat], rows)
+        self._tx_rows += len(rows)
+        if self._tx_rows >= self.rows_per_transaction:
+            self.conn.execute('COMMIT')
+            self._tx_rows = 0
+
+    def _commit(self):
+        if self.conn is not None and self.conn.in_transaction:
+            self.conn.execute('COMMIT')
+            self._tx_rows = 0
+
+    def _flush_files(self):
+        if self._queue is not None:
+            # Let the writer thread, which owns the open transaction, issue the COMMIT.
+            self._queue.put((None, None))
+            self._queue.join()
+            self._raise_thread_error()
+        else:
+            self._commit()
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._thread_error is None:
+                    if item[0] is None:
+                        self._commit()
+                    else:
+                        self._write_rows(*item)
+            except Exception as e:
+                self._thread_error = e
+            finally:
+                self._queue.task_done()
+
+    def get_position(self) -> Dict[str, Any]:
+        '''
+        Commit all rows and return the row count of each table, for checkpoints.
+        '''
+        self.flush(sync=True)
+        if self.conn is None:
+            self._connect()
+        counts = {pat: self.conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {self._quote(pat)}').fetchone()[0]
+                  for pat in self.columns}
+        return {'counts': counts, 'rows_written': dict(self.rows_written)}
+
+    def set_position(self, position: Dict[str, Any]) -> None:
+        '''
+        Delete rows inserted after a position returned by get_position().
+        '''
+        self.flush(sync=True)
+        if self.conn is None:
+            self._connect()
+        for pat in self.columns:
+            self.conn.execute(f'DELETE FROM {self._quote(pat)} WHERE rowid > ?', (position['counts'].get(pat, 0),))
+        self.rows_written.update(position['rows_written'])
+
+    def _close_files(self):
+        if self.conn is not None:
+            self._commit()
+            self.conn.close()
+            self.conn = None
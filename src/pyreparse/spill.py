@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+'''
+Memory-bounded section results for parse_file() / parse_file_parallel() (memory_budget=...).
+
+SpillingSections collects sections in order. When the estimated size of the sections held in memory exceeds the
+budget, they are written to a temporary spill file (each section pickled and zlib compressed) and dropped from
+memory. The spilled sections always precede the in-memory ones, so the result can be iterated (any number of times)
+by streaming the spill file back, then the in-memory tail.
+'''
+
+import os
+import pickle
+import sys
+import tempfile
+import weakref
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+
+def estimate_section_size(section: Dict[str, Any]) -> int:
+    '''
+    A cheap estimate of the memory held by a section: the fields dicts (or records) and their values.
+    '''
+    getsizeof = sys.getsizeof
+    size = getsizeof(section) + getsizeof(section['fields_list'])
+    for item in section['fields_list']:
+        if isinstance(item, dict):
+            fields = item['fields']
+            size += getsizeof(item) + getsizeof(item['match_def']) + getsizeof(fields)
+        else:
+            # A records.Record: the match_def and subsection parents are shared.
+            fields = item
+            size += getsizeof(item)
+        size += sum(map(getsizeof, fields.values()))
+    return size
+
+
+def peak_rss() -> Optional[int]:
+    '''
+    The process' peak resident set size in bytes, or None where the resource module is not available.
+    '''
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS.
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+class SpillingSections:
+    '''
+    A lazy, re-iterable sequence of sections that holds at most about memory_budget bytes of sections in memory.
+
+    Attributes reported after the parse:
+      - peak_memory: The peak estimated size (bytes) of the sections held in memory.
+      - peak_rss: The process' peak RSS (bytes) when the parse completed, or None if not available.
+      - spilled_sections / spilled_bytes: Number of sections and bytes written to the spill file.
+
+    :param memory_budget: Bytes of (estimated) section data to hold in memory before spilling.
+    :param spill_dir: Directory for the spill file (default: the system temp directory).
+    '''
+
+    def __init__(self, memory_budget: int, spill_dir: Optional[str] = None):
+        if memory_budget < 0:
+            raise ValueError('memory_budget must be >= 0')
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.peak_memory = 0
+        self.peak_rss = None
+        self.spilled_sections = 0
+        self.spilled_bytes = 0
+        self._memory: List[Dict[str, Any]] = []
+        self._memory_size = 0
+        self._offsets: List[int] = []
+        self._spill_path = None
+        self._spill_file = None
+        self._finalizer = None
+
+    def append(self, section: Dict[str, Any]) -> None:
+        self._memory.append(section)
+        self._memory_size += estimate_section_size(section)
+        if self._memory_size > self.peak_memory:
+            self.peak_memory = self._memory_size
+        if self._memory_size > self.memory_budget:
+            self._spill()
+
+    def finish(self) -> 'SpillingSections':
+        '''
+        Called once all sections were appended: closes the spill file for writing and records peak_rss.
+        '''
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self.peak_rss = peak_rss()
+        return self
+
+    def _spill(self):
+        if self._spill_file is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix='pyreparse_spill_', dir=self.spill_dir)
+            self._spill_file = os.fdopen(fd, 'wb', buffering=1 << 20)
+            self._finalizer = weakref.finalize(self, _remove, self._spill_path)
+        f = self._spill_file
+        for section in self._memory:
+            data = zlib.compress(pickle.dumps(section, protocol=pickle.HIGHEST_PROTOCOL), 1)
+            self._offsets.append(self.spilled_bytes)
+            f.write(len(data).to_bytes(4, 'little'))
+            f.write(data)
+            self.spilled_bytes += 4 + len(data)
+        self.spilled_sections = len(self._offsets)
+        self._memory = []
+        self._memory_size = 0
+
+    def _read_at(self, f, offset: int) -> Dict[str, Any]:
+        f.seek(offset)
+        size = int.from_bytes(f.read(4), 'little')
+        return pickle.loads(zlib.decompress(f.read(size)))
+
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._memory)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self._offsets:
+            if self._spill_file is not None:
+                self._spill_file.flush()
+            with open(self._spill_path, 'rb', buffering=1 << 20) as f:
+                for _ in range(len(self._offsets)):
+                    size = int.from_bytes(f.read(4), 'little')
+                    yield pickle.loads(zlib.decompress(f.read(size)))
+        yield from self._memory
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('section index out of range')
+        if index >= len(self._offsets):
+            return self._memory[index - len(self._offsets)]
+        if self._spill_file is not None:
+            self._spill_file.flush()
+        with open(self._spill_path, 'rb') as f:
+            return self._read_at(f, self._offsets[index])
+
+    def close(self) -> None:
+        '''
+        Remove the spill file and drop all sections. (The spill file is also removed on garbage collection.)
+        '''
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self._offsets = []
+        self._memory = []
+        self._memory_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -4,6 +4,7 @@ import unittest
 from pyreparse import PyReParse
 from decimal import Decimal
 from collections import defaultdict
+import gc
 import io
 from contextlib import redirect_stdout
 
@@ -944,4 +945,1477 @@ class TestPyReParse(unittest.TestCase):
             self.assertEqual(called, stream_results)
         finally:
             os.unlink(mock_path)
-    
+
+    def test_section_sum_checks(self):
+        PRP = self.PRP
+        patterns = {
+            'sec': {
+                PRP.INDEX_RE_STRING: r'^\*\*(?P<id>SEC\d+)\s*$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION | PRP.FLAG_RETURN_ON_MATCH,
+                PRP.INDEX_RE_TRIGGER_ON: 'True'
+            },
+            'tx': {
+                PRP.INDEX_RE_STRING: r'^TX\s+(?P<amt>[\-\$\d\,\.]+)\s*$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_RETURN_ON_MATCH,
+                PRP.INDEX_RE_TRIGGER_ON: '{sec}',
+                PRP.INDEX_RE_TRIGGER_OFF: '{total}'
+            },
+            'total': {
+                PRP.INDEX_RE_STRING: r'^TOTAL\s+(?P<total>[\-\$\d\,\.]+)\s*$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_RETURN_ON_MATCH | PRP.FLAG_END_OF_SECTION,
+                PRP.INDEX_RE_TRIGGER_ON: '{tx}',
+                PRP.INDEX_RE_SUM_CHECK: {'total': ('tx', 'amt')}
+            }
+        }
+        mock_content = [
+            '**SEC1\n', 'TX $0.10\n', 'TX $0.20\n', 'TOTAL $0.30\n',
+            '**SEC2\n', 'TX $1,000.00\n', 'TX -$1.00\n', 'TOTAL $1,000.00\n',
+        ]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            f.write(''.join(mock_content))
+            mock_path = f.name
+
+        try:
+            prp = PRP(patterns)
+            out = io.StringIO()
+            with redirect_stdout(out):
+                serial_sections = prp.parse_file(mock_path)
+                parallel_sections = prp.parse_file_parallel(mock_path)
+                stream_sections = list(PRP(patterns).parse_file_stream(mock_path))
+
+            self.assertEqual(2, len(serial_sections))
+            self.assertEqual({'amt': Decimal('0.30'), 'total': Decimal('0.30')}, serial_sections[0]['totals'])
+            self.assertTrue(serial_sections[0]['valid'])
+            self.assertEqual({'amt': Decimal('999.00'), 'total': Decimal('1000.00')}, serial_sections[1]['totals'])
+            self.assertFalse(serial_sections[1]['valid'])
+            self.assertIn('Sum check [total] failed', out.getvalue())
+            self.assertEqual(serial_sections, parallel_sections)
+            self.assertEqual(serial_sections, stream_sections)
+        finally:
+            os.unlink(mock_path)
+
+    def test_section_sum_checks_bad_field(self):
+        patterns = {
+            'tx': {self.PRP.INDEX_RE_STRING: r'^TX\s+(?P<amt>\S+)$'},
+            'total': {
+                self.PRP.INDEX_RE_STRING: r'^TOTAL\s+(?P<total>\S+)$',
+                self.PRP.INDEX_RE_SUM_CHECK: {'total': ('tx', 'no_such_fld')}
+            }
+        }
+        with self.assertRaises(ValueError) as cm:
+            self.PRP(patterns)
+        self.assertIn('no_such_fld', str(cm.exception))
+        patterns['total'][self.PRP.INDEX_RE_SUM_CHECK] = {'total': ('no_such_pat', 'amt')}
+        with self.assertRaises(ValueError):
+            self.PRP(patterns)
+
+        # Totals are keyed by field name: two patterns summing 'amt' would share one total.
+        patterns['refund'] = {self.PRP.INDEX_RE_STRING: r'^REFUND\s+(?P<amt>\S+)$'}
+        patterns['total'][self.PRP.INDEX_RE_SUM_CHECK] = {'total': ('tx', 'amt')}
+        patterns['refunds'] = {self.PRP.INDEX_RE_STRING: r'^REFUNDS\s+(?P<refunds>\S+)$',
+                               self.PRP.INDEX_RE_SUM_CHECK: {'refunds': ('refund', 'amt')}}
+        with self.assertRaises(ValueError) as cm:
+            self.PRP(patterns)
+        self.assertIn("'amt'", str(cm.exception))
+
+    def test_section_sum_checks_optional_field(self):
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'tx': {PRP.INDEX_RE_STRING: r'^TX\s*(?P<fee>[\d.]+)?$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+            'total': {PRP.INDEX_RE_STRING: r'^TOTAL\s*(?P<total>[\d.]+)?$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}',
+                      PRP.INDEX_RE_SUM_CHECK: {'total': ('tx', 'fee')}},
+        }
+        prp = PRP(patterns)
+        with redirect_stdout(io.StringIO()) as out:
+            for line in ['HDR', 'TX 1.50', 'TX ', 'TX 2.00', 'TOTAL 3.50', 'TOTAL']:
+                prp.match(line)
+        self.assertEqual('', out.getvalue())
+        self.assertTrue(prp.section_valid)
+        self.assertEqual({'fee': Decimal('3.50'), 'total': Decimal('3.50')}, prp.section_totals)
+
+    def test_section_sum_checks_negative_amounts(self):
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'tx': {PRP.INDEX_RE_STRING: r'^TX\s+(?P<fee>.+)$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+            'total': {PRP.INDEX_RE_STRING: r'^TOTAL\s+(?P<total>.+)$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}',
+                      PRP.INDEX_RE_SUM_CHECK: {'total': ('tx', 'fee')}},
+        }
+        prp = PRP(patterns)
+        # Trailing minus and parenthesized negatives.
+        with redirect_stdout(io.StringIO()) as out:
+            for line in ['HDR', 'TX $1,000.00', 'TX 1.50-', 'TX (2.00)', 'TOTAL 996.50']:
+                prp.match(line)
+        self.assertEqual('', out.getvalue())
+        self.assertTrue(prp.section_valid)
+        self.assertEqual(Decimal('996.50'), prp.section_totals['fee'])
+        # An amount that does not convert fails the check, instead of counting as 0.
+        for bad_line, message in (('TX 1.00 CR', 'fee [1.00 CR] is not an amount'),
+                                  ('TOTAL n/a', 'total [n/a] is not an amount')):
+            with redirect_stdout(io.StringIO()) as out:
+                for line in ['HDR', 'TX 1.00', bad_line, 'TOTAL 1.00']:
+                    prp.match(line)
+            self.assertFalse(prp.section_valid)
+            self.assertIn(message, out.getvalue())
+            self.assertIn(f'Line [{bad_line}]', out.getvalue())
+        self.assertEqual(prp.money2decimal('fee', 'n/a'), Decimal('0'))  # money2decimal() itself is unchanged.
+
+    def test_sinks_jsonl_csv(self):
+        import csv
+        import gzip
+        import json
+        import shutil
+        from pyreparse.sinks import JsonlSink, CsvSink
+
+        mock_lines = [TestPyReParse.in_line_0, TestPyReParse.in_line_1, TestPyReParse.in_line_2,
+                      TestPyReParse.in_line_3, TestPyReParse.in_line_4, TestPyReParse.in_line_4]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            f.write('\n'.join(mock_lines) + '\n')
+            mock_path = f.name
+        out_dir = tempfile.mkdtemp()
+
+        try:
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            expected = [f for m, f in prp.stream_matches(mock_path) if m == ['tx_line']]
+            columns = ['ac_num', 'ac_type', 'nsf_fee', 'fee_code', 'tx_desc', 'tx_amt', 'tx_date', 'balance',
+                       'trace_num', 'tx_seq', 'fee_type']
+
+            with JsonlSink(prp, out_dir, batch_rows=1, threaded=True) as sink:
+                list(prp.stream_matches(mock_path, callback=sink))
+            self.assertEqual(2, sink.rows_written['tx_line'])
+            with open(os.path.join(out_dir, 'tx_line.jsonl')) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual([{c: e[c] for c in columns} for e in expected], rows)
+            self.assertEqual(columns, list(rows[0]))
+
+            with CsvSink(prp, out_dir, compress=True) as sink:
+                list(prp.parse_file_stream(mock_path, callback=sink.write_section))
+            with gzip.open(os.path.join(out_dir, 'tx_line.csv.gz'), 'rt', newline='') as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(columns, rows[0])
+            self.assertEqual([[e[c] for c in columns] for e in expected], rows[1:])
+        finally:
+            os.unlink(mock_path)
+            shutil.rmtree(out_dir)
+
+    def test_sinks_sqlite(self):
+        import sqlite3
+        import shutil
+        from concurrent.futures import ThreadPoolExecutor
+        from pyreparse.sinks import SqliteSink
+
+        mock_lines = [TestPyReParse.in_line_0, TestPyReParse.in_line_1, TestPyReParse.in_line_2,
+                      TestPyReParse.in_line_3, TestPyReParse.in_line_4, TestPyReParse.in_line_4]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            f.write('\n'.join(mock_lines) + '\n')
+            mock_path = f.name
+        out_dir = tempfile.mkdtemp()
+        db_path = os.path.join(out_dir, 'nsf.db')
+
+        try:
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            sections = prp.parse_file(mock_path)
+
+            # Many workers feed one sink, which does all the writing through a single connection.
+            with SqliteSink(prp, db_path, batch_rows=3, rows_per_transaction=5) as sink:
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(sink.write_section, sections * 50))
+                list(prp.stream_matches(mock_path, callback=sink))
+            self.assertEqual(102, sink.rows_written['tx_line'])
+
+            conn = sqlite3.connect(db_path)
+            try:
+                self.assertEqual('wal', conn.execute('PRAGMA journal_mode').fetchone()[0])
+                self.assertEqual(102, conn.execute('SELECT count(*) FROM tx_line').fetchone()[0])
+                self.assertEqual(51, conn.execute('SELECT count(*) FROM report_id').fetchone()[0])
+                row = conn.execute('SELECT ac_num, nsf_fee, fee_type FROM tx_line LIMIT 1').fetchone()
+                self.assertEqual(('394654', '$  0.00', 'ZERO OVERDRAFT FEE     '), row)
+            finally:
+                conn.close()
+        finally:
+            os.unlink(mock_path)
+            shutil.rmtree(out_dir)
+
+    def test_compressed_input(self):
+        import bz2
+        import gzip
+        import lzma
+        from pyreparse.inputs import detect_compression, open_text
+
+        data_path = os.path.join(os.path.dirname(__file__), 'data', 'NsfPosFees',
+                                 '999-063217-XXXX-PAID-NSF POS FEES CHARGED page 0001 to 0188.TXT')
+        with open(data_path, 'rb') as f:
+            raw = f.read()
+
+        prp = self.PRP(TestPyReParse.test_re_lines)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            expected_matches = list(prp.stream_matches(data_path))
+            expected_sections = prp.parse_file(data_path)
+        self.assertIsNone(detect_compression(data_path))
+
+        for name, module in [('gzip', gzip), ('bz2', bz2), ('xz', lzma)]:
+            with tempfile.NamedTemporaryFile(suffix='.' + name, delete=False) as f:
+                f.write(module.compress(raw))
+                comp_path = f.name
+            try:
+                self.assertEqual(name, detect_compression(comp_path))
+                with redirect_stdout(out):
+                    self.assertEqual(expected_matches, list(prp.stream_matches(comp_path)))
+                    self.assertEqual(expected_sections, list(prp.parse_file_stream(comp_path)))
+                    self.assertEqual(expected_sections, prp.parse_file(comp_path))
+                    self.assertEqual(expected_sections, prp.parse_file_parallel(comp_path))
+
+                # Small blocks and an early close must not leave the decompression thread blocked.
+                with open_text(comp_path, block_size=64, queue_depth=1) as f:
+                    self.assertEqual(raw.decode().splitlines(True)[0], f.readline())
+            finally:
+                os.unlink(comp_path)
+
+    def test_stream_from_sources(self):
+        import mmap
+
+        mock_lines = [TestPyReParse.in_line_0 + '\n', TestPyReParse.in_line_1 + '\n',
+                      TestPyReParse.in_line_2 + '\n', TestPyReParse.in_line_3 + '\n',
+                      TestPyReParse.in_line_4 + '\n']
+        text = ''.join(mock_lines)
+
+        rtp = self.PRP(TestPyReParse.test_re_lines)
+        expected = [rtp.match(line) for line in mock_lines]
+        rtp.report_reset()
+        expected_sections = list(rtp.parse_file_stream_from(mock_lines))
+        self.assertEqual(1, len(expected_sections))
+        self.assertEqual(5, len(expected_sections[0]['fields_list']))
+
+        with tempfile.TemporaryFile() as tf:
+            tf.write(text.encode())
+            tf.flush()
+            mm = mmap.mmap(tf.fileno(), 0, access=mmap.ACCESS_READ)
+            sources = [
+                mock_lines,
+                (line.encode() for line in mock_lines),
+                io.StringIO(text),
+                io.BytesIO(text.encode()),
+                mm,
+            ]
+            for source in sources:
+                self.assertEqual(expected, list(rtp.stream_matches_from(source)))
+            mm.seek(0)
+            self.assertEqual(expected_sections, list(rtp.parse_file_stream_from(mm)))
+            self.assertFalse(mm.closed)
+            mm.close()
+
+        # Binary file objects are read in blocks, lines spanning block boundaries included.
+        from pyreparse.inputs import open_lines
+        with open_lines(io.BytesIO(text.encode()), block_size=16) as f:
+            self.assertEqual(mock_lines, list(f))
+
+    def test_checkpoint_resume(self):
+        import shutil
+        from pyreparse.sinks import JsonlSink, CsvSink
+
+        mock_lines = [TestPyReParse.in_line_0, TestPyReParse.in_line_1, TestPyReParse.in_line_2,
+                      TestPyReParse.in_line_3, TestPyReParse.in_line_4, TestPyReParse.in_line_4]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            for _ in range(5):
+                f.write('\n'.join(mock_lines) + '\n')
+            mock_path = f.name
+        work_dir = tempfile.mkdtemp()
+        ckpt_path = os.path.join(work_dir, 'run.ckpt')
+
+        class Interrupt(Exception):
+            pass
+
+        try:
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            expected_matches = list(prp.stream_matches(mock_path))
+            expected_sections = list(prp.parse_file_stream(mock_path))
+            self.assertEqual(5, len(expected_sections))
+
+            # Generator mode: stop consuming mid-way, then resume from the last checkpoint.
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            gen = prp.parse_file_stream(mock_path, checkpoint_path=ckpt_path)
+            first = [next(gen), next(gen)]
+            gen.close()
+            self.assertTrue(os.path.exists(ckpt_path))
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            rest = list(prp.parse_file_stream(mock_path, checkpoint_path=ckpt_path))
+            # The 2nd section was yielded before the checkpoint at the 3rd section's start, so it is repeated.
+            self.assertEqual(expected_sections[:2], first)
+            self.assertEqual(expected_sections[1:], rest)
+            self.assertFalse(os.path.exists(ckpt_path))
+
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            gen = prp.stream_matches(mock_path, checkpoint_path=ckpt_path, checkpoint_every=2)
+            first = [next(gen) for _ in range(20)]
+            gen.close()
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            rest = list(prp.stream_matches(mock_path, checkpoint_path=ckpt_path, checkpoint_every=2))
+            # Section boundaries are at lines 1, 7, 13, 19 and 25, so the last checkpoint is after line 19.
+            self.assertEqual(expected_matches, first[:19] + rest)
+
+            # Sink mode: rows written after the checkpoint are truncated on resume.
+            for sink_class, suffix in ((JsonlSink, '.jsonl'), (CsvSink, '.csv')):
+                full_dir = os.path.join(work_dir, 'full')
+                prp = self.PRP(TestPyReParse.test_re_lines)
+                with sink_class(prp, full_dir) as sink:
+                    list(prp.stream_matches(mock_path, callback=sink))
+
+                out_dir = os.path.join(work_dir, 'resumed')
+                seen = [0]
+
+                class FailingSink(sink_class):
+                    def write_match(self, match_def, fields):
+                        seen[0] += 1
+                        if seen[0] == 17:
+                            raise Interrupt()
+                        super().write_match(match_def, fields)
+
+                prp = self.PRP(TestPyReParse.test_re_lines)
+                with FailingSink(prp, out_dir, batch_rows=1) as sink:
+                    with self.assertRaises(Interrupt):
+                        list(prp.stream_matches(mock_path, callback=sink, checkpoint_path=ckpt_path))
+                self.assertTrue(os.path.exists(ckpt_path))
+                prp = self.PRP(TestPyReParse.test_re_lines)
+                with sink_class(prp, out_dir) as sink:
+                    list(prp.stream_matches(mock_path, callback=sink, checkpoint_path=ckpt_path))
+                self.assertFalse(os.path.exists(ckpt_path))
+                self.assertEqual(10, sink.rows_written['tx_line'])
+                with open(os.path.join(full_dir, 'tx_line' + suffix)) as f1, \
+                        open(os.path.join(out_dir, 'tx_line' + suffix)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+                shutil.rmtree(full_dir)
+                shutil.rmtree(out_dir)
+
+            # A checkpoint for another file is rejected.
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            gen = prp.stream_matches(mock_path, checkpoint_path=ckpt_path)
+            for _ in range(10):
+                next(gen)
+            gen.close()
+            with self.assertRaises(ValueError):
+                list(prp.stream_matches(os.path.join(work_dir, 'other.txt'), checkpoint_path=ckpt_path))
+        finally:
+            os.unlink(mock_path)
+            shutil.rmtree(work_dir)
+
+    def test_follow(self):
+        import shutil
+        import threading
+
+        mock_lines = [TestPyReParse.in_line_0, TestPyReParse.in_line_1, TestPyReParse.in_line_2,
+                      TestPyReParse.in_line_3, TestPyReParse.in_line_4, TestPyReParse.in_line_4]
+        text = ('\n'.join(mock_lines) + '\n') * 4
+        work_dir = tempfile.mkdtemp()
+        full_path = os.path.join(work_dir, 'full.txt')
+        path = os.path.join(work_dir, 'growing.txt')
+        state_path = os.path.join(work_dir, 'growing.state')
+        with open(full_path, 'w') as f:
+            f.write(text)
+
+        try:
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            expected_matches = list(prp.stream_matches(full_path))
+            expected_sections = list(prp.parse_file_stream(full_path))
+
+            # Each run picks up where the last stopped; the file ends in a partial line between runs.
+            cuts = [0, 150, len(text) // 2 + 7, len(text) - 3, len(text)]
+            for use_inotify in (True, False):
+                for f_name in (path, state_path):
+                    if os.path.exists(f_name):
+                        os.unlink(f_name)
+                matches = []
+                sections = []
+                for start, end in zip(cuts, cuts[1:]):
+                    with open(path, 'a') as f:
+                        f.write(text[start:end])
+                    prp = self.PRP(TestPyReParse.test_re_lines)
+                    matches.extend(prp.follow_matches(path, state_path=state_path, idle_timeout=0.05,
+                                                      poll_interval=0.01, use_inotify=use_inotify))
+                    prp = self.PRP(TestPyReParse.test_re_lines)
+                    sections.extend(prp.follow_file_stream(path, state_path=state_path + '.sec', idle_timeout=0.05,
+                                                           poll_interval=0.01, use_inotify=use_inotify))
+                self.assertEqual(expected_matches, matches)
+                # The last section is still in progress (saved in the state file).
+                self.assertEqual(expected_sections[:-1], sections)
+                os.unlink(state_path + '.sec')
+
+            # Live: lines appended (in pieces) while following are matched once complete.
+            os.unlink(path)
+            with open(path, 'w'):
+                pass
+            stop = threading.Event()
+
+            def writer():
+                with open(path, 'a') as f:
+                    for i in range(0, len(text), 97):
+                        f.write(text[i:i + 97])
+                        f.flush()
+                        time.sleep(0.005)
+                time.sleep(0.1)
+                stop.set()
+
+            t = threading.Thread(target=writer)
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            sections = []
+            t.start()
+            list(prp.follow_file_stream(path, callback=sections.append, stop_event=stop, poll_interval=0.02))
+            t.join()
+            self.assertEqual(expected_sections, sections)
+
+            # Truncation restarts from the start of the file.
+            with open(path, 'w') as f:
+                f.write('\n'.join(mock_lines[:2]) + '\n')
+            out = io.StringIO()
+            with redirect_stdout(out):
+                prp = self.PRP(TestPyReParse.test_re_lines)
+                gen = prp.follow_matches(path, idle_timeout=0.3, poll_interval=0.01)
+                self.assertEqual(expected_matches[:2], [next(gen), next(gen)])
+                with open(path, 'w') as f:
+                    f.write(mock_lines[0] + '\n')
+                rest = list(gen)
+            self.assertIn('was truncated', out.getvalue())
+            self.assertEqual([expected_matches[0]], rest)
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_parse_file_memory_budget(self):
+        from pyreparse.spill import SpillingSections
+
+        mock_lines = [TestPyReParse.in_line_0, TestPyReParse.in_line_1, TestPyReParse.in_line_2,
+                      TestPyReParse.in_line_3, TestPyReParse.in_line_4, TestPyReParse.in_line_4]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            for _ in range(20):
+                f.write('\n'.join(mock_lines) + '\n')
+            mock_path = f.name
+        spill_dir = tempfile.mkdtemp()
+
+        try:
+            prp = self.PRP(TestPyReParse.test_re_lines)
+            expected = prp.parse_file(mock_path)
+            self.assertEqual(20, len(expected))
+
+            for parse in (prp.parse_file, prp.parse_file_parallel):
+                sections = parse(mock_path, memory_budget=15000, spill_dir=spill_dir)
+                self.assertIsInstance(sections, SpillingSections)
+                self.assertEqual(20, len(sections))
+                self.assertGreater(sections.spilled_sections, 0)
+                self.assertLess(sections.spilled_sections, 20)
+                self.assertLessEqual(sections.peak_memory, 15000 + 6000)
+                self.assertEqual(1, len(os.listdir(spill_dir)))
+                # Re-iterable, in order, with random access.
+                self.assertEqual(expected, list(sections))
+                self.assertEqual(expected, list(sections))
+                self.assertEqual(expected[3], sections[3])
+                self.assertEqual(expected[-1], sections[-1])
+                self.assertEqual(expected[2:5], sections[2:5])
+                sections.close()
+                self.assertEqual([], os.listdir(spill_dir))
+
+            # Nothing is spilled when the results fit the budget.
+            sections = prp.parse_file(mock_path, memory_budget=1 << 30)
+            self.assertEqual(0, sections.spilled_sections)
+            self.assertEqual(expected, list(sections))
+        finally:
+            os.unlink(mock_path)
+            os.rmdir(spill_dir)
+
+    def test_intern_fields(self):
+        PRP = self.PRP
+        patterns = {
+            'hdr': {
+                PRP.INDEX_RE_STRING: r'^HDR\s+(?P<rep_date>\S+)$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION | PRP.FLAG_RETURN_ON_MATCH,
+                PRP.INDEX_RE_INTERN: True
+            },
+            'tx': {
+                PRP.INDEX_RE_STRING: r'^TX\s+(?P<tx_id>\d+)\s+(?P<fee_type>\w+)\s+(?P<code>\w+)$',
+                PRP.INDEX_RE_INTERN: ('fee_type', 'code'),
+                PRP.INDEX_RE_INTERN_LIMIT: 3
+            }
+        }
+        lines = []
+        for sec in range(4):
+            lines.append('HDR 2016-01-0' + str(sec % 2))
+            for i in range(5):
+                lines.append(f'TX {sec}{i} {"ZERO_FEE" if i % 2 else "POS_FEE"} C{i}')
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            f.write('\n'.join(lines) + '\n')
+            mock_path = f.name
+
+        try:
+            out = io.StringIO()
+            with redirect_stdout(out):
+                prp = PRP(patterns)
+                sections = prp.parse_file(mock_path)
+            rows = [item['fields'] for sec in sections for item in sec['fields_list'] if item['match_def'] == ['tx']]
+            self.assertEqual(20, len(rows))
+            self.assertEqual(['POS_FEE', 'ZERO_FEE'] * 2 + ['POS_FEE'], [r['fee_type'] for r in rows[:5]])
+            # Equal values are the same object, across sections too.
+            for r in rows:
+                self.assertIs(rows[0 if r['fee_type'] == 'POS_FEE' else 1]['fee_type'], r['fee_type'])
+            self.assertIs(sections[0]['fields_list'][0]['fields']['rep_date'],
+                          sections[2]['fields_list'][0]['fields']['rep_date'])
+            # 'code' has 5 distinct values, but only 3 are interned; the rest stay as captured.
+            self.assertEqual({'hdr': {'rep_date': 2}, 'tx': {'fee_type': 2, 'code': 3}}, prp.get_intern_stats())
+            self.assertIs(rows[0]['code'], rows[5]['code'])
+            self.assertIsNot(rows[4]['code'], rows[9]['code'])
+            self.assertEqual(rows[4]['code'], rows[9]['code'])
+            self.assertIn('Intern table [tx.code] is full', out.getvalue())
+            self.assertEqual(1, out.getvalue().count('is full'))
+
+            # Results are the same as without interning.
+            plain = {pat: {k: v for k, v in pat_def.items() if k not in (PRP.INDEX_RE_INTERN, PRP.INDEX_RE_INTERN_LIMIT)}
+                     for pat, pat_def in patterns.items()}
+            self.assertEqual(PRP(plain).parse_file(mock_path), sections)
+        finally:
+            os.unlink(mock_path)
+
+        patterns['tx'][PRP.INDEX_RE_INTERN] = ('no_such_fld',)
+        with self.assertRaises(ValueError):
+            PRP(patterns)
+        patterns['tx'][PRP.INDEX_RE_INTERN] = 'fee_type'
+        with self.assertRaises(ValueError):
+            PRP(patterns)
+
+    def test_records_result_format(self):
+        import pickle
+        import shutil
+        from pyreparse.records import Record, Section
+        from pyreparse.sinks import JsonlSink
+
+        PRP = self.PRP
+        mock_lines = [TestPyReParse.in_line_0, TestPyReParse.in_line_1, TestPyReParse.in_line_2,
+                      TestPyReParse.in_line_3, TestPyReParse.in_line_4, TestPyReParse.in_line_4]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            for _ in range(3):
+                f.write('\n'.join(mock_lines) + '\n')
+            mock_path = f.name
+        out_dir = tempfile.mkdtemp()
+
+        try:
+            prp = PRP(TestPyReParse.test_re_lines)
+            expected = prp.parse_file(mock_path)
+            for sections in (prp.parse_file(mock_path, result_format=PRP.RESULT_RECORDS),
+                             prp.parse_file_parallel(mock_path, result_format=PRP.RESULT_RECORDS),
+                             list(prp.parse_file_stream(mock_path, result_format=PRP.RESULT_RECORDS)),
+                             list(prp.parse_file(mock_path, result_format=PRP.RESULT_RECORDS, memory_budget=0))):
+                self.assertEqual(3, len(sections))
+                self.assertTrue(all(isinstance(sec, Section) for sec in sections))
+                self.assertEqual(expected, [sec.to_dict() for sec in sections])
+
+            sections = prp.parse_file(mock_path, result_format=PRP.RESULT_RECORDS)
+            rec = sections[0].fields_list[4]
+            self.assertIsInstance(rec, Record)
+            self.assertEqual(('tx_line',), rec.match_def)
+            self.assertEqual('394654', rec.ac_num)
+            self.assertEqual('394654', rec['ac_num'])
+            self.assertEqual(expected[0]['fields_list'][4]['fields'], dict(rec))
+            self.assertEqual(expected[0]['fields_list'][4]['fields'], rec)
+            self.assertFalse(hasattr(rec, '__dict__'))
+            # One record class per pattern.
+            self.assertIs(type(rec), type(sections[2].fields_list[5]))
+            self.assertEqual(sections[1]['section_start'], 7)
+            self.assertEqual(sections, pickle.loads(pickle.dumps(sections)))
+            # Fields named like Record / Mapping attributes don't shadow them.
+            from pyreparse.records import make_record
+            fields = {'keys': 'K', 'match_def': 'M', 'get': 'G', 'amt': '1.00'}
+            rec = make_record(['p'], fields)
+            self.assertEqual(('p',), rec.match_def)
+            self.assertEqual(fields, dict(rec))
+            self.assertEqual(('K', 'M', '1.00'), (rec['keys'], rec['match_def'], rec.amt))
+            self.assertEqual(('p',), pickle.loads(pickle.dumps(rec)).match_def)
+
+            # Sinks accept both formats.
+            with JsonlSink(prp, out_dir) as sink:
+                sink.write_sections(sections)
+            with open(os.path.join(out_dir, 'tx_line.jsonl')) as f:
+                self.assertEqual(6, len(f.readlines()))
+
+            with self.assertRaises(ValueError):
+                prp.parse_file(mock_path, result_format='tuples')
+        finally:
+            os.unlink(mock_path)
+            shutil.rmtree(out_dir)
+
+    def test_trigger_counter_windows(self):
+        PRP = self.PRP
+        inf = float('inf')
+        patterns = {
+            'page_hdr': {
+                PRP.INDEX_RE_STRING: r'^PAGE\s+(?P<page>\d+)$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION,
+                PRP.INDEX_RE_TRIGGER_ON: '<SECTION_LINE> == 1'
+            },
+            'title': {
+                PRP.INDEX_RE_STRING: r'^TITLE\s+(?P<title>.+)$',
+                PRP.INDEX_RE_TRIGGER_ON: 'not {title} and <REPORT_LINE> <= 3'
+            },
+            'col_hdr': {
+                PRP.INDEX_RE_STRING: r'^COLS\s+(?P<cols>.+)$',
+                PRP.INDEX_RE_TRIGGER_ON: '{page_hdr} and (<SECTION_LINE> == 1 or <SECTION_LINE> == 2)'
+            },
+            'row': {
+                PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)$',
+                PRP.INDEX_RE_TRIGGER_ON: '{col_hdr}',
+                PRP.INDEX_RE_TRIGGER_OFF: '<SECTION_LINE> > 6 | <SECTION_COUNT> >= 3'
+            },
+            'any': {
+                PRP.INDEX_RE_STRING: r'^ROW\s+(?P<any_val>\d+)$',
+                PRP.INDEX_RE_TRIGGER_ON: '3 > <SECTION_LINE> or <SECTION_COUNT> > 1'
+            }
+        }
+        prp = PRP(patterns)
+        self.assertEqual({
+            'title': {'<REPORT_LINE>': (-inf, 3)},
+            'col_hdr': {'<SECTION_LINE>': (1, 2)},
+        }, prp.get_trigger_windows())
+
+        # 'row' has an 'or' over two counters in trigger_off, so no window; 'any' likewise in trigger_on.
+        patterns['row'][PRP.INDEX_RE_TRIGGER_OFF] = '<SECTION_LINE> > 6'
+        prp = PRP(patterns)
+        self.assertEqual((-inf, 6), prp.get_trigger_windows()['row']['<SECTION_LINE>'])
+
+        # Comparisons that can't be analyzed (is, in...) leave their part unconstrained.
+        extra = dict(patterns, flag={PRP.INDEX_RE_STRING: r'^FLAG', PRP.INDEX_RE_TRIGGER_ON: '{title} is True'},
+                     word={PRP.INDEX_RE_STRING: r'^WORD',
+                           PRP.INDEX_RE_TRIGGER_ON: '"x" in "xy" and <SECTION_LINE> < 3'})
+        windows = PRP(extra).get_trigger_windows()
+        self.assertNotIn('flag', windows)
+        self.assertEqual({'<SECTION_LINE>': (-inf, 2)}, windows['word'])
+
+        lines = ['TITLE Fees']
+        for page in range(1, 5):
+            lines += [f'PAGE {page}', 'COLS a b'] + [f'ROW {i}' for i in range(8)]
+
+        def run(use_windows):
+            prp = PRP(patterns)
+            prp.use_counter_windows = use_windows
+            calls = [0]
+            eval_triggers = prp._PyReParse__eval_triggers
+
+            def counting_eval(pat_name):
+                calls[0] += 1
+                return eval_triggers(pat_name)
+
+            prp._PyReParse__eval_triggers = counting_eval
+            return [prp.match(line) for line in lines], calls[0]
+
+        with_windows, calls_with = run(True)
+        without_windows, calls_without = run(False)
+        self.assertEqual(without_windows, with_windows)
+        self.assertEqual(['title'], with_windows[0][0])
+        self.assertEqual(4 * 5, sum(1 for m, f in with_windows if m and 'row' in m))
+        self.assertLessEqual(calls_with, calls_without / 2)
+
+    def test_report_boundaries(self):
+        PRP = self.PRP
+        patterns = {
+            'report_hdr': {
+                PRP.INDEX_RE_STRING: r'^REPORT\s+(?P<report_no>\d+)$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_REPORT | PRP.FLAG_RETURN_ON_MATCH,
+            },
+            'title': {
+                PRP.INDEX_RE_STRING: r'^TITLE\s+(?P<title>.+)$',
+                PRP.INDEX_RE_TRIGGER_ON: '<REPORT_LINE> == 2',
+            },
+            'acct': {
+                PRP.INDEX_RE_STRING: r'^ACCT\s+(?P<acct>\d+)$',
+                PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION | PRP.FLAG_RETURN_ON_MATCH,
+            },
+            'tx': {
+                PRP.INDEX_RE_STRING: r'^TX\s+(?P<amt>\d+)$',
+                PRP.INDEX_RE_TRIGGER_ON: '{acct}',
+            },
+        }
+        lines = ['preamble']
+        for report in range(1, 4):
+            lines += [f'REPORT {report}', f'TITLE Report {report}']
+            for acct in range(2):
+                lines += [f'ACCT {report}{acct}'] + [f'TX {i}' for i in range(3)]
+
+        # report_reset() is called automatically: the title matches on line 2 of every report.
+        prp = PRP(patterns)
+        titles = []
+        for line in lines:
+            m, flds = prp.match(line)
+            if m and 'title' in m:
+                titles.append((flds['title'], prp.report_line_count))
+        self.assertEqual([(f'Report {n}', 2) for n in range(1, 4)], titles)
+        self.assertEqual(3, prp.report_count)
+        # Report states are per report.
+        self.assertEqual(1, prp.re_defs['title'][PRP.INDEX_STATES][PRP.INDEX_ST_REPORT_LINES_MATCHED])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'reports.txt')
+            with open(path, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            streamed = list(PRP(patterns).parse_file_stream(path))
+            self.assertEqual(6, len(streamed))
+            self.assertEqual([4, 8, 14, 18, 24, 28], [sec['section_start'] for sec in streamed])
+            # The report header does not end up in the previous report's last section.
+            self.assertEqual([['acct']] + [['tx']] * 3, [item['match_def'] for item in streamed[1]['fields_list']])
+
+            prp = PRP(patterns)
+            self.assertEqual(streamed, prp.parse_file_parallel(path, max_workers=3, split_at=PRP.SPLIT_REPORTS))
+            self.assertEqual(streamed, prp.parse_file(path, split_at=PRP.SPLIT_REPORTS))
+            self.assertEqual([sec['section_start'] for sec in streamed],
+                             [sec['section_start'] for sec in prp.parse_file_parallel(path, max_workers=3)])
+            spilled = prp.parse_file_parallel(path, max_workers=2, memory_budget=0, split_at=PRP.SPLIT_REPORTS)
+            self.assertEqual(streamed, list(spilled))
+            spilled.close()
+
+            with self.assertRaises(ValueError):
+                prp.parse_file(path, split_at='pages')
+            del patterns['report_hdr']
+            with self.assertRaises(ValueError):
+                PRP(patterns).parse_file_parallel(path, split_at=PRP.SPLIT_REPORTS)
+
+    def test_parallel_threads_clone(self):
+        import sys
+        import threading
+
+        PRP = self.PRP
+        data_path = os.path.join(os.path.dirname(__file__), 'data', 'NsfPosFees',
+                                 '999-063217-XXXX-PAID-NSF POS FEES CHARGED page 0001 to 0188.TXT')
+        counts = {'tx_line': 0}
+
+        def cb_count(prp_inst, pat_name):
+            # Not atomic: relies on callback_lock.
+            n = counts[pat_name]
+            time.sleep(0)
+            counts[pat_name] = n + 1
+
+        patterns = {pat: dict(defn) for pat, defn in TestPyReParse.test_re_lines.items()}
+        patterns['tx_line'][PRP.INDEX_RE_CALLBACK] = cb_count
+
+        prp = PRP(patterns)
+        clone = prp.clone()
+        self.assertIs(prp.re_defs['tx_line'][PRP.INDEX_RE_REGEXP], clone.re_defs['tx_line'][PRP.INDEX_RE_REGEXP])
+        self.assertIsNot(prp.re_defs['tx_line'][PRP.INDEX_STATES], clone.re_defs['tx_line'][PRP.INDEX_STATES])
+        self.assertIs(prp.intern_tables, clone.intern_tables)
+        clone.match(self.in_line_0)
+        self.assertEqual((1, 0), (clone.report_line_count, prp.report_line_count))
+        self.assertEqual(0, prp.re_defs['report_id'][PRP.INDEX_STATES][PRP.INDEX_ST_REPORT_LINES_MATCHED])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'many.txt')
+            with open(data_path) as src, open(path, 'w') as f:
+                f.write(src.read() * 4)
+
+            out = io.StringIO()
+            with redirect_stdout(out):
+                serial = prp.parse_file(path)
+                serial_count = counts['tx_line']
+                self.assertGreater(serial_count, 0)
+
+                prp.callback_lock = threading.Lock()
+                switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(1e-6)
+                try:
+                    counts['tx_line'] = 0
+                    parallel = prp.parse_file_parallel(path, max_workers=16)
+                finally:
+                    sys.setswitchinterval(switch_interval)
+            self.assertEqual(serial, parallel)
+            self.assertEqual(serial_count, counts['tx_line'])
+
+    def test_parse_file_processes(self):
+        from pyreparse.columnar import ColumnarSections, ColumnarWriter
+
+        PRP = self.PRP
+        data_path = os.path.join(os.path.dirname(__file__), 'data', 'NsfPosFees',
+                                 '999-063217-XXXX-PAID-NSF POS FEES CHARGED page 0001 to 0188.TXT')
+        prp = PRP(TestPyReParse.test_re_lines)
+        prp.PROCESS_BATCH_LINES = 500
+        out = io.StringIO()
+        with redirect_stdout(out):
+            expected = prp.parse_file(data_path)
+            expected_records = prp.parse_file(data_path, result_format=PRP.RESULT_RECORDS)
+            sections = prp.parse_file_parallel(data_path, max_workers=2, backend=PRP.BACKEND_PROCESSES)
+            records = prp.parse_file_parallel(data_path, max_workers=2, backend=PRP.BACKEND_PROCESSES,
+                                              result_format=PRP.RESULT_RECORDS)
+        self.assertGreater(len(sections._blocks), 1)
+        self.assertEqual(len(expected), len(sections))
+        self.assertEqual(expected, list(sections))
+        self.assertEqual(expected[-1], sections[-1])
+        self.assertEqual(expected[10:13], sections[10:13])
+        self.assertEqual(expected_records, list(records))
+        # Equal strings are decoded once.
+        self.assertIs(sections[0]['fields_list'][0]['match_def'][0], sections[1]['fields_list'][0]['match_def'][0])
+        first, second = sections[0]['fields_list'][1]['fields'], sections[2]['fields_list'][1]['fields']
+        shared = [fn for fn in first if isinstance(first[fn], str) and first[fn] == second.get(fn)]
+        self.assertTrue(shared)
+        self.assertTrue(all(first[fn] is second[fn] for fn in shared))
+        names = [block._shm.name for block in sections._blocks]
+        sections.close()
+        records.close()
+        if os.path.isdir('/dev/shm'):
+            self.assertFalse(any(os.path.exists(os.path.join('/dev/shm', name.lstrip('/'))) for name in names))
+
+        with self.assertRaises(ValueError):
+            prp.parse_file_parallel(data_path, backend=PRP.BACKEND_PROCESSES, memory_budget=1000)
+        with self.assertRaises(ValueError):
+            prp.parse_file_parallel(data_path, backend='fibers')
+
+        # Values put in the fields by callbacks, and totals, round trip.
+        section = {'section_start': 7, 'valid': False, 'totals': {'nsf_fee': Decimal('12.50')},
+                   'fields_list': [
+                       {'match_def': ['a'], 'fields': {'x': 'é', 'y': None, 'n': -5, 'f': 1.5, 'b': True,
+                                                       'subsection_depth': 1,
+                                                       'current_subsection_parents': ['a'],
+                                                       'subsection_line_count': 3}},
+                       {'match_def': ['b', 'c'], 'fields': {'x': 'é', 'big': 1 << 70}},
+                   ]}
+        writer = ColumnarWriter()
+        writer.append(section)
+        writer.append({'section_start': 9, 'valid': True, 'totals': {}, 'fields_list': []})
+        columns = ColumnarSections(writer.to_shared_memory())
+        self.assertEqual([section, {'section_start': 9, 'valid': True, 'totals': {}, 'fields_list': []}],
+                         list(columns))
+        self.assertIs(True, columns[0]['fields_list'][0]['fields']['b'])
+        columns.close()
+
+    def test_profile_cli(self):
+        import pstats
+        from pyreparse.__main__ import main
+        from pyreparse.profiling import load_spec, run_profile, format_profile
+
+        PRP = self.PRP
+        with tempfile.TemporaryDirectory() as tmp:
+            spec_path = os.path.join(tmp, 'my_spec.py')
+            with open(spec_path, 'w') as f:
+                f.write(
+                    "from pyreparse import PyReParse as PRP\n"
+                    "PATTERNS = {\n"
+                    "    'hdr': {PRP.INDEX_RE_STRING: r'^HDR\\s+(?P<hdr>\\w+)$',\n"
+                    "            PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION | PRP.FLAG_RETURN_ON_MATCH},\n"
+                    "    'tot': {PRP.INDEX_RE_STRING: r'^TOT\\s+(?P<tot>\\d+)$',\n"
+                    "            PRP.INDEX_RE_FLAGS: PRP.FLAG_RETURN_ON_MATCH,\n"
+                    "            PRP.INDEX_RE_SUM_CHECK: {'tot': ('row', 'val')}},\n"
+                    "    'row': {PRP.INDEX_RE_STRING: r'^ROW\\s+(?P<val>\\d+)$',\n"
+                    "            PRP.INDEX_RE_QUICK_CHECK: r'^ROW',\n"
+                    "            PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},\n"
+                    "}\n")
+            data_path = os.path.join(tmp, 'data.txt')
+            with open(data_path, 'w') as f:
+                for sec in range(3):
+                    f.write(f'HDR s{sec}\nROW 1\nROW x\nROW 3\nTOT {5 if sec == 2 else 4}\n')
+
+            spec = load_spec(spec_path)
+            self.assertEqual(['hdr', 'tot', 'row'], list(spec))
+            self.assertIs(TestPyReParse.test_re_lines, load_spec('pyreparse.tests.test_pyreparse:TestPyReParse.test_re_lines'))
+
+            for mode in ('loop', 'stream', 'serial', 'parallel'):
+                result = run_profile(spec, data_path, mode=mode, max_workers=3)
+                self.assertEqual(15, result['lines'])
+                attempts, matches, _, trig_calls, _ = result['patterns']['row']
+                self.assertEqual((9, 6), (attempts, matches), mode)
+                self.assertEqual(9, trig_calls)
+                self.assertEqual({'row': 3}, result['quick_check_misses'])
+                self.assertEqual({'tot': 1}, result['sum_check_failures'])
+            self.assertIn('Trigger cost: 9 calls', format_profile(result))
+
+            pstats_path = os.path.join(tmp, 'out.pstats')
+            out = io.StringIO()
+            with redirect_stdout(out):
+                self.assertEqual(0, main(['profile', f'{spec_path}:PATTERNS', data_path, '--mode', 'serial',
+                                          '--cprofile', pstats_path, '--pstats', '5']))
+            text = out.getvalue()
+            self.assertIn('Mode: serial  Lines: 15', text)
+            self.assertIn('Quick-check misses: 3  Sum check failures: 1', text)
+            self.assertIn('cumulative', text)
+            self.assertGreater(pstats.Stats(pstats_path).total_calls, 0)
+
+    def test_regex_risk_analyzer(self):
+        from pyreparse.__main__ import main
+        from pyreparse.re_risk import analyze_regex, fuzz_regex
+        import re
+
+        PRP = self.PRP
+        kinds = [finding.kind for finding in analyze_regex(r'^(\d+\s?)+$')]
+        self.assertEqual(['nested'], kinds)
+        kinds = [finding.kind for finding in analyze_regex(r'^\s+(?P<amt>[\-\s\d]+\.\d\d)\s')]
+        self.assertEqual(['whitespace'], kinds)
+        self.assertEqual(['adjacent'], [finding.kind for finding in analyze_regex(r'^[\d/]+.*$')])
+        # Fixed counts, separated repeats and disjoint sets are not ambiguous.
+        self.assertEqual([], analyze_regex(r'^.{24}\s+\d+(?:,\d+)*[a-z]+$'))
+
+        worst_time, worst_line, growth = fuzz_regex(re.compile(r'^(a+)+$'), time_limit=0.01)
+        self.assertGreater(worst_time, 0.01)
+        self.assertTrue(worst_line.startswith('aaaaaaaaaa'))
+        self.assertGreater(growth, 2)
+        worst_time, _, _ = fuzz_regex(re.compile(r'^\d+\s+\w+$'), time_limit=0.01)
+        self.assertLess(worst_time, 0.01)
+
+        prp = PRP()
+        patterns = dict(self.test_re_lines)
+        self.assertIsNone(prp.validate_re_defs(patterns))
+        out = io.StringIO()
+        with redirect_stdout(out):
+            reports = prp.validate_re_defs(patterns, check_risk=True)
+        self.assertEqual(list(patterns), list(reports))
+        self.assertEqual(['whitespace'], [finding.kind for finding in reports['tx_line'].findings])
+        self.assertIn('Warning: [tx_line] regex risk: Ambiguous whitespace run', out.getvalue())
+
+        patterns['bad'] = {PRP.INDEX_RE_STRING: r'^(?P<words>(\w+\s?)*):$'}
+        with redirect_stdout(io.StringIO()):
+            with self.assertRaises(ValueError):
+                prp.validate_re_defs(patterns, check_risk=True, risk_time_limit=0.05)
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(0, main(['risk', 'pyreparse.tests.test_pyreparse:TestPyReParse.test_re_lines',
+                                      '--no-fuzz']))
+        self.assertIn('[tx_line] Ambiguous whitespace run', out.getvalue())
+
+    def test_line_guard(self):
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+            'slow': {PRP.INDEX_RE_STRING: r'^(?P<words>(\w+\s?)*):$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+        }
+        corrupt = 'ROW 7' + ' x' * 50
+        lines = ['HDR a', 'ROW 1', corrupt, 'ROW 2', 'HDR b', 'ROW 3', 'aaaaaaaaaaaaaaaaaaaaaa!']
+
+        prp = PRP(patterns)
+        self.assertIsNone(prp.line_guard)
+        guard = prp.set_line_guard(max_line_length=20, slow_line_threshold=0.002)
+        results = [prp.match(line)[1].get('val') for line in lines]
+        # The corrupt line is truncated and matched.
+        self.assertEqual([None, '1', '7', '2', None, '3', None], results)
+        self.assertEqual({'slow': 1, 'truncated': 2, 'rejected': 0}, guard.get_stats())
+        slow, = guard.get_slow_lines()
+        self.assertEqual((7, 2, 'slow'), slow[:3])
+        self.assertGreater(slow.seconds, 0.002)
+        self.assertEqual(lines[-1][:20], slow.line)
+
+        rejects = []
+        prp = PRP(patterns)
+        guard = prp.set_line_guard(max_line_length=20, reject_sink=lambda *args: rejects.append(args))
+        sections = list(prp.parse_file_stream_from(lines[:6]))
+        self.assertEqual([(3, 1, corrupt)], rejects)
+        self.assertEqual([['hdr', 'row', 'row'], ['hdr', 'row']],
+                         [[pat for item in sec['fields_list'] for pat in item['match_def']] for sec in sections])
+        self.assertEqual(6, prp.report_line_count)
+
+        # Clones share the guard, line numbers are file line numbers.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.txt')
+            with open(path, 'w') as f:
+                f.write('\n'.join(lines[:6] * 3) + '\n')
+            rejects.clear()
+            prp.parse_file_parallel(path, max_workers=3)
+            self.assertEqual([3, 9, 15], sorted(line_number for line_number, _, _ in rejects))
+            self.assertEqual(4, guard.get_stats()['rejected'])
+            with self.assertRaises(ValueError):
+                prp.parse_file_parallel(path, backend=PRP.BACKEND_PROCESSES)
+
+        self.assertIsNone(prp.set_line_guard())
+        self.assertIsNone(prp.clone().line_guard)
+        with self.assertRaises(ValueError):
+            prp.set_line_guard(reject_sink=print)
+
+    def test_scalable_loading(self):
+        PRP = self.PRP
+        # Trigger symbols next to comparison operators tokenize correctly.
+        patterns = {
+            'x': {PRP.INDEX_RE_STRING: r'^X\s+(?P<x_b>\w+)\s+(?P<x_a>\w+)$'},
+            'y': {PRP.INDEX_RE_STRING: r'^Y$', PRP.INDEX_RE_TRIGGER_ON: '<REPORT_LINE> <= 3 and {x}'},
+            'z': {PRP.INDEX_RE_STRING: r'^Z$',
+                  PRP.INDEX_RE_TRIGGER_ON: '<SECTION_LINE> < 3 or <REPORT_LINE>>10 or {x}'},
+        }
+        prp = PRP(patterns)
+        self.assertIn("return prp_inst.report_line_count <= 3 and "
+                      "(prp_inst.re_defs['x'][PRP.INDEX_STATES][PRP.INDEX_ST_SECTION_LINES_MATCHED] > 0)\n",
+                      prp.re_defs['y'][PRP.INDEX_RE_TRIGGER_ON_TEXT])
+        self.assertEqual([None, ['x'], ['y'], None, ['z']],
+                         [prp.match(line)[0] for line in ('Y', 'X b a', 'Y', 'Y', 'Z')])
+        # Field names come in group order.
+        self.assertEqual(['x_b', 'x_a'], list(prp.get_fld_names('x')))
+        self.assertEqual(['x_b', 'x_a'], list(prp.get_all_fld_names()))
+
+        with self.assertRaises(TriggerDefException):
+            PRP().validate_re_defs(dict(patterns, w={PRP.INDEX_RE_STRING: 'w', PRP.INDEX_RE_TRIGGER_ON: '<A> < 3'}))
+
+        # Dependency chains deeper than the recursion limit, and a cycle at the end of one.
+        chain = {'p0': {PRP.INDEX_RE_STRING: r'^P0$'}}
+        for i in range(1, 3000):
+            chain[f'p{i}'] = {PRP.INDEX_RE_STRING: rf'^P{i}$', PRP.INDEX_RE_TRIGGER_ON: f'{{p{i - 1}}}'}
+        PRP().validate_re_defs(chain)
+        chain['p0'] = {PRP.INDEX_RE_STRING: r'^P0$', PRP.INDEX_RE_TRIGGER_ON: '{p2999}'}
+        with self.assertRaises(ValueError) as cm:
+            PRP().validate_re_defs(chain)
+        self.assertIn('Cycle detected', str(cm.exception))
+
+    def test_ignore_lines(self):
+        import re
+        from pyreparse.ignore import ignore_test, KIND_BLANK, KIND_PREFIX, KIND_REGEXP
+
+        PRP = self.PRP
+        samples = ['', ' ', ' \t ', 'x', ' x', 'Account ', 'Account  Fee', 'PAGE 1', '\fPAGE', 'page', 'Acc']
+        for re_string, kind in ((r'^$', KIND_BLANK), (r'^\s*$', KIND_BLANK), (r'\s+$', KIND_BLANK),
+                                (r'^Account\ ', KIND_PREFIX), (r'^(?:PAGE|\f)', KIND_PREFIX), (r'^[xp]', KIND_PREFIX),
+                                (r'^Account\s+Fee', KIND_REGEXP), (r'(?i)^page', KIND_REGEXP),
+                                (r'^(?i:page)', KIND_REGEXP), (r'^x$', KIND_REGEXP)):
+            regexp = re.compile(re_string, re.X)
+            test_kind, test = ignore_test(regexp)
+            self.assertEqual(kind, test_kind, re_string)
+            self.assertEqual([bool(regexp.match(s)) for s in samples], [bool(test(s)) for s in samples], re_string)
+
+        patterns = {
+            'blank': {PRP.INDEX_RE_STRING: r'^\s*$', PRP.INDEX_RE_FLAGS: PRP.FLAG_IGNORE},
+            'page': {PRP.INDEX_RE_STRING: r'^PAGE\ ', PRP.INDEX_RE_FLAGS: PRP.FLAG_IGNORE},
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'second': {PRP.INDEX_RE_STRING: r'^(?P<val>\w+)$', PRP.INDEX_RE_TRIGGER_ON: '<SECTION_LINE> == 2'},
+        }
+        lines = ['HDR', '', 'PAGE 2', 'a', 'b']
+        prp = PRP(patterns)
+        self.assertEqual([['hdr'], None, None, None, None], [prp.match(line)[0] for line in lines])
+        self.assertEqual(2, prp.ignored_line_count)
+        self.assertEqual(0, prp.re_defs['second'][PRP.INDEX_STATES][PRP.INDEX_ST_REPORT_MATCH_ATTEMPTS])
+
+        # Page headers invisible to the section counters: 'a' is now section line 2.
+        patterns['page'][PRP.INDEX_RE_IGNORE_COUNTERS] = PRP.IGNORE_COUNT_REPORT
+        prp = PRP(patterns)
+        self.assertEqual([['hdr'], None, None, ['second'], None], [prp.match(line)[0] for line in lines])
+        self.assertEqual(5, prp.report_line_count)
+        patterns['blank'][PRP.INDEX_RE_IGNORE_COUNTERS] = PRP.IGNORE_COUNT_NONE
+        prp = PRP(patterns)
+        self.assertEqual([['hdr'], None, None, None, ['second']], [prp.match(line)[0] for line in lines])
+        self.assertEqual(4, prp.report_line_count)
+        self.assertEqual(5, prp.input_line_count)
+
+        with self.assertRaises(ValueError):
+            PRP(dict(patterns, bad={PRP.INDEX_RE_STRING: 'x', PRP.INDEX_RE_FLAGS: PRP.FLAG_IGNORE | PRP.FLAG_NEW_SECTION}))
+        with self.assertRaises(ValueError):
+            PRP(dict(patterns, bad={PRP.INDEX_RE_STRING: 'x', PRP.INDEX_RE_FLAGS: PRP.FLAG_IGNORE,
+                                    PRP.INDEX_RE_IGNORE_COUNTERS: 'section'}))
+
+    def test_section_cache(self):
+        from pyreparse.cache import SectionCache
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+        }
+        lines = [f'HDR s{i}\nROW {i}\nROW {i * 2}\n' for i in range(6)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.txt')
+            with open(path, 'w') as f:
+                f.write(''.join(lines))
+            prp = PRP(patterns)
+            expected = prp.parse_file(path)
+            cache = SectionCache(os.path.join(tmp, 'cache'))
+            self.assertEqual(expected, prp.parse_file(path, cache=cache))
+            self.assertEqual((0, 6), (cache.hits, cache.misses))
+            self.assertEqual(expected, prp.parse_file(path, cache=cache))
+            self.assertEqual(expected, prp.parse_file_parallel(path, max_workers=2, cache=cache))
+            self.assertEqual((12, 6), (cache.hits, cache.misses))
+            self.assertEqual(prp.parse_file(path, result_format=PRP.RESULT_RECORDS),
+                             prp.parse_file(path, result_format=PRP.RESULT_RECORDS, cache=cache))
+
+            # A section inserted at the front moves the others: they are still hits, with rebased section_start.
+            with open(path, 'w') as f:
+                f.write(''.join(['HDR new\nROW 99\n'] + lines))
+            hits = cache.hits
+            self.assertEqual(prp.parse_file(path), prp.parse_file(path, cache=cache.cache_dir))
+            self.assertEqual(hits, cache.hits)  # A directory opens another SectionCache.
+            self.assertEqual(prp.parse_file(path), prp.parse_file(path, cache=cache))
+            self.assertEqual(hits + 7, cache.hits)
+
+            # Other patterns (or split_at) are other keys.
+            other = PRP(dict(patterns, row={PRP.INDEX_RE_STRING: r'^ROW\s+(?P<num>\d+)',
+                                            PRP.INDEX_RE_TRIGGER_ON: '{hdr}'}))
+            misses = cache.misses
+            self.assertEqual(other.parse_file(path), other.parse_file(path, cache=cache))
+            self.assertEqual(misses + 7, cache.misses)
+            with self.assertRaises(ValueError):
+                prp.parse_file_parallel(path, backend=PRP.BACKEND_PROCESSES, cache=cache)
+
+            # Eviction: by age (last use), then least recently used down to max_bytes.
+            self.assertEqual(14, len(cache._entries()))
+            old = time.time() - 3600
+            for _, _, entry_path in cache._entries()[:4]:
+                os.utime(entry_path, (old, old))
+            cache.max_age = 60
+            self.assertEqual(4, cache.evict())
+            cache.max_bytes = cache.size() // 2
+            cache.evict()
+            self.assertLessEqual(cache.size(), cache.max_bytes)
+            cache.clear()
+            self.assertEqual(0, cache.size())
+
+    def test_batched_callbacks(self):
+        PRP = self.PRP
+        events = []
+
+        def on_rows(prp_inst, pat_name, batch):
+            events.append(('rows', prp_inst.section_count, batch))
+
+        def on_hdr(prp_inst, pat_name, batch):
+            events.append(('hdr', prp_inst.section_count, batch))
+
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION,
+                    PRP.INDEX_RE_BATCH_CALLBACK: on_hdr, PRP.INDEX_RE_BATCH_COLUMNAR: True},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)\s+(?P<code>\w)', PRP.INDEX_RE_TRIGGER_ON: '{hdr}',
+                    PRP.INDEX_RE_BATCH_CALLBACK: on_rows, PRP.INDEX_RE_BATCH_SIZE: 2},
+        }
+        lines = ['HDR a', 'ROW 1 x', 'ROW 2 y', 'ROW 3 z', 'HDR b', 'ROW 4 x']
+
+        prp = PRP(patterns)
+        for line in lines:
+            prp.match(line)
+        # Full batches are delivered when they fill, partial ones at the next section boundary.
+        self.assertEqual([
+            ('rows', 1, [{'val': '1', 'code': 'x'}, {'val': '2', 'code': 'y'}]),
+            ('hdr', 1, {'hdr': ['a']}),
+            ('rows', 1, [{'val': '3', 'code': 'z'}]),
+        ], events)
+        events.clear()
+        prp.flush_batches()
+        self.assertEqual([('hdr', 2, {'hdr': ['b']}), ('rows', 2, [{'val': '4', 'code': 'x'}])], events)
+        events.clear()
+        prp.flush_batches()
+        self.assertEqual([], events)
+
+        # Streams flush at the end of the input, and a section's batches precede its section callback.
+        prp = PRP(patterns)
+        for _ in prp.parse_file_stream_from(lines, callback=lambda sec: events.append(('section',))):
+            pass
+        self.assertEqual(['rows', 'hdr', 'rows', 'section', 'hdr', 'rows', 'section'], [e[0] for e in events])
+
+        # Chunk workers flush per chunk: the same batches, whatever the scheduling.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.txt')
+            with open(path, 'w') as f:
+                f.write('\n'.join(lines * 2) + '\n')
+            events.clear()
+            prp.parse_file_parallel(path, max_workers=2)
+            rows = sorted(row['val'] for kind, _, batch in events if kind == 'rows' for row in batch)
+            self.assertEqual(['1', '1', '2', '2', '3', '3', '4', '4'], rows)
+            self.assertEqual(6, sum(1 for kind, _, _ in events if kind == 'rows'))
+
+        # Report boundaries end batches too.
+        reports = dict(patterns, rpt={PRP.INDEX_RE_STRING: r'^RPT$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_REPORT})
+        prp = PRP(reports)
+        events.clear()
+        for line in ['HDR a', 'ROW 1 x', 'RPT', 'ROW 2 y']:
+            prp.match(line)
+        self.assertEqual([('hdr', 1, {'hdr': ['a']}), ('rows', 1, [{'val': '1', 'code': 'x'}])], events)
+
+        with self.assertRaises(ValueError):
+            PRP({'p': {PRP.INDEX_RE_STRING: r'^P', PRP.INDEX_RE_BATCH_CALLBACK: 'not callable'}})
+        with self.assertRaises(ValueError):
+            PRP({'p': {PRP.INDEX_RE_STRING: r'^P', PRP.INDEX_RE_BATCH_CALLBACK: on_rows, PRP.INDEX_RE_BATCH_SIZE: 0}})
+        out = io.StringIO()
+        with redirect_stdout(out):
+            PRP({'p': {PRP.INDEX_RE_STRING: r'^P', PRP.INDEX_RE_BATCH_SIZE: 10}})
+        self.assertIn('[p] has no batch_callback', out.getvalue())
+
+    def test_async_streams(self):
+        import asyncio
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+        }
+        lines = [line for i in range(20) for line in (f'HDR s{i}\n', f'ROW {i}\n', 'noise\n', f'ROW {i + 1}\n')]
+        expected_matches = list(PRP(patterns).stream_matches_from(lines))
+        expected_sections = list(PRP(patterns).parse_file_stream_from(lines))
+
+        async def from_stream_reader():
+            reader = asyncio.StreamReader()
+            reader.feed_data(''.join(lines).encode())
+            reader.feed_eof()
+            return [m async for m in PRP(patterns).astream_matches(reader)]
+
+        async def from_async_iterable():
+            async def source():
+                for line in lines:
+                    yield line.encode()
+            return [sec async for sec in PRP(patterns).aparse_file_stream(source())]
+
+        async def from_iterable():
+            return [sec async for sec in PRP(patterns).aparse_file_stream(lines)]
+
+        self.assertEqual(expected_matches, asyncio.run(from_stream_reader()))
+        self.assertEqual(expected_sections, asyncio.run(from_async_iterable()))
+        self.assertEqual(expected_sections, asyncio.run(from_iterable()))
+
+        # Coroutine callbacks run concurrently with the parse, at most max_pending at a time.
+        written = []
+        in_flight = 0
+        peak = 0
+
+        async def write(section):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001 * (len(written) % 3))
+            written.append(section['section_start'])
+            in_flight -= 1
+
+        async def run_callbacks(max_pending):
+            async for _ in PRP(patterns).aparse_file_stream(lines, callback=write, max_pending=max_pending):
+                pass
+
+        asyncio.run(run_callbacks(4))
+        self.assertEqual(sorted(written), [sec['section_start'] for sec in expected_sections])
+        self.assertEqual(4, peak)
+        written.clear()
+        peak = 0
+        asyncio.run(run_callbacks(1))
+        self.assertEqual(written, [sec['section_start'] for sec in expected_sections])
+        self.assertEqual(1, peak)
+
+        # A failing callback stops the parse.
+        async def fail(m, flds):
+            if m:
+                raise RuntimeError('db down')
+
+        async def run_failing():
+            # Every failed callback task's exception is retrieved: none is reported by the loop.
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+            try:
+                async for _ in PRP(patterns).astream_matches(lines, callback=fail):
+                    pass
+            except RuntimeError as e:
+                errors.append(str(e))
+            gc.collect()
+
+        errors = []
+        unhandled = []
+        asyncio.run(run_failing())
+        self.assertEqual(['db down'], errors)
+        self.assertEqual([], unhandled)
+
+    def test_trace_recording(self):
+        from pyreparse.__main__ import main
+        from pyreparse.trace import TraceEvent, read_trace
+        PRP = self.PRP
+        patterns = {
+            'blank': {PRP.INDEX_RE_STRING: r'^\s*$', PRP.INDEX_RE_FLAGS: PRP.FLAG_IGNORE},
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+            'note': {PRP.INDEX_RE_STRING: r'^NOTE', PRP.INDEX_RE_TRIGGER_ON: '{row}'},
+            'total': {PRP.INDEX_RE_STRING: r'^TOTAL', PRP.INDEX_RE_TRIGGER_ON: '<SECTION_LINE> > 2'},
+        }
+        lines = ['HDR a', 'ROW 1', '', 'ROW x', 'HDR b']
+
+        prp = PRP(patterns)
+        tracer = prp.start_trace()
+        for line in lines:
+            prp.match(line)
+        events = list(tracer.get_events())
+        self.assertEqual([
+            TraceEvent(1, 'hdr', 'eval', 'match'), TraceEvent(1, 'hdr', 'section', None),
+            TraceEvent(1, 'row', 'eval', 'miss'), TraceEvent(1, 'note', 'eval', 'off'),
+            TraceEvent(1, 'total', 'eval', 'window'),
+            TraceEvent(2, 'hdr', 'eval', 'miss'), TraceEvent(2, 'row', 'eval', 'match'),
+            TraceEvent(2, 'note', 'eval', 'miss'), TraceEvent(2, 'total', 'eval', 'window'),
+            TraceEvent(3, 'blank', 'ignore', None),
+            TraceEvent(4, 'hdr', 'eval', 'miss'), TraceEvent(4, 'row', 'eval', 'miss'),
+            TraceEvent(4, 'note', 'eval', 'miss'), TraceEvent(4, 'total', 'eval', 'miss'),
+            TraceEvent(5, 'hdr', 'eval', 'match'), TraceEvent(5, 'hdr', 'section', None),
+            TraceEvent(5, 'row', 'eval', 'miss'), TraceEvent(5, 'note', 'eval', 'off'),
+            TraceEvent(5, 'total', 'eval', 'window'),
+        ], events)
+        self.assertIs(tracer, prp.stop_trace())
+        self.assertIsNone(prp.tracer)
+        self.assertEqual(19, len(list(tracer.get_events())))
+
+        # A small ring keeps the most recent events.
+        prp = PRP(patterns)
+        prp.start_trace(capacity=4)
+        for line in lines:
+            prp.match(line)
+        self.assertEqual([(5, 'hdr'), (5, 'row'), (5, 'note'), (5, 'total')],
+                         [(e.line_number, e.pattern) for e in prp.tracer.get_events()])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            ring_path = os.path.join(tmp, 'ring.trace')
+            prp.stop_trace().save(ring_path)
+            header, events = read_trace(ring_path)
+            self.assertEqual(15, header['dropped'])
+            self.assertEqual(4, len(list(events)))
+
+            data_path = os.path.join(tmp, 'data.txt')
+            with open(data_path, 'w') as f:
+                f.write('\n'.join(lines * 3) + '\n')
+            # Clones trace into the same file: each chunk's events are contiguous.
+            trace_path = os.path.join(tmp, 'run.trace')
+            prp.start_trace(trace_path, triggers=False)
+            prp.parse_file_parallel(data_path, max_workers=2)
+            prp.stop_trace()
+            header, events = read_trace(trace_path)
+            self.assertEqual(['blank', 'hdr', 'row', 'note', 'total'], header['patterns'])
+            events = list(events)
+            self.assertEqual(6, sum(1 for e in events if e.kind == 'section'))
+            self.assertNotIn('off', {e.value for e in events})
+            self.assertEqual(list(range(1, 16)), sorted({e.line_number for e in events}))
+
+            out = io.StringIO()
+            with redirect_stdout(out):
+                self.assertEqual(0, main(['trace', trace_path, '--lines', '5-6', '--kind', 'section']))
+            self.assertEqual([['5', 'section', 'hdr'], ['6', 'section', 'hdr']],
+                             [line.split() for line in out.getvalue().splitlines()])
+            out = io.StringIO()
+            with redirect_stdout(out):
+                main(['trace', trace_path, '--summary'])
+            self.assertRegex(out.getvalue(), r'row\s+0\s+0\s+9\s+3')
+
+            with self.assertRaises(ValueError):
+                prp.start_trace(trace_path)
+                prp.parse_file_parallel(data_path, backend=PRP.BACKEND_PROCESSES)
+            prp.stop_trace()
+
+    def test_metrics_export(self):
+        import urllib.request
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<val>\d+)$', PRP.INDEX_RE_TRIGGER_ON: '{hdr}',
+                    PRP.INDEX_RE_QUICK_CHECK: r'^ROW'},
+        }
+        lines = ['HDR a', 'ROW 1', 'ROW x', 'HDR b', 'ROW 2', 'ROW 3']
+        with tempfile.TemporaryDirectory() as tmp:
+            data_path = os.path.join(tmp, 'data.txt')
+            with open(data_path, 'w') as f:
+                f.write('\n'.join(lines * 2) + '\n')
+            size = os.path.getsize(data_path)
+
+            prp = PRP(patterns)
+            metrics = prp.start_metrics()
+            with redirect_stdout(io.StringIO()):
+                sections = list(prp.parse_file_stream(data_path))
+            self.assertEqual(4, len(sections))
+            sample = metrics.sample()
+            self.assertEqual((12, 4), (sample['lines'], sample['sections']))
+            self.assertEqual({'hdr': 4, 'row': 6}, sample['matches'])
+            self.assertEqual({'hdr': 0, 'row': 2}, sample['quick_check_misses'])
+            self.assertEqual((size, size), (sample['bytes'], sample['input_size']))
+            self.assertEqual(0, sample['workers'])
+
+            # The counters of a running stream are sampled, and are not reset by reports or other runs.
+            stream = prp.stream_matches(data_path)
+            with redirect_stdout(io.StringIO()):
+                for _ in range(3):
+                    next(stream)
+            sample = metrics.sample()
+            self.assertEqual((1, 15, 5), (sample['workers'], sample['lines'], sample['sections']))
+            with redirect_stdout(io.StringIO()):
+                list(stream)
+            self.assertEqual({'hdr': 8, 'row': 12}, metrics.counts()['matches'])
+
+            # Parallel chunk workers, threads and processes, are aggregated.
+            for backend in (PRP.BACKEND_THREADS, PRP.BACKEND_PROCESSES):
+                prp.stop_metrics()
+                metrics = prp.start_metrics()
+                with redirect_stdout(io.StringIO()):
+                    prp.parse_file_parallel(data_path, max_workers=2, backend=backend)
+                sample = metrics.sample()
+                self.assertEqual((12, 4), (sample['lines'], sample['sections']))
+                self.assertEqual({'hdr': 4, 'row': 6}, sample['matches'])
+                self.assertEqual({'hdr': 0, 'row': 2}, sample['quick_check_misses'])
+
+            # Exported over HTTP, and to a file rewritten periodically.
+            prom_path = os.path.join(tmp, 'pyreparse.prom')
+            metrics = prp.start_metrics(http_port=0, textfile=prom_path, interval=60)
+            with redirect_stdout(io.StringIO()):
+                prp.parse_file(data_path)
+            with urllib.request.urlopen(f'http://127.0.0.1:{metrics.http_port}/metrics') as resp:
+                self.assertIn('text/plain', resp.headers['Content-Type'])
+                text = resp.read().decode()
+            self.assertIn('pyreparse_lines_total 12\n', text)
+            self.assertIn('# TYPE pyreparse_pattern_matches_total counter\n', text)
+            self.assertIn('pyreparse_pattern_matches_total{pattern="row"} 6\n', text)
+            self.assertIn('pyreparse_quick_check_misses_total{pattern="row"} 2\n', text)
+            self.assertIn(f'pyreparse_input_size_bytes {size}\n', text)
+            self.assertIn('pyreparse_eta_seconds 0.0\n', text)
+            with open(prom_path) as f:
+                self.assertIn('pyreparse_lines_total 0\n', f.read())  # Written when started.
+            self.assertIs(metrics, prp.stop_metrics())
+            with open(prom_path) as f:
+                self.assertIn('pyreparse_sections_total 4\n', f.read())  # Written again when stopped.
+            self.assertIsNone(prp.metrics)
+            # A closed registry can write its file again: the new writer keeps rewriting it.
+            metrics.start_textfile(prom_path, interval=0.01)
+            try:
+                os.unlink(prom_path)
+                deadline = time.monotonic() + 5
+                while not os.path.exists(prom_path) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertTrue(os.path.exists(prom_path))
+            finally:
+                metrics.close()
+
+    def test_encodings(self):
+        import asyncio
+        from pyreparse.inputs import LineDecoder, is_single_byte, iter_lines_at
+        PRP = self.PRP
+        patterns = {
+            'hdr': {PRP.INDEX_RE_STRING: r'^HDR\s+(?P<hdr>\w+)$', PRP.INDEX_RE_FLAGS: PRP.FLAG_NEW_SECTION},
+            'row': {PRP.INDEX_RE_STRING: r'^ROW\s+(?P<name>\S+)\s+(?P<amt>\d+\.\d\d)$',
+                    PRP.INDEX_RE_TRIGGER_ON: '{hdr}'},
+        }
+        lines = ['HDR a', 'ROW Müller 1.50', 'ROW Zoë 2.00', 'HDR b', 'ROW €uro 3.25']
+        expected = [('a', ['Müller', 'Zoë']), ('b', ['€uro'])]
+
+        def names(sections):
+            return [(sec['fields_list'][0]['fields']['hdr'],
+                     [item['fields']['name'] for item in sec['fields_list'][1:]]) for sec in sections]
+
+        self.assertTrue(is_single_byte('cp037') and is_single_byte('latin-1') and is_single_byte('CP1252'))
+        self.assertFalse(is_single_byte('utf-8'))
+        # Byte counts of multi-byte lines, a '\r\n' line end and a line split across blocks.
+        decoder = LineDecoder('utf-8')
+        self.assertEqual([(4, 'ab\n')], decoder.feed('ab\r\nZo'.encode()))
+        self.assertEqual([(6, 'Zoë\n')], decoder.feed('ë\r\n'.encode()))
+        self.assertEqual([(2, 'x!')], decoder.feed(b'x!') + decoder.finish())
+        with self.assertRaises(ValueError):
+            LineDecoder('utf-16')
+        # Bare '\r' line ends, with a '\r' ending a block held back in case a '\n' follows.
+        decoder = LineDecoder('latin-1')
+        self.assertEqual([(2, 'a\n')], decoder.feed(b'a\rb\r'))
+        self.assertEqual([(3, 'b\n'), (2, 'c\n')], decoder.feed(b'\nc\r') + decoder.finish())
+        self.assertEqual([(3, 'a\x85\n')], decoder.feed(b'a\x85\n'))  # NEL only ends EBCDIC lines.
+        # EBCDIC lines end with NEL (b'\x15') or '\n' (b'\x25').
+        decoder = LineDecoder('cp500')
+        self.assertEqual([(2, 'a\n'), (2, 'b\n'), (1, 'c')], decoder.feed(b'\x81\x15\x82\x25\x83') + decoder.finish())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # cp500 records end with NEL, as mainframe reports do.
+            for encoding, line_end in (('cp037', '\n'), ('cp500', '\x85'), ('cp1252', '\r\n')):
+                text = line_end.join(lines) + line_end
+                if encoding != 'cp1252':
+                    text = text.replace('€', 'E')  # Not in EBCDIC code pages.
+                raw = text.encode(encoding)
+                self.assertEqual(encoding == 'cp500', b'\x15' in raw)
+                path = os.path.join(tmp, f'report.{encoding}')
+                with open(path, 'wb') as f:
+                    f.write(raw)
+                want = expected if encoding == 'cp1252' else [('a', ['Müller', 'Zoë']), ('b', ['Euro'])]
+                prp = PRP(patterns)
+                self.assertEqual(want, names(prp.parse_file(path, encoding=encoding)))
+                self.assertEqual(want, names(prp.parse_file_parallel(path, max_workers=2, encoding=encoding)))
+                self.assertEqual(want, names(prp.parse_file_stream(path, encoding=encoding)))
+                self.assertEqual(want, names(prp.parse_file_stream_from(io.BytesIO(raw), encoding=encoding)))
+                ckpt = os.path.join(tmp, 'ckpt.json')
+                self.assertEqual(want, names(prp.parse_file_stream(path, checkpoint_path=ckpt, encoding=encoding)))
+                self.assertEqual(want, names(prp.follow_file_stream(path, idle_timeout=0, encoding=encoding)))
+
+                async def collect():
+                    return [sec async for sec in prp.aparse_file_stream(path, encoding=encoding)]
+
+                self.assertEqual(want, names(asyncio.run(collect())))
+                # Byte counts add up to the file size, with small blocks splitting lines.
+                read = list(iter_lines_at(path, encoding=encoding, block_size=7))
+                self.assertEqual(len(raw), sum(n for n, _ in read))
+                self.assertEqual([line + '\n' for line in text.splitlines()], [line for _, line in read])
+                offset = read[0][0] + read[1][0]
+                self.assertEqual(read[2:], list(iter_lines_at(path, offset, encoding=encoding)))
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+'''
+Binary trace recording: what match() did on each line, cheap enough to leave on for a whole run.
+
+match(debug=True) prints several lines per pattern per input line. A Tracer, started with
+PyReParse.start_trace(), instead records one 64-bit event per step...
+
+    bits 63..24  line number (PyReParse.input_line_count, 1-based)
+    bits 23..8   pattern index (in pattern definition order, NO_PATTERN for none)
+    bits  7..4   kind
+    bits  3..0   value
+
+  EV_EVAL     A pattern evaluated on a line. Value: EVAL_OFF (trigger False), EVAL_WINDOW (counter window closed,
+              trigger not evaluated), EVAL_MISS (regexp tried, no match) or EVAL_MATCH.
+  EV_SECTION  A FLAG_NEW_SECTION match (the pattern), before the section counters reset.
+  EV_REPORT   A FLAG_NEW_REPORT line (the pattern).
+  EV_END_SECTION / EV_SUBSECTION  FLAG_END_OF_SECTION / FLAG_NEW_SUBSECTION matches.
+  EV_IGNORE   A FLAG_IGNORE line (the pattern).
+  EV_TRUNCATE / EV_REJECT  A line truncated or rejected by the line guard.
+
+Events are appended to an array and moved, in blocks of TRACE_BLOCK events, to the trace's sink...
+  - A trace file: a header (magic, version, JSON with the pattern names) followed by the little-endian events.
+  - A preallocated ring buffer of capacity events, keeping the most recent ones. save() writes it as a trace file.
+
+With triggers=False, EVAL_OFF and EVAL_WINDOW events (the bulk of a trace) are not recorded.
+
+Clones share the sink: each clone buffers its own events and flushes them (under a lock) at the end of its
+chunk, so a trace of parse_file_parallel() holds each chunk's events contiguously, in line order.
+
+Read traces with read_trace(), or: python -m pyreparse trace <trace-file> [filters].
+'''
+
+import argparse
+import json
+import struct
+import sys
+import threading
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+TRACE_MAGIC = b'PRPTRACE'
+TRACE_VERSION = 1
+TRACE_BLOCK = 1 << 16          # Events buffered before they are moved to the sink.
+DEFAULT_RING_EVENTS = 1 << 22  # 32 MB ring buffer.
+NO_PATTERN = 0xFFFF
+
+LINE_SHIFT = 24
+PATTERN_SHIFT = 8
+
+EV_EVAL = 1
+EV_SECTION = 2
+EV_REPORT = 3
+EV_END_SECTION = 4
+EV_SUBSECTION = 5
+EV_IGNORE = 6
+EV_TRUNCATE = 7
+EV_REJECT = 8
+
+EVAL_OFF = 0
+EVAL_WINDOW = 1
+EVAL_MISS = 2
+EVAL_MATCH = 3
+
+# The low byte (kind << 4 | value) of each event, as match() ORs it into its events.
+CODE_EVAL_OFF = EV_EVAL << 4 | EVAL_OFF
+CODE_EVAL_WINDOW = EV_EVAL << 4 | EVAL_WINDOW
+CODE_EVAL_MISS = EV_EVAL << 4 | EVAL_MISS
+CODE_EVAL_MATCH = EV_EVAL << 4 | EVAL_MATCH
+CODE_SECTION = EV_SECTION << 4
+CODE_REPORT = EV_REPORT << 4
+CODE_END_SECTION = EV_END_SECTION << 4
+CODE_SUBSECTION = EV_SUBSECTION << 4
+CODE_IGNORE = EV_IGNORE << 4
+CODE_TRUNCATE = EV_TRUNCATE << 4 | NO_PATTERN << PATTERN_SHIFT
+CODE_REJECT = EV_REJECT << 4 | NO_PATTERN << PATTERN_SHIFT
+
+KIND_NAMES = {
+    EV_EVAL: 'eval', EV_SECTION: 'section', EV_REPORT: 'report', EV_END_SECTION: 'end_section',
+    EV_SUBSECTION: 'subsection', EV_IGNORE: 'ignore', EV_TRUNCATE: 'truncate', EV_REJECT: 'reject',
+}
+EVAL_NAMES = {EVAL_OFF: 'off', EVAL_WINDOW: 'window', EVAL_MISS: 'miss', EVAL_MATCH: 'match'}
+
+_HEADER = struct.Struct('<8sHI')
+
+
+class TraceEvent(NamedTuple):
+    line_number: int
+    pattern: Optional[str]
+    kind: str
+    value: Optional[str]  # For 'eval' events: 'off', 'window', 'miss' or 'match'.
+
+
+def _header_bytes(patterns: List[str], meta: Dict[str, Any]) -> bytes:
+    info = json.dumps(dict(meta, patterns=patterns)).encode()
+    return _HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(info)) + info
+
+
+def _to_little_endian(events: array) -> array:
+    if sys.byteorder != 'little':
+        events = array('Q', events)
+        events.byteswap()
+    return events
+
+
+class _FileSink:
+    def __init__(self, path: str, patterns: List[str], meta: Dict[str, Any]):
+        self.path = path
+        self._f = open(path, 'wb')
+        self._f.write(_header_bytes(patterns, meta))
+        self.event_count = 0
+
+    def write(self, events: array) -> None:
+        _to_little_endian(events).tofile(self._f)
+        self.event_count += len(events)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _RingSink:
+    def __init__(self, capacity: int):
+        self.ring = array('Q', bytes(8 * capacity))
+        self.capacity = capacity
+        self.pos = 0
+        self.event_count = 0
+
+    def write(self, events: array) -> None:
+        n = len(events)
+        self.event_count += n
+        if n >= self.capacity:
+            self.ring[:] = events[n - self.capacity:]
+            self.pos = 0
+            return
+        end = self.pos + n
+        if end <= self.capacity:
+            self.ring[self.pos:end] = events
+        else:
+            split = self.capacity - self.pos
+            self.ring[self.pos:] = events[:split]
+            self.ring[:n - split] = events[split:]
+        self.pos = end % self.capacity
+
+    def snapshot(self) -> array:
+        if self.event_count < self.capacity:
+            return self.ring[:self.pos]
+        return self.ring[self.pos:] + self.ring[:self.pos]
+
+    def close(self) -> None:
+        pass
+
+
+class Tracer:
+    '''
+    Records match() events, see the module docstring. Created by PyReParse.start_trace().
+
+    :param patterns: The pattern names, in definition order.
+    :param path: Trace file to write, or None for a ring buffer.
+    :param capacity: Ring buffer size (events).
+    :param triggers: Also record evaluations whose trigger was False (or window closed).
+    :param meta: Extra JSON-serializable header entries (e.g. the input file name).
+    '''
+
+    def __init__(self, patterns: List[str], path: Optional[str] = None, capacity: int = DEFAULT_RING_EVENTS,
+                 triggers: bool = True, meta: Optional[Dict[str, Any]] = None, _shared=None):
+        if capacity < 1:
+            raise ValueError('capacity must be >= 1')
+        if len(patterns) >= NO_PATTERN:
+            raise ValueError(f'Tracing supports at most {NO_PATTERN - 1} patterns.')
+        self.patterns = list(patterns)
+        self.pattern_ids = {pat: i for i, pat in enumerate(self.patterns)}
+        self.triggers = triggers
+        self.events = array('Q')
+        if _shared is None:
+            meta = dict(meta or {})
+            sink = _FileSink(path, self.patterns, meta) if path is not None else _RingSink(capacity)
+            _shared = (sink, threading.Lock(), meta)
+        self._shared = _shared
+
+    @property
+    def path(self) -> Optional[str]:
+        return getattr(self._shared[0], 'path', None)
+
+    @property
+    def event_count(self) -> int:
+        '''
+        Events flushed to the sink so far (by this tracer and its forks).
+        '''
+        return self._shared[0].event_count
+
+    def fork(self) -> 'Tracer':
+        '''
+        A tracer with its own event buffer, flushing into this tracer's sink (for clones).
+        '''
+        return Tracer(self.patterns, triggers=self.triggers, _shared=self._shared)
+
+    def flush(self) -> None:
+        if self.events:
+            sink, lock, _ = self._shared
+            with lock:
+                sink.write(self.events)
+            self.events = array('Q')
+
+    def close(self) -> None:
+        self.flush()
+        sink, lock, _ = self._shared
+        with lock:
+            sink.close()
+
+    def save(self, path: str) -> None:
+        '''
+        Write the ring buffer's events, oldest first, as a trace file.
+        '''
+        self.flush()
+        sink, lock, meta = self._shared
+        if not isinstance(sink, _RingSink):
+            raise ValueError('save() is for ring buffer traces, this trace is written to a file.')
+        with lock:
+            events = sink.snapshot()
+        with open(path, 'wb') as f:
+            f.write(_header_bytes(self.patterns, dict(meta, dropped=max(0, sink.event_count - sink.capacity))))
+            _to_little_endian(events).tofile(f)
+
+    def get_events(self) -> Iterator[TraceEvent]:
+        '''
+        Decode the events of a ring buffer trace, oldest first.
+        '''
+        self.flush()
+        sink, lock, _ = self._shared
+        if not isinstance(sink, _RingSink):
+            return read_trace(sink.path)[1]
+        with lock:
+            events = sink.snapshot()
+        return decode_events(events, self.patterns)
+
+
+def decode_events(words, patterns: List[str]) -> Iterator[TraceEvent]:
+    for word in words:
+        pat_id = (word >> PATTERN_SHIFT) & 0xFFFF
+        kind = (word >> 4) & 0xF
+        yield TraceEvent(word >> LINE_SHIFT, patterns[pat_id] if pat_id != NO_PATTERN else None,
+                         KIND_NAMES.get(kind, str(kind)), EVAL_NAMES.get(word & 0xF) if kind == EV_EVAL else None)
+
+
+def read_trace(path: str, block_events: int = TRACE_BLOCK) -> Tuple[Dict[str, Any], Iterator[TraceEvent]]:
+    '''
+    Open a trace file: returns (header, events), the header holding 'patterns' and the metadata, events a lazy
+    iterator of TraceEvent.
+    '''
+    f = open(path, 'rb')
+    try:
+        magic, version, info_len = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != TRACE_MAGIC:
+            raise ValueError(f'{path} is not a PyReParse trace file.')
+        if version != TRACE_VERSION:
+            raise ValueError(f'{path}: unsupported trace version {version}.')
+        header = json.loads(f.read(info_len))
+    except BaseException:
+        f.close()
+        raise
+
+    def events():
+        with f:
+            while True:
+                data = f.read(8 * block_events)
+                if not data:
+                    return
+                words = array('Q')
+                words.frombytes(data[:len(data) // 8 * 8])
+                if sys.byteorder != 'little':
+                    words.byteswap()
+                yield from decode_events(words, header['patterns'])
+
+    return header, events()
+
+
+def filter_events(events, lines: Optional[Tuple[int, int]] = None, patterns: Optional[List[str]] = None,
+                  kinds: Optional[List[str]] = None, values: Optional[List[str]] = None) -> Iterator[TraceEvent]:
+    for event in events:
+        if lines is not None and not lines[0] <= event.line_number <= lines[1]:
+            continue
+        if patterns and event.pattern not in patterns:
+            continue
+        if kinds and event.kind not in kinds:
+            continue
+        if values and event.value not in values:
+            continue
+        yield event
+
+
+def format_event(event: TraceEvent) -> str:
+    detail = event.value if event.kind == 'eval' else ''
+    return f'{event.line_number:>10}  {event.kind:<11}  {event.pattern or "-":<30}  {detail}'.rstrip()
+
+
+def summarize(events) -> str:
+    '''
+    Per-pattern eval counts (off / window / miss / match) and event kind counts.
+    '''
+    evals = defaultdict(lambda: dict.fromkeys(EVAL_NAMES.values(), 0))
+    kinds = defaultdict(int)
+    first = last = None
+    for event in events:
+        if first is None:
+            first = event.line_number
+        last = event.line_number
+        kinds[event.kind] += 1
+        if event.kind == 'eval':
+            evals[event.pattern][event.value] += 1
+    out = [f'Lines {first}..{last}' if first is not None else 'No events',
+           f'{"pattern":<30} {"off":>10} {"window":>10} {"miss":>10} {"match":>10}']
+    for pat, counts in evals.items():
+        out.append(f'{pat:<30} ' + ' '.join(f'{counts[name]:>10}' for name in EVAL_NAMES.values()))
+    out.append('Events: ' + ', '.join(f'{kind} {count}' for kind, count in kinds.items()))
+    return '\n'.join(out)
+
+
+def _line_range(text: str) -> Tuple[int, int]:
+    if '-' not in text:
+        return int(text), int(text)
+    low, high = text.split('-', 1)
+    return int(low) if low else 0, int(high) if high else sys.maxsize
+
+
+def add_parser(subparsers) -> argparse.ArgumentParser:
+    parser = subparsers.add_parser('trace', help='Filter and print a binary trace (PyReParse.start_trace())',
+                                   description=__doc__.split('\n\n')[0])
+    parser.add_argument('trace_file', help='Trace file written by start_trace(path=...) or Tracer.save()')
+    parser.add_argument('--lines', type=_line_range, metavar='A-B', help='Line number range (A-, -B or N)')
+    parser.add_argument('--pattern', action='append', help='Only these patterns (repeatable)')
+    parser.add_argument('--kind', action='append', choices=sorted(KIND_NAMES.values()),
+                        help='Only these event kinds (repeatable)')
+    parser.add_argument('--eval', action='append', choices=list(EVAL_NAMES.values()), dest='evals',
+                        help="Only 'eval' events with these results (repeatable)")
+    parser.add_argument('--summary', action='store_true', help='Print per-pattern counts instead of events')
+    parser.set_defaults(func=main)
+    return parser
+
+
+def main(args) -> int:
+    header, events = read_trace(args.trace_file)
+    events = filter_events(events, args.lines, args.pattern, args.kind, args.evals)
+    if args.summary:
+        print(summarize(events))
+    else:
+        for event in events:
+            print(format_event(event))
+    if header.get('dropped'):
+        print(f'({header["dropped"]} earlier events were dropped by the ring buffer)', file=sys.stderr)
+    return 0